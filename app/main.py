@@ -4,24 +4,33 @@ from slowapi.errors import RateLimitExceeded
 from slowapi.util import get_remote_address
 import os
 from app.tools.payee_verification import validate_uk_cop, validate_eu_vop
-from app.tools.payment_intelligence import analyze_payment
-from app.tools.defi_health import check_defi_health
+from app.tools.payment_intelligence import analyze_payment, get_memo_stats, stream_payment_batch
+from app.tools.defi_health import DEFI_REFRESH_INTERVAL, check_defi_health, get_defi_status, watch_defi
 from app.tools.ein_validator import validate_ein
-from app.tools.token_price import get_token_price
-from app.tools.fraud_score import calculate_fraud_score
+from app.tools.token_price import get_price_service_status, get_token_price, get_token_prices
+from app.tools.fraud_score import (
+    FRAUD_RULES_RELOAD_INTERVAL, calculate_fraud_score, get_fraud_rules_status, parse_fraud_batch,
+    reload_fraud_rules, score_fraud_batch, watch_fraud_rules,
+)
 from app.tools.iso8583_parser import parse_iso8583
-from app.tools.routing_validator import lookup_routing
+from app.tools.iso8583_binary import list_dialects, stream_iso8583
 from app.tools.pep_checker import check_pep, get_pep_status
 # Sanctions threshold: 60
 from app.tools.sanctions_checker import check_sanctions, get_sanctions_status
+from app.tools.screening_pool import ScreeningBusy
+from app.tools.http_client import HTTP_CLIENT
+from app.tools.circuit_breaker import DeadlineMiddleware
 from app.tools.wallet_validator import validate_wallet
-from app.tools.currency_converter import convert_currency
-from app.tools.swift_lookup import lookup_swift
-from app.tools.decline_codes import interpret_decline_code
+from app.tools.currency_converter import (
+    convert_currency, convert_currency_batch, get_rate_cache_status, parse_conversion_batch,
+)
 from app.tools.iban_validator import validate_iban
 
-from app.tools.bin_lookup import get_bin_details
-from app.tools.mcc_lookup import get_mcc_details
+from app.tools.bin_lookup import (
+    BIN_RELOAD_INTERVAL, get_bin_details, get_bin_status, lookup_bins, parse_bin_batch, reload_bins, watch_bins,
+)
+from app.tools.enrichment import enrich_records, parse_enrich_batch
+from app.tools.precompiled import DECLINE_RESPONSES, MCC_RESPONSES, ROUTING_RESPONSES, SWIFT_RESPONSES
 """
 Instant Refund API entrypoint (DigitalOcean App Platform).
 
@@ -29,16 +38,20 @@ This module is the authoritative router wiring point.
 """
 
 import os
+import asyncio
+import json
 import socket
 import time
 import base64
 import hmac
 import hashlib
 import httpx
+from fastapi import Depends, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from app.api import app
 from app.routes import compliance as compliance_router
-from app.routes.refunds import router as refunds_router
+from app.routes.refunds import require_api_key, router as refunds_router
 
 
 # ---- Core router wiring (DETERMINISTIC) ----
@@ -46,16 +59,99 @@ app.include_router(compliance_router.router)
 app.include_router(refunds_router)
 
 
+class RequestStreamingResponse(StreamingResponse):
+    """StreamingResponse whose body is produced while the request body is still
+    being read. Starlette's disconnect listener would swallow the request's
+    body messages, so here only the body reader calls receive(); a client that
+    drops mid-upload ends the stream with ClientDisconnect."""
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+# Outbound tool calls made while serving a request stop at its deadline.
+app.add_middleware(DeadlineMiddleware)
+
+
+@app.on_event("startup")
+async def start_bin_watcher():
+    if BIN_RELOAD_INTERVAL > 0:
+        app.state.bin_watcher = asyncio.create_task(watch_bins())
+
+@app.on_event("startup")
+async def start_fraud_rules_watcher():
+    if FRAUD_RULES_RELOAD_INTERVAL > 0:
+        app.state.fraud_rules_watcher = asyncio.create_task(watch_fraud_rules())
+
+@app.on_event("startup")
+async def open_outbound_client():
+    await HTTP_CLIENT.start()
+
+@app.on_event("startup")
+async def start_defi_refresher():
+    if DEFI_REFRESH_INTERVAL > 0:
+        app.state.defi_refresher = asyncio.create_task(watch_defi())
+
+@app.on_event("shutdown")
+async def close_outbound_client():
+    await HTTP_CLIENT.close()
+
+
 # ---- Debug endpoints ----
 
+@app.get("/v1/tools/outbound/status")
+async def outbound_status_tool():
+    return {"status": "success", **HTTP_CLIENT.stats()}
+
+# Must be registered before /v1/tools/bin/{bin_code}, which would otherwise match it.
+@app.get("/v1/tools/bin/status")
+async def bin_status_tool():
+    return await asyncio.to_thread(get_bin_status)
+
+@app.post("/v1/tools/bin/reload")
+async def bin_reload_tool(api_key: str = Depends(require_api_key)):
+    swapped = await asyncio.to_thread(reload_bins, True)
+    return {**get_bin_status(), "reloaded": swapped}
+
 @app.get("/v1/tools/bin/{bin_code}")
 async def bin_tool(bin_code: str):
     return get_bin_details(bin_code)
 
+# Body: JSON array or newline-delimited BINs. Response: NDJSON, one line per distinct BIN.
+@app.post("/v1/tools/bin/batch")
+async def bin_batch_tool(request: Request):
+    try:
+        bins = parse_bin_batch(await request.body())
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"status": "error", "error": str(e)})
+
+    def ndjson():
+        lines = []
+        for result in lookup_bins(bins):
+            lines.append(json.dumps(result))
+            if len(lines) == 1000:
+                yield "\n".join(lines) + "\n"
+                lines = []
+        if lines:
+            yield "\n".join(lines) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+# Body: JSON array of records (or {"records": [...]}) carrying any of bin, mcc,
+# decline_code, swift, routing_number, iban. Returns every lookup per record.
+@app.post("/v1/tools/enrich")
+async def enrich_tool(request: Request):
+    try:
+        records = parse_enrich_batch(await request.body())
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"status": "error", "error": str(e)})
+    return JSONResponse(await asyncio.to_thread(enrich_records, records))
+
 # --- Day 2: MCC Lookup Tool ---
 @app.get("/v1/tools/mcc/{mcc_code}")
-async def mcc_tool(mcc_code: str):
-    return get_mcc_details(mcc_code)
+async def mcc_tool(mcc_code: str, request: Request):
+    return MCC_RESPONSES.respond(request, mcc_code)
 
 # --- Tool 3: IBAN Validator ---
 @app.get("/v1/tools/iban/{iban_code}")
@@ -65,17 +161,30 @@ async def iban_tool(iban_code: str):
 
 # --- Tool 4: Decline Code Interpreter ---
 @app.get("/v1/tools/decline/{code}")
-async def decline_tool(code: str):
-    return interpret_decline_code(code)
+async def decline_tool(code: str, request: Request):
+    return DECLINE_RESPONSES.respond(request, code)
 
 
 # --- Tool 5: SWIFT/BIC Lookup ---
 @app.get("/v1/tools/swift/{swift_code}")
-async def swift_tool(swift_code: str):
-    return lookup_swift(swift_code)
+async def swift_tool(swift_code: str, request: Request):
+    return SWIFT_RESPONSES.respond(request, swift_code)
 
 
 # --- Tool 6: Currency Converter ---
+@app.get("/v1/tools/currency/status")
+async def currency_status_tool():
+    return get_rate_cache_status()
+
+# Body: JSON array of {"from", "to", "amount"} rows (or [from, to, amount]).
+@app.post("/v1/tools/currency/batch")
+async def currency_batch_tool(request: Request):
+    try:
+        rows = parse_conversion_batch(await request.body())
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"status": "error", "error": str(e)})
+    return JSONResponse(await convert_currency_batch(rows))
+
 @app.get("/v1/tools/currency/{from_currency}/{to_currency}/{amount}")
 async def currency_tool(from_currency: str, to_currency: str, amount: float):
     return await convert_currency(from_currency, to_currency, amount)
@@ -87,14 +196,20 @@ async def wallet_tool(address: str, chain: str = ""):
     return validate_wallet(address, chain)
 
 
+# --- Screening worker pool saturated ---
+@app.exception_handler(ScreeningBusy)
+async def screening_busy_handler(request: Request, exc: ScreeningBusy):
+    return JSONResponse(status_code=429, content={"status": "error", "error": str(exc)}, headers={"Retry-After": "1"})
+
+
 # --- Tool 8: Sanctions List Checker ---
 @app.get("/v1/tools/sanctions/status")
 async def sanctions_status():
     return await get_sanctions_status()
 
 @app.get("/v1/tools/sanctions/screen/{name}")
-async def sanctions_screen(name: str, threshold: int = 60):
-    return await check_sanctions(name, threshold)
+async def sanctions_screen(name: str, threshold: int = 60, limit: int = 5):
+    return await check_sanctions(name, threshold, limit)
 
 
 
@@ -104,16 +219,29 @@ async def pep_status():
     return await get_pep_status()
 
 @app.get("/v1/tools/pep/screen/{name}")
-async def pep_screen(name: str, threshold: int = 60):
-    return await check_pep(name, threshold)
+async def pep_screen(name: str, threshold: int = 60, limit: int = 5):
+    return await check_pep(name, threshold, limit)
 
 # --- Tool 10: Routing Number Validator ---
 @app.get("/v1/tools/routing/{routing_number}")
-async def routing_tool(routing_number: str):
-    return lookup_routing(routing_number)
+async def routing_tool(routing_number: str, request: Request):
+    return ROUTING_RESPONSES.respond(request, routing_number)
 
 
 # --- Tool 11: ISO 8583 Message Parser ---
+# Must be registered before /v1/tools/iso8583/{message}, which would otherwise match it.
+@app.get("/v1/tools/iso8583/dialects")
+async def iso8583_dialects_tool():
+    return list_dialects()
+
+# Body: a file of length-prefixed messages (curl --data-binary @file). Response: NDJSON.
+@app.post("/v1/tools/iso8583/stream")
+async def iso8583_stream_tool(request: Request, header: int = 2, header_encoding: str = "binary", dialect: str = "bcd"):
+    return RequestStreamingResponse(
+        stream_iso8583(request.stream(), header, header_encoding, dialect),
+        media_type="application/x-ndjson",
+    )
+
 @app.get("/v1/tools/iso8583/{message}")
 async def iso8583_tool(message: str):
     return parse_iso8583(message)
@@ -130,7 +258,35 @@ async def fraud_score_tool(
 ):
     return calculate_fraud_score(card_type, network, country_code, is_commercial, is_anonymous)
 
+# Body: JSON array of profiles or an object of parallel columns. Response: scores and risk levels as columns.
+@app.post("/v1/tools/fraud-score/batch")
+async def fraud_score_batch_tool(request: Request):
+    body = await request.body()
+    try:
+        columns = await asyncio.to_thread(parse_fraud_batch, body)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"status": "error", "error": str(e)})
+    return JSONResponse(await asyncio.to_thread(score_fraud_batch, columns))
+
+@app.get("/v1/tools/fraud-score/rules")
+async def fraud_rules_status_tool():
+    return await asyncio.to_thread(get_fraud_rules_status)
+
+@app.post("/v1/tools/fraud-score/rules/reload")
+async def fraud_rules_reload_tool(api_key: str = Depends(require_api_key)):
+    swapped = await asyncio.to_thread(reload_fraud_rules, True)
+    return {**get_fraud_rules_status(), "reloaded": swapped}
+
 # --- Tool 13: Token Price Feed ---
+# ?tokens=btc,eth,sol - one upstream call for the whole list on a cache miss.
+@app.get("/v1/tools/token-prices")
+async def token_prices_tool(tokens: str, currency: str = "usd"):
+    return await get_token_prices(tokens.split(","), currency)
+
+@app.get("/v1/tools/token-prices/status")
+async def token_prices_status_tool():
+    return get_price_service_status()
+
 @app.get("/v1/tools/token-price/{token}")
 async def token_price_tool(token: str, currency: str = "usd"):
     return await get_token_price(token, currency)
@@ -141,6 +297,11 @@ async def ein_validator_tool(ein: str):
     return validate_ein(ein)
 
 # --- Tool 15: DeFi Health Checker ---
+# Must be registered before /v1/tools/defi-health/{protocol}, which would otherwise match it.
+@app.get("/v1/tools/defi-health/status")
+async def defi_status_tool():
+    return get_defi_status()
+
 @app.get("/v1/tools/defi-health/{protocol}")
 async def defi_health_tool(protocol: str):
     return await check_defi_health(protocol)
@@ -158,6 +319,17 @@ async def payment_intelligence_tool(
 ):
     return await analyze_payment(card_bin, decline_code, merchant_mcc, transaction_amount, country_code, card_type, network)
 
+# Body: CSV with a header row or NDJSON, columns named like the GET parameters
+# above plus an optional "id". Response: NDJSON, one line per row, in order.
+@app.post("/v1/tools/payment-intelligence/batch")
+async def payment_intelligence_batch_tool(request: Request):
+    return RequestStreamingResponse(stream_payment_batch(request.stream()), media_type="application/x-ndjson")
+
+# Hit rates of the lookup and section memo caches.
+@app.get("/v1/tools/payment-intelligence/status")
+async def payment_intelligence_status_tool():
+    return get_memo_stats()
+
 
 # --- Tool 17: Payee Verification (COP + EU VOP) ---
 @app.get("/v1/tools/cop")
@@ -2,49 +2,289 @@ import logging
 
 logger = logging.getLogger(__name__)
 import csv
+import io
+import json
 import os
-from typing import Dict, Any
-
-BIN_DATA = {}
-
-def load_bins():
-    global BIN_DATA
-    if BIN_DATA:
-        return
-    csv_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'binlist.csv')
-    try:
-        with open(csv_path, newline='', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                bin_key = str(row.get('bin', '')).strip().zfill(6)[:6]
-                if bin_key:
-                    BIN_DATA[bin_key] = {
-                        'bank': row.get('bank', 'Unknown'),
-                        'brand': row.get('brand', 'Unknown'),
-                        'type': row.get('type', 'Unknown'),
-                        'country': row.get('country_code', 'Unknown'),
-                        'country_name': row.get('country_name', 'Unknown'),
-                        'prepaid': row.get('prepaid', 'Unknown'),
-                    }
-    except Exception as e:
-        pass
+import time
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timezone
+from typing import Dict, Any, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 
-def get_bin_details(bin_code: str) -> Dict[str, Any]:
-    load_bins()
-    digits = ''.join([c for c in (bin_code or '') if c.isdigit()])
-    clean_bin = digits[:6]
-    if len(clean_bin) < 6:
+from app.tools.versioned_file import VersionedFile
+
+# BINs are stored as ranges over the 8-digit key space: a 6-digit BIN 411111
+# covers 41111100-41111199, an 8-digit BIN covers itself, and bin_start/bin_end
+# rows cover whatever they say. Lookups return the narrowest range containing
+# the card's digits (longest-prefix match).
+BIN_KEY_DIGITS = 8
+MIN_BIN_DIGITS = 6
+
+# Per-range issuer attributes, stored column-wise as codes into string pools.
+BIN_FIELDS = ('bank', 'brand', 'type', 'country', 'country_name', 'prepaid')
+
+BIN_BATCH_MAX = int(os.getenv('BIN_BATCH_MAX', '50000'))
+
+
+def _prefix_range(digits: str) -> Tuple[int, int]:
+    digits = digits[:BIN_KEY_DIGITS]
+    span = 10 ** (BIN_KEY_DIGITS - len(digits))
+    start = int(digits) * span
+    return start, start + span - 1
+
+
+class _StringPool:
+    def __init__(self) -> None:
+        self.values: List[str] = []
+        self._codes: Dict[str, int] = {}
+
+    def code(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class BinIndex:
+    """Sorted, nested BIN ranges flattened into disjoint segments.
+
+    Each segment maps to the narrowest range covering it and each range knows
+    its enclosing range, so a lookup is one binary search plus a short walk
+    up the parent chain when the query is coarser than the segment's range.
+    Everything is held in flat arrays: per range, its bounds, parent and one
+    small integer per BIN_FIELDS column pointing into that column's string
+    table, so a few hundred thousand BINs cost tens of bytes each.
+    """
+
+    def __init__(self, rows: List[Tuple[int, int, Tuple[str, ...]]]) -> None:
+        # Later rows win over earlier rows for the same range, as the old dict did.
+        pools = [_StringPool() for _ in BIN_FIELDS]
+        by_range: Dict[Tuple[int, int], Tuple[int, ...]] = {}
+        for start, end, fields in rows:
+            by_range[(start, end)] = tuple(pool.code(value) for pool, value in zip(pools, fields))
+        ordered = sorted(by_range, key=lambda r: (r[0], -r[1]))
+
+        self.starts = array('I')
+        self.ends = array('I')
+        self.parents = array('i')
+        self.columns = [array('I') for _ in BIN_FIELDS]
+        self.strings = [tuple(pool.values) for pool in pools]
+        self.seg_starts = array('I')
+        self.seg_entries = array('i')
+        self.conflicts = 0
+
+        stack: List[int] = []
+        for start, end in ordered:
+            while stack and self.ends[stack[-1]] < start:
+                closed = stack.pop()
+                self._emit(self.ends[closed] + 1, stack[-1] if stack else -1)
+            if stack and self.ends[stack[-1]] < end:
+                # Partially overlapping ranges cannot be nested; keep the first.
+                self.conflicts += 1
+                continue
+            entry = len(self.starts)
+            self.starts.append(start)
+            self.ends.append(end)
+            self.parents.append(stack[-1] if stack else -1)
+            for column, code in zip(self.columns, by_range[(start, end)]):
+                column.append(code)
+            stack.append(entry)
+            self._emit(start, entry)
+        while stack:
+            closed = stack.pop()
+            self._emit(self.ends[closed] + 1, stack[-1] if stack else -1)
+        if self.conflicts:
+            logger.warning('BIN table: skipped %d partially overlapping ranges', self.conflicts)
+
+    def _emit(self, position: int, entry: int) -> None:
+        if self.seg_starts and self.seg_starts[-1] == position:
+            self.seg_entries[-1] = entry
+        elif not self.seg_entries or self.seg_entries[-1] != entry:
+            self.seg_starts.append(position)
+            self.seg_entries.append(entry)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def record(self, entry: int) -> Dict[str, str]:
+        return {
+            field: strings[column[entry]]
+            for field, column, strings in zip(BIN_FIELDS, self.columns, self.strings)
+        }
+
+    def find(self, digits: str) -> int:
+        start, end = _prefix_range(digits)
+        k = bisect_right(self.seg_starts, start) - 1
+        entry = self.seg_entries[k] if k >= 0 else -1
+        while entry != -1 and self.ends[entry] < end:
+            entry = self.parents[entry]
+        return entry
+
+
+def _row_range(row: Dict[str, str]) -> Optional[Tuple[int, int]]:
+    bin_start = ''.join(c for c in (row.get('bin_start') or '') if c.isdigit())[:BIN_KEY_DIGITS]
+    bin_end = ''.join(c for c in (row.get('bin_end') or '') if c.isdigit())[:BIN_KEY_DIGITS]
+    if bin_start and bin_end:
+        start = int(bin_start.ljust(BIN_KEY_DIGITS, '0'))
+        end = int(bin_end.ljust(BIN_KEY_DIGITS, '9'))
+        return (start, end) if start <= end else None
+    bin_key = str(row.get('bin', '')).strip()
+    if not bin_key.isdigit():
+        return None
+    return _prefix_range(bin_key.zfill(MIN_BIN_DIGITS))
+
+
+def _row_fields(row: Dict[str, str]) -> Tuple[str, ...]:
+    return (
+        row.get('bank', 'Unknown'),
+        row.get('brand', 'Unknown'),
+        row.get('type', 'Unknown'),
+        row.get('country_code', 'Unknown'),
+        row.get('country_name', 'Unknown'),
+        row.get('prepaid', 'Unknown'),
+    )
+
+
+class BinSnapshot(NamedTuple):
+    """One loaded BIN table. Never mutated; a reload builds and swaps a new one."""
+    index: BinIndex
+    version: str
+    rows: int
+    loaded_at: str
+    load_seconds: float
+    source_mtime_ns: int
+    source_size: int
+
+
+BIN_CSV_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'binlist.csv')
+BIN_RELOAD_INTERVAL = float(os.getenv('BIN_RELOAD_INTERVAL', '60'))
+
+
+def _build_snapshot(raw: bytes, digest: str, stat: os.stat_result) -> BinSnapshot:
+    started = time.perf_counter()
+    rows = []
+    for row in csv.DictReader(io.StringIO(raw.decode('utf-8'), newline='')):
+        bin_range = _row_range(row)
+        if bin_range:
+            rows.append((bin_range[0], bin_range[1], _row_fields(row)))
+    return BinSnapshot(
+        index=BinIndex(rows),
+        version=digest,
+        rows=len(rows),
+        loaded_at=datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        load_seconds=round(time.perf_counter() - started, 3),
+        source_mtime_ns=stat.st_mtime_ns,
+        source_size=stat.st_size,
+    )
+
+
+def _reject_snapshot(snapshot: BinSnapshot, current: BinSnapshot) -> Optional[str]:
+    if not snapshot.rows and current.rows:
+        # Most likely caught mid-write; the next change will be picked up.
+        return 'binlist.csv has no usable rows'
+    return None
+
+
+BIN_TABLE = VersionedFile('BIN table', BIN_CSV_PATH, _build_snapshot, BinSnapshot(BinIndex([]), '', 0, '', 0.0, 0, 0),
+                          _reject_snapshot)
+
+
+def reload_bins(force: bool = False) -> bool:
+    """Load binlist.csv if it changed (or always, with force). Returns True on a swap.
+
+    On any failure the current snapshot stays in place and the error is logged
+    and reported by get_bin_status().
+    """
+    return BIN_TABLE.reload(force)
+
+
+def load_bins() -> BinSnapshot:
+    return BIN_TABLE.get()
+
+
+def bins_loaded() -> bool:
+    """Whether load_bins() will return without reading binlist.csv."""
+    return BIN_TABLE.loaded
+
+
+async def watch_bins(interval: float = BIN_RELOAD_INTERVAL) -> None:
+    """Poll binlist.csv and reload it off the event loop whenever it changes."""
+    await BIN_TABLE.watch(interval)
+
+
+def get_bin_status() -> Dict[str, Any]:
+    snapshot = load_bins()
+    return {
+        'status': 'success' if snapshot.version else 'error',
+        'source': 'binlist.csv',
+        'version': snapshot.version,
+        'rows_loaded': snapshot.rows,
+        'ranges': len(snapshot.index),
+        'segments': len(snapshot.index.seg_starts),
+        'loaded_at': snapshot.loaded_at,
+        'load_seconds': snapshot.load_seconds,
+        'last_error': BIN_TABLE.last_error or None,
+        'reload_interval_seconds': BIN_RELOAD_INTERVAL,
+    }
+
+def _clean_bin(bin_code: str) -> str:
+    return ''.join([c for c in (bin_code or '') if c.isdigit()])[:BIN_KEY_DIGITS]
+
+def _bin_result(index: BinIndex, clean_bin: str) -> Dict[str, Any]:
+    if len(clean_bin) < MIN_BIN_DIGITS:
         return {'status': 'error', 'error': 'BIN must contain at least 6 digits', 'bin': clean_bin}
-    if clean_bin in BIN_DATA:
-        data = BIN_DATA[clean_bin]
+    # 'bin' stays the 6-digit prefix it always was; the range that actually
+    # matched (possibly an 8-digit BIN) is reported separately.
+    entry = index.find(clean_bin)
+    if entry != -1:
+        data = index.record(entry)
         return {
             'status': 'success',
-            'bin': clean_bin,
+            'bin': clean_bin[:MIN_BIN_DIGITS],
             'bank': data['bank'],
             'brand': data['brand'],
             'type': data['type'],
             'country': data['country'],
             'country_name': data['country_name'],
             'prepaid': data['prepaid'],
+            'bin_range': {'start': f'{index.starts[entry]:0{BIN_KEY_DIGITS}d}',
+                          'end': f'{index.ends[entry]:0{BIN_KEY_DIGITS}d}'},
         }
-    return {'status': 'not_found', 'bin': clean_bin, 'message': 'BIN not found in database'}
\ No newline at end of file
+    return {'status': 'not_found', 'bin': clean_bin[:MIN_BIN_DIGITS], 'message': 'BIN not found in database'}
+
+def get_bin_details(bin_code: str) -> Dict[str, Any]:
+    return _bin_result(load_bins().index, _clean_bin(bin_code))
+
+def parse_bin_batch(body: bytes) -> List[str]:
+    """Accept a JSON array or one BIN per line. Raises ValueError on bad input."""
+    text = body.decode('utf-8', errors='replace').strip()
+    if text.startswith('['):
+        items = json.loads(text)
+        if not isinstance(items, list):
+            raise ValueError('Expected a JSON array of BINs')
+        bins = [str(item) for item in items]
+    else:
+        bins = [line.strip() for line in text.splitlines() if line.strip()]
+    if not bins:
+        raise ValueError('No BINs supplied')
+    if len(bins) > BIN_BATCH_MAX:
+        raise ValueError(f'At most {BIN_BATCH_MAX} BINs per request')
+    return bins
+
+def lookup_bins(bin_codes: Iterable[str], unique: bool = True) -> Iterator[Dict[str, Any]]:
+    """Resolve many BINs against one snapshot, once per distinct normalised BIN.
+
+    By default repeats are dropped; with unique=False every input gets its
+    result, in input order, repeats sharing the same dict.
+    """
+    index = load_bins().index
+    seen: Dict[str, Dict[str, Any]] = {}
+    for bin_code in bin_codes:
+        clean_bin = _clean_bin(bin_code)
+        result = seen.get(clean_bin)
+        if result is None:
+            result = seen[clean_bin] = _bin_result(index, clean_bin)
+        elif unique:
+            continue
+        yield result
@@ -0,0 +1,187 @@
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Deque, Dict, Iterator, Optional, Tuple, TypeVar
+import asyncio
+import os
+import time
+
+# Upstream protection for the outbound tools (exchange rates, CoinGecko,
+# DeFiLlama, OpenSanctions).
+#
+# Each upstream host has a circuit breaker. Over its last BREAKER_WINDOW calls
+# (once at least BREAKER_MIN_CALLS were made), if the share of failures reaches
+# BREAKER_FAILURE_RATE or the share of calls slower than BREAKER_SLOW_CALL
+# seconds reaches BREAKER_SLOW_RATE, the breaker opens and calls to that host
+# fail at once with UpstreamUnavailable. After BREAKER_OPEN_SECONDS it lets
+# BREAKER_PROBES trial calls through (half-open): if they all succeed it closes,
+# if any fails it opens again.
+#
+# Each API request also gets a deadline, REQUEST_DEADLINE seconds or less if
+# the caller sends X-Request-Timeout. Outbound calls made on its behalf get at
+# most the time left, waiting for a per-host slot included, so a slow upstream
+# costs a request its budget rather than the full upstream timeout.
+#
+#   BREAKER_WINDOW         calls considered
+#   BREAKER_MIN_CALLS      calls needed before the breaker may open
+#   BREAKER_FAILURE_RATE   failure share that opens it
+#   BREAKER_SLOW_CALL      seconds after which a call counts as slow
+#   BREAKER_SLOW_RATE      slow-call share that opens it
+#   BREAKER_OPEN_SECONDS   time spent open before probing
+#   BREAKER_PROBES         trial calls allowed while half-open
+#   REQUEST_DEADLINE       per-request budget for outbound calls, seconds
+
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_SLOW_CALL = float(os.getenv("BREAKER_SLOW_CALL", "2"))
+BREAKER_SLOW_RATE = float(os.getenv("BREAKER_SLOW_RATE", "0.8"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+BREAKER_PROBES = int(os.getenv("BREAKER_PROBES", "2"))
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "5"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+T = TypeVar("T")
+
+
+class UpstreamUnavailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.state = CLOSED
+        # (ok, slow) per call, newest last.
+        self._calls: Deque[Tuple[bool, bool]] = deque(maxlen=BREAKER_WINDOW)
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        self.rejected = 0
+        self.trips = 0
+
+    def before_call(self) -> None:
+        """Raise UpstreamUnavailable unless a call may go out now."""
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < BREAKER_OPEN_SECONDS:
+                self.rejected += 1
+                raise UpstreamUnavailable(f"{self.name} is unavailable (circuit open)")
+            self._half_open()
+        if self.state == HALF_OPEN:
+            if self._probes >= BREAKER_PROBES and time.monotonic() - self._opened_at >= BREAKER_OPEN_SECONDS:
+                # Probes that never reported back (cancelled callers) don't
+                # keep the breaker half-open forever.
+                self._half_open()
+            if self._probes >= BREAKER_PROBES:
+                self.rejected += 1
+                raise UpstreamUnavailable(f"{self.name} is unavailable (circuit half-open)")
+            self._probes += 1
+
+    def record(self, ok: bool, elapsed: Optional[float] = None) -> None:
+        """elapsed=None leaves the call out of the slow-call rate (bulk downloads)."""
+        if self.state == HALF_OPEN:
+            if not ok:
+                self._open()
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= BREAKER_PROBES:
+                self.state = CLOSED
+                self._calls.clear()
+            return
+        if self.state == OPEN:
+            return
+        self._calls.append((ok, elapsed is not None and elapsed > BREAKER_SLOW_CALL))
+        calls = len(self._calls)
+        if calls < BREAKER_MIN_CALLS:
+            return
+        failures = sum(1 for ok, _ in self._calls if not ok)
+        slow = sum(1 for _, slow in self._calls if slow)
+        if failures / calls >= BREAKER_FAILURE_RATE or slow / calls >= BREAKER_SLOW_RATE:
+            self._open()
+
+    def _half_open(self) -> None:
+        self.state = HALF_OPEN
+        self._opened_at = time.monotonic()
+        self._probes = self._probe_successes = 0
+
+    def _open(self) -> None:
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._calls.clear()
+        self.trips += 1
+
+    def stats(self) -> Dict[str, Any]:
+        calls = len(self._calls)
+        return {
+            "state": self.state,
+            "window_calls": calls,
+            "failure_rate": round(sum(1 for ok, _ in self._calls if not ok) / calls, 4) if calls else 0.0,
+            "slow_rate": round(sum(1 for _, slow in self._calls if slow) / calls, 4) if calls else 0.0,
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
+
+
+_DEADLINE: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]) -> Iterator[None]:
+    """Run the block with a deadline `seconds` from now; None removes any
+    deadline, for shared work started on one request's behalf but used by many."""
+    token = _DEADLINE.set(time.monotonic() + seconds if seconds is not None else None)
+    try:
+        yield
+    finally:
+        _DEADLINE.reset(token)
+
+
+def time_left() -> Optional[float]:
+    deadline = _DEADLINE.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def bounded_timeout(timeout: Optional[float]) -> Optional[float]:
+    """The smaller of `timeout` and the time left; raises UpstreamUnavailable
+    once the request's deadline has passed."""
+    left = time_left()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise UpstreamUnavailable("Request deadline exceeded")
+    return left if timeout is None else min(timeout, left)
+
+
+async def wait_shared(shared: Awaitable[T]) -> T:
+    """Wait for a fetch shared with other requests for at most the time left.
+    The fetch itself is shielded and carries on for whoever else needs it."""
+    try:
+        return await asyncio.wait_for(asyncio.shield(shared), bounded_timeout(None))
+    except asyncio.TimeoutError:
+        raise UpstreamUnavailable("Request deadline exceeded") from None
+
+
+def request_budget(header: Optional[str]) -> float:
+    """Budget for a request: REQUEST_DEADLINE, or less if the X-Request-Timeout
+    header (seconds) asks for it."""
+    try:
+        asked = float(header) if header else REQUEST_DEADLINE
+    except ValueError:
+        asked = REQUEST_DEADLINE
+    return max(0.0, min(asked, REQUEST_DEADLINE))
+
+
+class DeadlineMiddleware:
+    """ASGI middleware giving every HTTP request its deadline."""
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        header = dict(scope.get("headers") or []).get(b"x-request-timeout")
+        with deadline_scope(request_budget(header.decode("latin-1") if header else None)):
+            await self.app(scope, receive, send)
@@ -1,6 +1,19 @@
-from typing import Dict, Any
+from decimal import ROUND_HALF_EVEN, Decimal, DecimalException, InvalidOperation
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+
 import httpx
 
+from app.tools.circuit_breaker import UpstreamUnavailable, deadline_scope, wait_shared
+from app.tools.http_client import HTTP_CLIENT
+
+logger = logging.getLogger(__name__)
+
 CURRENCY_PRECISION: Dict[str, int] = {
     "BHD": 3, "IQD": 3, "JOD": 3, "KWD": 3, "LYD": 3, "OMR": 3, "TND": 3,
     "CLF": 4, "UYW": 4,
@@ -25,6 +38,136 @@ CURRENCY_NAMES: Dict[str, str] = {
     "JOD": "Jordanian Dinar", "BHD": "Bahraini Dinar",
 }
 
+# Rates come from one base-currency table (every currency against
+# CURRENCY_RATE_BASE) and any pair is derived as a cross rate, so a single
+# upstream fetch serves all conversions. Tables are kept for CURRENCY_RATE_TTL
+# seconds; after that the old table is still served while one background
+# refresh runs. Concurrent misses share a single fetch. The last good table is
+# written to CURRENCY_RATE_SNAPSHOT (runtime state, outside the source tree;
+# defaults to the system temp directory) and read back on start, so
+# conversions keep working through upstream outages and restarts, flagged as
+# stale.
+CURRENCY_RATE_BASE = os.getenv("CURRENCY_RATE_BASE", "USD").upper()
+CURRENCY_RATE_TTL = float(os.getenv("CURRENCY_RATE_TTL", "3600"))
+CURRENCY_RATE_RETRY = float(os.getenv("CURRENCY_RATE_RETRY", "60"))
+CURRENCY_RATE_SNAPSHOT = os.getenv(
+    "CURRENCY_RATE_SNAPSHOT", os.path.join(tempfile.gettempdir(), "instant-refund", "fx_rates.json")
+)
+RATES_URL = "https://open.er-api.com/v6/latest/{base}"
+CURRENCY_BATCH_MAX = int(os.getenv("CURRENCY_BATCH_MAX", "50000"))
+
+
+class RateTable(NamedTuple):
+    base: str
+    rates: Dict[str, float]
+    fetched_at: float
+    source_updated: str
+
+
+_RATE_TABLES: Dict[str, RateTable] = {}
+_REFRESHING: Dict[str, "asyncio.Task[Optional[RateTable]]"] = {}
+_LAST_ATTEMPT: Dict[str, float] = {}
+_SNAPSHOT_LOADED = False
+
+
+def _load_snapshot() -> None:
+    global _SNAPSHOT_LOADED
+    _SNAPSHOT_LOADED = True
+    try:
+        with open(CURRENCY_RATE_SNAPSHOT, encoding="utf-8") as f:
+            tables = json.load(f)
+        for base, table in tables.items():
+            _RATE_TABLES.setdefault(base, RateTable(base, table["rates"], table["fetched_at"], table["source_updated"]))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        logger.warning("Exchange rates: ignoring unreadable snapshot %s: %s", CURRENCY_RATE_SNAPSHOT, e)
+
+
+def _save_snapshot(tables: Dict[str, RateTable]) -> None:
+    data = {base: table._asdict() for base, table in tables.items()}
+    tmp = CURRENCY_RATE_SNAPSHOT + ".tmp"
+    try:
+        os.makedirs(os.path.dirname(CURRENCY_RATE_SNAPSHOT), exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, CURRENCY_RATE_SNAPSHOT)
+    except OSError as e:
+        logger.warning("Exchange rates: cannot write snapshot %s: %s", CURRENCY_RATE_SNAPSHOT, e)
+
+
+async def _refresh(base: str) -> Optional[RateTable]:
+    _LAST_ATTEMPT[base] = time.monotonic()
+    try:
+        # Shared by every caller, so not bound by the deadline of whichever
+        # request happened to start it.
+        with deadline_scope(None):
+            resp = await HTTP_CLIENT.get(RATES_URL.format(base=base), timeout=10)
+        data = resp.json()
+        if data.get("result") != "success":
+            raise ValueError(f"upstream result {data.get('result')!r}")
+        table = RateTable(base, {k: float(v) for k, v in data["rates"].items()}, time.time(),
+                          data.get("time_last_update_utc", ""))
+    except (httpx.HTTPError, UpstreamUnavailable, ValueError, KeyError, TypeError, AttributeError) as e:
+        logger.warning("Exchange rates: refresh of %s failed: %s", base, e)
+        return _RATE_TABLES.get(base)
+    finally:
+        _REFRESHING.pop(base, None)
+    _RATE_TABLES[base] = table
+    await asyncio.to_thread(_save_snapshot, dict(_RATE_TABLES))
+    return table
+
+
+def _start_refresh(base: str) -> "asyncio.Task[Optional[RateTable]]":
+    task = _REFRESHING.get(base)
+    if task is None:
+        task = _REFRESHING[base] = asyncio.create_task(_refresh(base))
+    return task
+
+
+async def get_rate_table(base: str = CURRENCY_RATE_BASE) -> Optional[RateTable]:
+    if not _SNAPSHOT_LOADED:
+        _load_snapshot()
+    table = _RATE_TABLES.get(base)
+    if table is None:
+        # Shielded so a caller that disconnects or runs out of time doesn't
+        # cancel everyone's fetch.
+        try:
+            return await wait_shared(_start_refresh(base))
+        except UpstreamUnavailable:
+            return None
+    if time.time() - table.fetched_at > CURRENCY_RATE_TTL:
+        if time.monotonic() - _LAST_ATTEMPT.get(base, float("-inf")) >= CURRENCY_RATE_RETRY:
+            _start_refresh(base)
+    return table
+
+
+def cross_rate(table: RateTable, frm: str, to: str) -> Optional[float]:
+    if frm not in table.rates or to not in table.rates:
+        return None
+    if frm == table.base:
+        return table.rates[to]
+    return table.rates[to] / table.rates[frm]
+
+
+def get_rate_cache_status() -> Dict[str, Any]:
+    now = time.time()
+    return {
+        "status": "success",
+        "base": CURRENCY_RATE_BASE,
+        "ttl_seconds": CURRENCY_RATE_TTL,
+        "tables": {
+            base: {
+                "currencies": len(table.rates),
+                "age_seconds": round(now - table.fetched_at, 1),
+                "stale": now - table.fetched_at > CURRENCY_RATE_TTL,
+                "source_updated": table.source_updated,
+            }
+            for base, table in _RATE_TABLES.items()
+        },
+        "refreshing": sorted(_REFRESHING),
+    }
+
 async def convert_currency(from_currency: str, to_currency: str, amount: float) -> Dict[str, Any]:
     frm = from_currency.strip().upper()
     to = to_currency.strip().upper()
@@ -36,19 +179,14 @@ async def convert_currency(from_currency: str, to_currency: str, amount: float)
     if amount <= 0:
         return {"status": "error", "error": "Amount must be greater than zero"}
 
-    url = f"https://open.er-api.com/v6/latest/{frm}"
-
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(url, timeout=10)
-        data = resp.json()
-
-    if data.get("result") != "success":
+    table = await get_rate_table()
+    if table is None:
         return {"status": "error", "error": "Exchange rate service unavailable"}
 
-    if to not in data["rates"]:
-        return {"status": "error", "error": f"Rate not available for {to}"}
+    rate = cross_rate(table, frm, to)
+    if rate is None:
+        return {"status": "error", "error": f"Rate not available for {frm if frm not in table.rates else to}"}
 
-    rate = data["rates"][to]
     precision = CURRENCY_PRECISION.get(to, 2)
     converted = round(amount * rate, precision)
 
@@ -62,4 +200,110 @@ async def convert_currency(from_currency: str, to_currency: str, amount: float)
         "converted_amount": converted,
         "exchange_rate": rate,
         "precision_decimals": precision,
+        "rates_updated": table.source_updated,
+        "rates_stale": time.time() - table.fetched_at > CURRENCY_RATE_TTL,
+    }
+
+
+def parse_conversion_batch(body: bytes) -> List[Any]:
+    """Accept a JSON array of rows (or {"rows": [...]}); a row is
+    {"from": ..., "to": ..., "amount": ...} or [from, to, amount].
+    Amounts are read as Decimal. Raises ValueError on bad input."""
+    payload = json.loads(body or b"null", parse_float=Decimal)
+    rows = payload.get("rows") if isinstance(payload, dict) else payload
+    if not isinstance(rows, list):
+        raise ValueError("Expected a JSON array of conversion rows")
+    if not rows:
+        raise ValueError("No rows supplied")
+    if len(rows) > CURRENCY_BATCH_MAX:
+        raise ValueError(f"At most {CURRENCY_BATCH_MAX} rows per request")
+    return rows
+
+
+def _row_fields(row: Any) -> Tuple[str, str, Any]:
+    if isinstance(row, dict):
+        return str(row.get("from", "")), str(row.get("to", "")), row.get("amount")
+    if isinstance(row, (list, tuple)) and len(row) == 3:
+        return str(row[0]), str(row[1]), row[2]
+    raise ValueError("Row must be {from, to, amount} or [from, to, amount]")
+
+
+def _convert_rows(table: RateTable, rows: List[Any]) -> List[Dict[str, Any]]:
+    # One Decimal rate per distinct pair and one quantum per target currency,
+    # then a single pass over the rows.
+    rates: Dict[Tuple[str, str], Optional[Decimal]] = {}
+    quanta: Dict[str, Decimal] = {}
+    results = []
+    for index, row in enumerate(rows):
+        try:
+            frm, to, amount = _row_fields(row)
+            frm, to = frm.strip().upper(), to.strip().upper()
+            if frm not in CURRENCY_NAMES:
+                raise ValueError(f"Unknown currency: {frm}")
+            if to not in CURRENCY_NAMES:
+                raise ValueError(f"Unknown currency: {to}")
+            if isinstance(amount, bool) or not isinstance(amount, (int, Decimal, str)):
+                raise ValueError("Amount must be a number")
+            amount = Decimal(amount)
+            if not amount.is_finite() or amount <= 0:
+                raise ValueError("Amount must be greater than zero")
+        except (ValueError, InvalidOperation) as e:
+            message = str(e) if isinstance(e, ValueError) else "Amount must be a number"
+            results.append({"index": index, "status": "error", "error": message})
+            continue
+
+        pair = (frm, to)
+        if pair not in rates:
+            rate = None
+            if frm in table.rates and to in table.rates:
+                try:
+                    rate = Decimal(repr(table.rates[to]))
+                    if frm != table.base:
+                        rate /= Decimal(repr(table.rates[frm]))
+                except DecimalException:
+                    rate = None
+            rates[pair] = rate
+        rate = rates[pair]
+        if rate is None:
+            # Missing from the table, or (frm only) a zero rate we can't divide by.
+            missing = to if frm in table.rates and to not in table.rates else frm
+            results.append({"index": index, "status": "error", "error": f"Rate not available for {missing}"})
+            continue
+        quantum = quanta.get(to)
+        if quantum is None:
+            quantum = quanta[to] = Decimal(1).scaleb(-CURRENCY_PRECISION.get(to, 2))
+        try:
+            converted = (amount * rate).quantize(quantum, rounding=ROUND_HALF_EVEN)
+        except DecimalException:
+            # More digits than the decimal context holds (or overflow); only
+            # this row fails.
+            results.append({"index": index, "status": "error", "error": "Converted amount is out of range"})
+            continue
+        results.append({
+            "index": index,
+            "status": "success",
+            "from_currency": frm,
+            "to_currency": to,
+            "amount": str(amount),
+            "converted_amount": str(converted),
+            "exchange_rate": str(rate),
+        })
+    return results
+
+
+async def convert_currency_batch(rows: List[Any]) -> Dict[str, Any]:
+    """Convert many rows against one rate table. Amounts and rates are
+    returned as decimal strings so no precision is lost in JSON."""
+    table = await get_rate_table()
+    if table is None:
+        return {"status": "error", "error": "Exchange rate service unavailable"}
+    results = await asyncio.to_thread(_convert_rows, table, rows)
+    return {
+        "status": "success",
+        "count": len(results),
+        "errors": sum(1 for r in results if r["status"] != "success"),
+        "rate_base": table.base,
+        "rates_updated": table.source_updated,
+        "rates_stale": time.time() - table.fetched_at > CURRENCY_RATE_TTL,
+        "results": results,
     }
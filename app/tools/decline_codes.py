@@ -55,8 +55,11 @@ DECLINE_CODES: Dict[str, Dict[str, str]] = {
     "CV": {"meaning": "Card Type Verification Error", "action": "CVV/CVC mismatch. Re-enter security code.", "retry": "Yes - correct CVV"},
 }
 
+def normalize_decline_code(code: str) -> str:
+    return code.strip().upper()
+
 def interpret_decline_code(code: str) -> Dict[str, Any]:
-    clean = code.strip().upper()
+    clean = normalize_decline_code(code)
 
     if clean in DECLINE_CODES:
         data = DECLINE_CODES[clean]
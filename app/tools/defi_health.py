@@ -1,5 +1,14 @@
-import httpx
-from typing import Dict, Any
+from app.tools.circuit_breaker import UpstreamUnavailable, deadline_scope, wait_shared
+from app.tools.http_client import HTTP_CLIENT
+from datetime import datetime, timezone
+from typing import Dict, Any, NamedTuple, Optional
+import asyncio
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
 
 PROTOCOLS = {
     "uniswap": {"name": "Uniswap", "slug": "uniswap", "chain": "Ethereum", "category": "DEX"},
@@ -29,6 +38,116 @@ def get_risk_level(tvl: float) -> Dict[str, str]:
     else:
         return {"risk": "HIGH", "assessment": "Low TVL protocol. Significant liquidity and exploit risk."}
 
+# TVL snapshots for PROTOCOLS are refreshed in the background every
+# DEFI_REFRESH_INTERVAL seconds and requests are answered from memory. The
+# per-protocol document carries the protocol's entire TVL history; the
+# /protocols listing has current TVL, 24h change and per-chain TVL for every
+# protocol in one response, so one fetch per interval covers all of ours and
+# only those entries are kept.
+DEFILLAMA_PROTOCOLS_URL = os.getenv("DEFILLAMA_PROTOCOLS_URL", "https://api.llama.fi/protocols")
+DEFI_REFRESH_INTERVAL = float(os.getenv("DEFI_REFRESH_INTERVAL", "600"))
+# Snapshots older than this are still served but flagged stale.
+DEFI_STALE_AFTER = float(os.getenv("DEFI_STALE_AFTER", "3600"))
+
+
+class DefiSnapshot(NamedTuple):
+    tvl: float
+    prev_tvl: float
+    change_24h: float
+    chain_tvls: Dict[str, float]
+    fetched_at: float
+
+
+_SNAPSHOTS: Dict[str, DefiSnapshot] = {}
+_REFRESH: Optional["asyncio.Task[bool]"] = None
+_LAST_ERROR: str = ""
+# time.monotonic() of the last successful refresh. A protocol missing from
+# that listing isn't fetched again on demand until the next one is due.
+_REFRESHED_AT = float("-inf")
+
+
+def _build_snapshots(body: bytes, fetched_at: float) -> Dict[str, DefiSnapshot]:
+    wanted = {proto["slug"] for proto in PROTOCOLS.values()}
+    totals: Dict[str, list] = {}
+    for entry in json.loads(body):
+        # Umbrella protocols (e.g. "uniswap") are only listed through their
+        # versions, which name them as "parent#<slug>". Every version counts
+        # toward its parent, including versions tracked on their own (e.g.
+        # "uniswap-v3").
+        parent = (entry.get("parentProtocol") or "").partition("#")[2]
+        slugs = [slug for slug in dict.fromkeys((entry.get("slug"), parent)) if slug in wanted]
+        if not slugs:
+            continue
+        tvl = float(entry.get("tvl") or 0)
+        change = entry.get("change_1d")
+        change = float(change) if change is not None else 0.0
+        prev_tvl = tvl / (1 + change / 100) if change > -100 else 0.0
+        # Skip DeFiLlama's "Chain-borrowed"/"staking"-style breakdowns.
+        chains = [(chain, float(value)) for chain, value in (entry.get("chainTvls") or {}).items()
+                  if "-" not in chain and chain not in ("borrowed", "staking", "pool2")
+                  and isinstance(value, (int, float))]
+        for slug in slugs:
+            total = totals.setdefault(slug, [0.0, 0.0, {}])
+            total[0] += tvl
+            total[1] += prev_tvl
+            for chain, value in chains:
+                total[2][chain] = total[2].get(chain, 0.0) + value
+    snapshots = {}
+    for slug, (tvl, prev_tvl, chains) in totals.items():
+        change = (tvl - prev_tvl) / prev_tvl * 100 if prev_tvl else 0.0
+        chain_tvls = {chain: round(value, 2) for chain, value in sorted(chains.items(), key=lambda item: -item[1])}
+        snapshots[slug] = DefiSnapshot(tvl, prev_tvl, change, chain_tvls, fetched_at)
+    return snapshots
+
+
+async def _refresh() -> bool:
+    global _SNAPSHOTS, _REFRESH, _LAST_ERROR, _REFRESHED_AT
+    try:
+        with deadline_scope(None):
+            r = await HTTP_CLIENT.get(DEFILLAMA_PROTOCOLS_URL, timeout=30)
+        r.raise_for_status()
+        snapshots = await asyncio.to_thread(_build_snapshots, r.content, time.time())
+    except Exception as e:
+        _LAST_ERROR = f"{type(e).__name__}: {e}"
+        logger.warning("DeFiLlama refresh failed; keeping %d snapshots: %s", len(_SNAPSHOTS), _LAST_ERROR)
+        return False
+    finally:
+        _REFRESH = None
+    # Protocols missing from this listing keep their previous snapshot.
+    _SNAPSHOTS = {**_SNAPSHOTS, **snapshots}
+    _REFRESHED_AT = time.monotonic()
+    _LAST_ERROR = ""
+    return True
+
+
+def refresh_defi_snapshots() -> "asyncio.Task[bool]":
+    global _REFRESH
+    if _REFRESH is None:
+        _REFRESH = asyncio.create_task(_refresh())
+    return _REFRESH
+
+
+async def watch_defi(interval: float = DEFI_REFRESH_INTERVAL) -> None:
+    while True:
+        await refresh_defi_snapshots()
+        await asyncio.sleep(interval)
+
+
+def get_defi_status() -> Dict[str, Any]:
+    now = time.time()
+    ages = [now - snap.fetched_at for snap in _SNAPSHOTS.values()]
+    return {
+        "status": "success" if _SNAPSHOTS else "error",
+        "source": DEFILLAMA_PROTOCOLS_URL,
+        "protocols_loaded": len(_SNAPSHOTS),
+        "protocols_tracked": len(PROTOCOLS),
+        "protocols_missing": sorted({proto["slug"] for proto in PROTOCOLS.values()} - _SNAPSHOTS.keys()),
+        "oldest_snapshot_seconds": round(max(ages), 1) if ages else None,
+        "refresh_interval_seconds": DEFI_REFRESH_INTERVAL,
+        "last_error": _LAST_ERROR or None,
+    }
+
+
 async def check_defi_health(protocol: str) -> Dict[str, Any]:
     protocol_clean = protocol.strip().lower()
     
@@ -41,50 +160,44 @@ async def check_defi_health(protocol: str) -> Dict[str, Any]:
         }
     
     proto = PROTOCOLS[protocol_clean]
-    
-    try:
-        async with httpx.AsyncClient(timeout=15) as client:
-            r = await client.get(
-                f"https://api.llama.fi/protocol/{proto['slug']}"
-            )
-            r.raise_for_status()
-            data = r.json()
-        
-        tvl = data.get("currentChainTvls", {})
-        total_tvl = data.get("tvl", [{}])
-        
-        if isinstance(total_tvl, list) and len(total_tvl) > 0:
-            current_tvl = total_tvl[-1].get("totalLiquidityUSD", 0)
-        else:
-            current_tvl = 0
-
-        prev_tvl = total_tvl[-2].get("totalLiquidityUSD", 0) if len(total_tvl) > 1 else current_tvl
-        tvl_change_24h = ((current_tvl - prev_tvl) / prev_tvl * 100) if prev_tvl > 0 else 0
-
-        risk = get_risk_level(current_tvl)
-
-        status = "healthy"
-        if tvl_change_24h < -20:
-            status = "warning"
-        if tvl_change_24h < -50:
-            status = "critical"
 
-        return {
-            "status": "success",
-            "protocol": proto["name"],
-            "slug": proto["slug"],
-            "chain": proto["chain"],
-            "category": proto["category"],
-            "health_status": status,
-            "tvl_usd": round(current_tvl, 2),
-            "tvl_formatted": str("USD ") + (f"{current_tvl/1_000_000_000:.2f}B" if current_tvl >= 1e9 else f"{current_tvl/1_000_000:.2f}M"),
-            "tvl_change_24h_pct": round(tvl_change_24h, 4),
-            "risk_level": risk["risk"],
-            "risk_assessment": risk["assessment"],
-            "data_source": "DeFiLlama"
-        }
+    snap = _SNAPSHOTS.get(proto["slug"])
+    if snap is None and time.monotonic() - _REFRESHED_AT >= DEFI_REFRESH_INTERVAL:
+        # Nothing loaded yet (first request, or the refresher isn't running).
+        try:
+            await wait_shared(refresh_defi_snapshots())
+        except UpstreamUnavailable as e:
+            return {"status": "error", "message": str(e)}
+        snap = _SNAPSHOTS.get(proto["slug"])
+    if snap is None:
+        return {"status": "error", "message": _LAST_ERROR or f"No DeFiLlama data for '{proto['slug']}'"}
 
-    except Exception as e:
-        return {"status": "error", "message": str(e)}
+    current_tvl = snap.tvl
+    tvl_change_24h = snap.change_24h
+
+    risk = get_risk_level(current_tvl)
 
+    status = "healthy"
+    if tvl_change_24h < -20:
+        status = "warning"
+    if tvl_change_24h < -50:
+        status = "critical"
 
+    return {
+        "status": "success",
+        "protocol": proto["name"],
+        "slug": proto["slug"],
+        "chain": proto["chain"],
+        "category": proto["category"],
+        "health_status": status,
+        "tvl_usd": round(current_tvl, 2),
+        "tvl_formatted": str("USD ") + (f"{current_tvl/1_000_000_000:.2f}B" if current_tvl >= 1e9 else f"{current_tvl/1_000_000:.2f}M"),
+        "tvl_change_24h_pct": round(tvl_change_24h, 4),
+        "previous_tvl_usd": round(snap.prev_tvl, 2),
+        "chain_tvls": snap.chain_tvls,
+        "risk_level": risk["risk"],
+        "risk_assessment": risk["assessment"],
+        "data_as_of": datetime.fromtimestamp(snap.fetched_at, timezone.utc).isoformat(timespec="seconds"),
+        "data_stale": time.time() - snap.fetched_at > DEFI_STALE_AFTER,
+        "data_source": "DeFiLlama"
+    }
@@ -0,0 +1,94 @@
+from typing import Any, Callable, Dict, List, Optional
+import json
+import logging
+import os
+
+from app.tools.bin_lookup import get_bin_details, lookup_bins
+from app.tools.decline_codes import interpret_decline_code
+from app.tools.iban_validator import validate_iban
+from app.tools.mcc_lookup import get_mcc_details
+from app.tools.routing_validator import lookup_routing
+from app.tools.swift_lookup import lookup_swift
+
+ENRICH_BATCH_MAX = int(os.getenv("ENRICH_BATCH_MAX", "10000"))
+
+logger = logging.getLogger(__name__)
+
+# Record key -> the tool that resolves it. Keys a record doesn't carry are skipped.
+# BINs are resolved up front for the whole batch (see enrich_records).
+ENRICH_TOOLS: Dict[str, Callable[[str], Dict[str, Any]]] = {
+    "bin": get_bin_details,
+    "mcc": get_mcc_details,
+    "decline_code": interpret_decline_code,
+    "swift": lookup_swift,
+    "routing_number": lookup_routing,
+    "iban": validate_iban,
+}
+
+
+def parse_enrich_batch(body: bytes) -> List[Dict[str, Any]]:
+    """Accept a JSON array of records or {"records": [...]}. Raises ValueError on bad input."""
+    payload = json.loads(body or b"null")
+    records = payload.get("records") if isinstance(payload, dict) else payload
+    if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+        raise ValueError("Expected a JSON array of record objects")
+    if not records:
+        raise ValueError("No records supplied")
+    if len(records) > ENRICH_BATCH_MAX:
+        raise ValueError(f"At most {ENRICH_BATCH_MAX} records per request")
+    return records
+
+
+def _lookup_key(value: Any) -> Optional[str]:
+    """The string a tool is called with, or None for objects, arrays and booleans."""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    return None
+
+
+def _call_tool(field: str, tool: Callable[[str], Dict[str, Any]], value: str) -> Dict[str, Any]:
+    # One failing lookup only fails that field of the records carrying it.
+    try:
+        return tool(value)
+    except Exception:
+        logger.exception("Enrichment: %s lookup failed for %r", field, value)
+        return {"status": "error", "error": f"{field} lookup failed"}
+
+
+def enrich_records(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # Files repeat the same BINs, MCCs and banks heavily, so each distinct value
+    # is looked up once per batch and the result shared between records.
+    memo: Dict[str, Dict[str, Dict[str, Any]]] = {field: {} for field in ENRICH_TOOLS}
+    # All BINs against one table snapshot, even if a reload lands mid-batch.
+    bins = list(dict.fromkeys(key for key in (_lookup_key(r.get("bin")) for r in records) if key))
+    try:
+        memo["bin"].update(zip(bins, lookup_bins(bins, unique=False)))
+    except Exception:
+        # BINs left unresolved are looked up one by one below.
+        logger.exception("Enrichment: batch BIN lookup failed")
+    results = []
+    for i, record in enumerate(records):
+        result: Dict[str, Any] = {"index": i}
+        if "id" in record:
+            result["id"] = record["id"]
+        for field, tool in ENRICH_TOOLS.items():
+            value = record.get(field)
+            if value is None or value == "":
+                continue
+            key = _lookup_key(value)
+            if key is None:
+                result[field] = {"status": "error", "error": f"{field} must be a string or number"}
+                continue
+            seen = memo[field]
+            if key not in seen:
+                seen[key] = _call_tool(field, tool, key)
+            result[field] = seen[key]
+        results.append(result)
+    return {
+        "status": "success",
+        "count": len(results),
+        "distinct_lookups": sum(len(seen) for seen in memo.values()),
+        "results": results,
+    }
@@ -1,25 +1,222 @@
-﻿from typing import Dict, Any
-
-COUNTRY_RISK: Dict[str, int] = {
-    "US": 10, "CA": 10, "GB": 10, "AU": 10, "DE": 10, "FR": 10, "NL": 10,
-    "SE": 10, "NO": 10, "DK": 10, "FI": 10, "CH": 10, "AT": 10, "NZ": 10,
-    "JP": 15, "KR": 15, "SG": 15, "HK": 15, "IE": 15, "BE": 15, "IT": 20,
-    "ES": 20, "PT": 20, "GR": 25, "PL": 25, "CZ": 25, "HU": 25, "RO": 30,
-    "BR": 40, "MX": 40, "AR": 45, "CO": 45, "ZA": 45, "IN": 35, "CN": 40,
-    "RU": 70, "NG": 70, "GH": 65, "KE": 60, "PK": 65, "BD": 60, "VN": 50,
-    "ID": 45, "PH": 50, "UA": 55, "BY": 65, "IQ": 75, "IR": 80, "SY": 80,
-    "KP": 90, "CU": 80, "VE": 70, "MM": 65, "AF": 80,
-}
+﻿from datetime import datetime, timezone
+from typing import Any, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+import json
+import logging
+import os
+
+from app.tools.versioned_file import VersionedFile
+
+# Vectorised batch scoring uses NumPy when it is installed and falls back to
+# a plain Python loop with identical results when it isn't.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Scoring rules (risk tables, weights, bonuses and risk bands) are data, read
+# from FRAUD_RULES_PATH and compiled into a FraudRules snapshot. A new file is
+# swapped in with one assignment, so a score is always computed against a
+# single rule set, and every score reports the version it used. Each worker
+# polls the file every FRAUD_RULES_RELOAD_INTERVAL seconds, so tuning changes
+# reach the whole fleet without a restart. A file that fails to load or
+# validate is logged and the running version stays in place; until a file
+# loads, the built-in rules below are used.
+FRAUD_RULES_PATH = os.getenv(
+    "FRAUD_RULES_PATH", os.path.join(os.path.dirname(__file__), "..", "data", "fraud_rules.json")
+)
+FRAUD_RULES_RELOAD_INTERVAL = float(os.getenv("FRAUD_RULES_RELOAD_INTERVAL", "60"))
+
+# Weights are applied in this order; the scalar and batch scorers sum in the
+# same order so their floating-point results are identical.
+WEIGHT_KEYS = ("country", "card_type", "network", "commercial", "anonymous")
+
+
+class FraudRules(NamedTuple):
+    version: str
+    digest: str
+    country_risk: Dict[str, int]
+    network_risk: Dict[str, int]
+    card_type_risk: Dict[str, int]
+    default_country: int
+    default_network: int
+    default_card_type: int
+    commercial_bonus: int
+    anonymous_bonus: int
+    weights: Tuple[float, ...]
+    # Highest score of every band but the last, which takes the rest.
+    band_limits: Tuple[int, ...]
+    # (risk level, recommendation, explanation) per band.
+    bands: Tuple[Tuple[str, str, str], ...]
+    high_risk_country_score: int
+    high_risk_networks: FrozenSet[str]
+    loaded_at: str
+    source_mtime_ns: int
+    source_size: int
+
+    def country_score(self, country_code: Optional[str]) -> int:
+        return self.country_risk.get(country_code.upper() if country_code else "US", self.default_country)
+
+    def network_score(self, network: Optional[str]) -> int:
+        return self.network_risk.get(network, self.default_network)
+
+    def card_type_score(self, card_type: Optional[str]) -> int:
+        return self.card_type_risk.get(card_type.lower() if card_type else "unknown", self.default_card_type)
+
+    def weighted_score(self, country_score, type_score, network_score, commercial_bonus, anonymous_bonus):
+        # Works elementwise on NumPy arrays as well as on plain numbers.
+        w = self.weights
+        return (
+            (country_score * w[0]) + (type_score * w[1]) + (network_score * w[2])
+            + (commercial_bonus * w[3]) + (anonymous_bonus * w[4])
+        )
+
+    def band(self, fraud_score: int) -> int:
+        for i, limit in enumerate(self.band_limits):
+            if fraud_score <= limit:
+                return i
+        return len(self.band_limits)
+
+    @property
+    def risk_levels(self) -> List[str]:
+        return [band[0] for band in self.bands]
 
-NETWORK_RISK: Dict[str, int] = {
-    "Visa": 5, "Mastercard": 5, "American Express": 5, "Discover": 5,
-    "JCB": 10, "UnionPay": 20, "Maestro": 10, "Diners Club": 10,
-    "Unknown": 30,
-}
 
-CARD_TYPE_RISK: Dict[str, int] = {
-    "credit": 10, "debit": 5, "prepaid": 35, "charge": 10, "unknown": 20,
+def _risk_table(spec: Dict[str, Any], key: str) -> Dict[str, int]:
+    table = spec.get(key)
+    if not isinstance(table, dict) or not all(
+        isinstance(k, str) and isinstance(v, int) and not isinstance(v, bool) for k, v in table.items()
+    ):
+        raise ValueError(f"{key} must map names to integer scores")
+    return table
+
+
+def compile_rules(spec: Dict[str, Any], digest: str = "", stat: Optional[os.stat_result] = None) -> FraudRules:
+    """Validate a rules document and compile it. Raises ValueError on bad input."""
+    if not isinstance(spec, dict):
+        raise ValueError("Rules must be a JSON object")
+    version = spec.get("version")
+    if not isinstance(version, str) or not version:
+        raise ValueError("Rules need a non-empty version string")
+    try:
+        weights = tuple(float(spec["weights"][k]) for k in WEIGHT_KEYS)
+        defaults = {k: int(spec["defaults"][k]) for k in ("country", "network", "card_type")}
+        bonuses = {k: int(spec["bonuses"][k]) for k in ("commercial", "anonymous")}
+        bands = [(b.get("max_score"), str(b["risk_level"]), str(b["recommendation"]), str(b["explanation"]))
+                 for b in spec["risk_bands"]]
+        high_risk_country_score = int(spec["high_risk_country_score"])
+        high_risk_networks = frozenset(str(n) for n in spec["high_risk_networks"])
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError(f"Missing or malformed rule: {e}") from None
+    if not bands:
+        raise ValueError("At least one risk band is required")
+    limits = [b[0] for b in bands[:-1]]
+    if not all(isinstance(l, int) for l in limits) or limits != sorted(set(limits)):
+        raise ValueError("risk_bands max_score must be increasing integers")
+    return FraudRules(
+        version=version,
+        digest=digest,
+        country_risk={k.upper(): v for k, v in _risk_table(spec, "country_risk").items()},
+        network_risk=dict(_risk_table(spec, "network_risk")),
+        card_type_risk={k.lower(): v for k, v in _risk_table(spec, "card_type_risk").items()},
+        default_country=defaults["country"],
+        default_network=defaults["network"],
+        default_card_type=defaults["card_type"],
+        commercial_bonus=bonuses["commercial"],
+        anonymous_bonus=bonuses["anonymous"],
+        weights=weights,
+        band_limits=tuple(limits),
+        bands=tuple(b[1:] for b in bands),
+        high_risk_country_score=high_risk_country_score,
+        high_risk_networks=high_risk_networks,
+        loaded_at=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        source_mtime_ns=stat.st_mtime_ns if stat else 0,
+        source_size=stat.st_size if stat else 0,
+    )
+
+
+# The rules as first shipped, used until a rules file loads (or if none ever
+# does, e.g. a wrong FRAUD_RULES_PATH), so scoring never depends on the file
+# being present. app/data/fraud_rules.json starts out identical.
+BUILTIN_RULES: Dict[str, Any] = {
+    "version": "builtin",
+    "weights": {"country": 0.40, "card_type": 0.25, "network": 0.20, "commercial": 0.05, "anonymous": 0.10},
+    "bonuses": {"commercial": 10, "anonymous": 25},
+    "defaults": {"country": 40, "network": 30, "card_type": 20},
+    "country_risk": {
+        "US": 10, "CA": 10, "GB": 10, "AU": 10, "DE": 10, "FR": 10, "NL": 10,
+        "SE": 10, "NO": 10, "DK": 10, "FI": 10, "CH": 10, "AT": 10, "NZ": 10,
+        "JP": 15, "KR": 15, "SG": 15, "HK": 15, "IE": 15, "BE": 15, "IT": 20,
+        "ES": 20, "PT": 20, "GR": 25, "PL": 25, "CZ": 25, "HU": 25, "RO": 30,
+        "BR": 40, "MX": 40, "AR": 45, "CO": 45, "ZA": 45, "IN": 35, "CN": 40,
+        "RU": 70, "NG": 70, "GH": 65, "KE": 60, "PK": 65, "BD": 60, "VN": 50,
+        "ID": 45, "PH": 50, "UA": 55, "BY": 65, "IQ": 75, "IR": 80, "SY": 80,
+        "KP": 90, "CU": 80, "VE": 70, "MM": 65, "AF": 80,
+    },
+    "network_risk": {
+        "Visa": 5, "Mastercard": 5, "American Express": 5, "Discover": 5,
+        "JCB": 10, "UnionPay": 20, "Maestro": 10, "Diners Club": 10,
+        "Unknown": 30,
+    },
+    "card_type_risk": {
+        "credit": 10, "debit": 5, "prepaid": 35, "charge": 10, "unknown": 20,
+    },
+    "high_risk_country_score": 60,
+    "high_risk_networks": ["UnionPay", "Unknown"],
+    "risk_bands": [
+        {"max_score": 20, "risk_level": "LOW", "recommendation": "Approve",
+         "explanation": "Card profile matches low-risk characteristics."},
+        {"max_score": 35, "risk_level": "MEDIUM-LOW", "recommendation": "Approve with standard monitoring",
+         "explanation": "Minor risk indicators present. Standard fraud monitoring recommended."},
+        {"max_score": 44, "risk_level": "MEDIUM", "recommendation": "Approve with enhanced monitoring",
+         "explanation": "Moderate risk indicators. Consider step-up authentication."},
+        {"max_score": 60, "risk_level": "MEDIUM-HIGH", "recommendation": "Review before approval",
+         "explanation": "Multiple risk indicators. Manual review or 3DS authentication recommended."},
+        {"max_score": 100, "risk_level": "HIGH", "recommendation": "Decline or require additional verification",
+         "explanation": "High-risk card profile. Strong authentication or decline recommended."},
+    ],
 }
+_BUILTIN = compile_rules(BUILTIN_RULES, "builtin")
+
+
+
+def _build_rules(raw: bytes, digest: str, stat: os.stat_result) -> FraudRules:
+    return compile_rules(json.loads(raw), digest, stat)
+
+
+FRAUD_RULES_FILE = VersionedFile("Fraud rules", FRAUD_RULES_PATH, _build_rules, _BUILTIN)
+
+
+def reload_fraud_rules(force: bool = False) -> bool:
+    """Load the rules file if it changed (or always, with force). Returns True on a swap."""
+    return FRAUD_RULES_FILE.reload(force)
+
+
+def load_fraud_rules() -> FraudRules:
+    return FRAUD_RULES_FILE.get()
+
+
+async def watch_fraud_rules(interval: float = FRAUD_RULES_RELOAD_INTERVAL) -> None:
+    """Poll the rules file and reload it off the event loop whenever it changes."""
+    await FRAUD_RULES_FILE.watch(interval)
+
+
+def get_fraud_rules_status() -> Dict[str, Any]:
+    rules = load_fraud_rules()
+    return {
+        "status": "success",
+        "source": "builtin" if rules is _BUILTIN else os.path.basename(FRAUD_RULES_FILE.path),
+        "version": rules.version,
+        "digest": rules.digest,
+        "countries": len(rules.country_risk),
+        "weights": dict(zip(WEIGHT_KEYS, rules.weights)),
+        "risk_levels": rules.risk_levels,
+        "loaded_at": rules.loaded_at,
+        "last_error": FRAUD_RULES_FILE.last_error or None,
+        "reload_interval_seconds": FRAUD_RULES_RELOAD_INTERVAL,
+    }
+
 
 def calculate_fraud_score(
     card_type: str,
@@ -28,44 +225,26 @@ def calculate_fraud_score(
     is_commercial: bool = False,
     is_anonymous: bool = False,
 ) -> Dict[str, Any]:
+    rules = load_fraud_rules()
 
-    country_score = COUNTRY_RISK.get(country_code.upper() if country_code else "US", 40)
-    network_score = NETWORK_RISK.get(network, 30)
-    type_score = CARD_TYPE_RISK.get(card_type.lower() if card_type else "unknown", 20)
+    country_score = rules.country_score(country_code)
+    network_score = rules.network_score(network)
+    type_score = rules.card_type_score(card_type)
 
-    commercial_bonus = 10 if is_commercial else 0
-    anonymous_bonus = 25 if is_anonymous else 0
+    commercial_bonus = rules.commercial_bonus if is_commercial else 0
+    anonymous_bonus = rules.anonymous_bonus if is_anonymous else 0
 
-    raw_score = (country_score * 0.40) + (type_score * 0.25) + (network_score * 0.20) + (commercial_bonus * 0.05) + (anonymous_bonus * 0.10)
+    raw_score = rules.weighted_score(country_score, type_score, network_score, commercial_bonus, anonymous_bonus)
     fraud_score = min(100, round(raw_score))
 
-    if fraud_score <= 20:
-        risk_level = "LOW"
-        recommendation = "Approve"
-        explanation = "Card profile matches low-risk characteristics."
-    elif fraud_score <= 35:
-        risk_level = "MEDIUM-LOW"
-        recommendation = "Approve with standard monitoring"
-        explanation = "Minor risk indicators present. Standard fraud monitoring recommended."
-    elif fraud_score <= 44:
-        risk_level = "MEDIUM"
-        recommendation = "Approve with enhanced monitoring"
-        explanation = "Moderate risk indicators. Consider step-up authentication."
-    elif fraud_score <= 60:
-        risk_level = "MEDIUM-HIGH"
-        recommendation = "Review before approval"
-        explanation = "Multiple risk indicators. Manual review or 3DS authentication recommended."
-    else:
-        risk_level = "HIGH"
-        recommendation = "Decline or require additional verification"
-        explanation = "High-risk card profile. Strong authentication or decline recommended."
+    risk_level, recommendation, explanation = rules.bands[rules.band(fraud_score)]
 
     factors = []
-    if country_score >= 60:
+    if country_score >= rules.high_risk_country_score:
         factors.append(f"High-risk issuing country ({country_code})")
     if card_type.lower() == "prepaid":
         factors.append("Prepaid card - higher fraud rate")
-    if network in ["UnionPay", "Unknown"]:
+    if network in rules.high_risk_networks:
         factors.append(f"Higher-risk network ({network})")
     if is_commercial:
         factors.append("Commercial card - elevated chargeback risk")
@@ -87,10 +266,153 @@ def calculate_fraud_score(
             "network_risk": network_score,
             "commercial_bonus": commercial_bonus,
             "anonymous_bonus": anonymous_bonus,
-        }
+        },
+        "rules_version": rules.version,
     }
 
 
+# Batch scoring for portfolio sweeps. Each column's distinct raw values are
+# encoded once to integer codes (normalised exactly as the scalar scorer
+# does), the risk tables become arrays indexed by code, and the weighted sum,
+# rounding and risk bands are computed over whole columns. Only the score and
+# risk level are produced; risk factors and advice stay with the scalar tool.
+FRAUD_BATCH_MAX = int(os.getenv("FRAUD_BATCH_MAX", "1000000"))
+
+
+class FraudScores(NamedTuple):
+    fraud_score: List[int]
+    risk_level: List[str]
+    rules_version: str
+
+
+class _Encoder(dict):
+    """Raw value -> integer code; codes index `risks`, the value's risk score."""
+
+    def __init__(self, risk) -> None:
+        super().__init__()
+        self._risk = risk
+        self.risks: List[int] = []
+
+    def __missing__(self, value: Any) -> int:
+        code = self[value] = len(self.risks)
+        self.risks.append(self._risk(value))
+        return code
 
 
+def score_profiles(
+    card_types: Sequence[Optional[str]],
+    networks: Sequence[Optional[str]],
+    country_codes: Sequence[Optional[str]],
+    is_commercial: Optional[Sequence[Any]] = None,
+    is_anonymous: Optional[Sequence[Any]] = None,
+) -> FraudScores:
+    """Score many card profiles given as columns. Each result equals
+    calculate_fraud_score(...)["fraud_score"] / ["risk_level"] for that row."""
+    count = len(card_types)
+    if any(column is not None and len(column) != count
+           for column in (networks, country_codes, is_commercial, is_anonymous)):
+        raise ValueError("All columns must have the same length")
+    is_commercial = is_commercial if is_commercial is not None else [False] * count
+    is_anonymous = is_anonymous if is_anonymous is not None else [False] * count
+    rules = load_fraud_rules()
+    countries = _Encoder(rules.country_score)
+    network_codes = _Encoder(rules.network_score)
+    types = _Encoder(rules.card_type_score)
 
+    if np is None:
+        scores = []
+        for c, n, t, is_c, is_a in zip(map(countries.__getitem__, country_codes), map(network_codes.__getitem__, networks),
+                                       map(types.__getitem__, card_types), is_commercial, is_anonymous):
+            raw = rules.weighted_score(countries.risks[c], types.risks[t], network_codes.risks[n],
+                                       rules.commercial_bonus if is_c else 0, rules.anonymous_bonus if is_a else 0)
+            scores.append(min(100, round(raw)))
+        levels = rules.risk_levels
+        return FraudScores(scores, [levels[rules.band(score)] for score in scores], rules.version)
+
+    def codes(encoder: _Encoder, values: Iterable[Any]):
+        return np.fromiter(map(encoder.__getitem__, values), dtype=np.intp, count=count)
+
+    def bonus(flags: Iterable[Any], value: int):
+        return np.where(np.fromiter(map(bool, flags), dtype=bool, count=count), float(value), 0.0)
+
+    country_idx, network_idx, type_idx = codes(countries, country_codes), codes(network_codes, networks), codes(types, card_types)
+    raw = rules.weighted_score(
+        np.array(countries.risks, dtype=np.float64)[country_idx],
+        np.array(types.risks, dtype=np.float64)[type_idx],
+        np.array(network_codes.risks, dtype=np.float64)[network_idx],
+        bonus(is_commercial, rules.commercial_bonus),
+        bonus(is_anonymous, rules.anonymous_bonus),
+    )
+    # np.rint rounds half to even, like round().
+    scores = np.minimum(100, np.rint(raw)).astype(np.int64)
+    bands = np.searchsorted(np.array(rules.band_limits, dtype=np.int64), scores, side="left")
+    levels = np.array(rules.risk_levels, dtype=object)[bands]
+    return FraudScores(scores.tolist(), levels.tolist(), rules.version)
+
+
+def _parse_flag(value: Any, row: int, name: str) -> bool:
+    # Scoring truth-tests the flags, so "false" or {} would count as true.
+    if value is None or value is False or value is True:
+        return bool(value)
+    if type(value) is int and value in (0, 1):
+        return bool(value)
+    raise ValueError(f"Row {row}: {name} must be true or false, got {json.dumps(value)}")
+
+
+def parse_fraud_batch(body: bytes) -> Dict[str, List[Any]]:
+    """Accept a JSON array of profile objects ({"card_type", "network",
+    "country_code", "is_commercial", "is_anonymous"}), {"profiles": [...]},
+    or the same fields as parallel arrays. Raises ValueError on bad input."""
+    payload = json.loads(body or b"null")
+    if isinstance(payload, dict) and "profiles" in payload:
+        payload = payload["profiles"]
+    if isinstance(payload, list):
+        if not all(isinstance(p, dict) for p in payload):
+            raise ValueError("Expected a JSON array of profile objects")
+        columns = {
+            "card_types": [p.get("card_type", "credit") for p in payload],
+            "networks": [p.get("network", "Visa") for p in payload],
+            "country_codes": [p.get("country_code", "US") for p in payload],
+            "is_commercial": [p.get("is_commercial", False) for p in payload],
+            "is_anonymous": [p.get("is_anonymous", False) for p in payload],
+        }
+    elif isinstance(payload, dict):
+        try:
+            columns = {
+                "card_types": payload["card_type"],
+                "networks": payload["network"],
+                "country_codes": payload["country_code"],
+                "is_commercial": payload.get("is_commercial"),
+                "is_anonymous": payload.get("is_anonymous"),
+            }
+        except KeyError as e:
+            raise ValueError(f"Missing column {e}") from None
+        if not all(isinstance(c, list) for c in columns.values() if c is not None):
+            raise ValueError("Columns must be JSON arrays")
+    else:
+        raise ValueError("Expected a JSON array of profiles or an object of columns")
+    for name in ("card_types", "networks", "country_codes"):
+        if not all(v is None or isinstance(v, str) for v in columns[name]):
+            raise ValueError(f"{name[:-1]} values must be strings")
+    count = len(columns["card_types"])
+    if any(c is not None and len(c) != count for c in columns.values()):
+        raise ValueError("All columns must have the same length")
+    for name in ("is_commercial", "is_anonymous"):
+        if columns[name] is not None:
+            columns[name] = [_parse_flag(value, row, name) for row, value in enumerate(columns[name])]
+    if not count:
+        raise ValueError("No profiles supplied")
+    if count > FRAUD_BATCH_MAX:
+        raise ValueError(f"At most {FRAUD_BATCH_MAX} profiles per request")
+    return columns
+
+
+def score_fraud_batch(columns: Dict[str, List[Any]]) -> Dict[str, Any]:
+    scores = score_profiles(**columns)
+    return {
+        "status": "success",
+        "count": len(scores.fraud_score),
+        "fraud_score": scores.fraud_score,
+        "risk_level": scores.risk_level,
+        "rules_version": scores.rules_version,
+    }
@@ -0,0 +1,166 @@
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+from urllib.parse import urlsplit
+import asyncio
+import importlib.util
+import os
+import time
+
+import httpx
+
+from app.tools.circuit_breaker import CircuitBreaker, UpstreamUnavailable, bounded_timeout
+
+# One pooled client for every outbound tool call (exchange rates, CoinGecko,
+# DeFiLlama, OpenSanctions), so repeat calls reuse warm connections instead of
+# paying DNS, TCP and TLS setup each time. Opened on app startup and closed on
+# shutdown; scripts that never start the app get one lazily on first use.
+# Calls go through a per-host circuit breaker and are cut short at the
+# request's deadline (see circuit_breaker.py).
+#
+#   OUTBOUND_TIMEOUT           default read/write/pool timeout, seconds
+#   OUTBOUND_CONNECT_TIMEOUT   connect timeout, seconds
+#   OUTBOUND_MAX_CONNECTIONS   pool-wide connection cap
+#   OUTBOUND_MAX_KEEPALIVE     idle connections kept open
+#   OUTBOUND_PER_HOST          concurrent requests allowed per upstream host
+#   OUTBOUND_RETRIES           retries of failed connection attempts
+#   OUTBOUND_HTTP2             1 to negotiate HTTP/2 (needs the h2 package)
+
+OUTBOUND_TIMEOUT = float(os.getenv("OUTBOUND_TIMEOUT", "10"))
+OUTBOUND_CONNECT_TIMEOUT = float(os.getenv("OUTBOUND_CONNECT_TIMEOUT", "5"))
+OUTBOUND_MAX_CONNECTIONS = int(os.getenv("OUTBOUND_MAX_CONNECTIONS", "100"))
+OUTBOUND_MAX_KEEPALIVE = int(os.getenv("OUTBOUND_MAX_KEEPALIVE", "20"))
+OUTBOUND_PER_HOST = int(os.getenv("OUTBOUND_PER_HOST", "10"))
+OUTBOUND_RETRIES = int(os.getenv("OUTBOUND_RETRIES", "2"))
+OUTBOUND_HTTP2 = os.getenv("OUTBOUND_HTTP2", "1") == "1" and importlib.util.find_spec("h2") is not None
+
+
+class OutboundClient:
+    def __init__(self) -> None:
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.requests = 0
+        self.connections_opened = 0
+        self.errors = 0
+
+    def _build(self) -> httpx.AsyncClient:
+        # Transport-level retries only cover failing to connect, so they are
+        # safe for every method; nothing that reached the server is resent.
+        transport = httpx.AsyncHTTPTransport(
+            http2=OUTBOUND_HTTP2,
+            retries=OUTBOUND_RETRIES,
+            limits=httpx.Limits(
+                max_connections=OUTBOUND_MAX_CONNECTIONS,
+                max_keepalive_connections=OUTBOUND_MAX_KEEPALIVE,
+            ),
+        )
+        return httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(OUTBOUND_TIMEOUT, connect=OUTBOUND_CONNECT_TIMEOUT),
+            follow_redirects=True,
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = self._build()
+        return self._client
+
+    async def start(self) -> None:
+        self.client
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _trace(self, event: str, info: Dict[str, Any]) -> None:
+        if event == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+
+    def _host_limit(self, host: str) -> asyncio.Semaphore:
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = self._host_limits[host] = asyncio.Semaphore(OUTBOUND_PER_HOST)
+        return limit
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        host = urlsplit(url).netloc
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(host)
+        return breaker
+
+    async def _acquire(self, host: str) -> asyncio.Semaphore:
+        # Waiting for a slot counts against the deadline too.
+        limit = self._host_limit(host)
+        timeout = bounded_timeout(None)
+        try:
+            await asyncio.wait_for(limit.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise UpstreamUnavailable(f"{host} is busy; request deadline exceeded") from None
+        return limit
+
+    async def get(self, url: str, timeout: Optional[float] = None, **kwargs: Any) -> httpx.Response:
+        breaker = self.breaker(url)
+        limit = await self._acquire(breaker.name)
+        started = time.monotonic()
+        try:
+            timeout = timeout if timeout is not None else OUTBOUND_TIMEOUT
+            bounded = bounded_timeout(timeout)
+            breaker.before_call()
+            self.requests += 1
+            resp = await self.client.get(url, timeout=bounded, extensions={"trace": self._trace}, **kwargs)
+        except UpstreamUnavailable:
+            raise
+        except httpx.HTTPError as e:
+            self.errors += 1
+            # A timeout cut short by the caller's deadline says the upstream is
+            # slow, not that it failed.
+            cut_short = isinstance(e, httpx.TimeoutException) and bounded < timeout
+            breaker.record(cut_short, time.monotonic() - started)
+            if cut_short:
+                raise UpstreamUnavailable(f"{breaker.name} is slow; request deadline exceeded") from e
+            raise
+        finally:
+            limit.release()
+        breaker.record(resp.status_code < 500 and resp.status_code != 429, time.monotonic() - started)
+        return resp
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs: Any) -> AsyncIterator[httpx.Response]:
+        # Bulk downloads: guarded by the breaker but not by request deadlines,
+        # and their duration doesn't count as slowness.
+        breaker = self.breaker(url)
+        breaker.before_call()
+        async with self._host_limit(breaker.name):
+            self.requests += 1
+            ok: Optional[bool] = None
+            try:
+                async with self.client.stream(method, url, extensions={"trace": self._trace}, **kwargs) as resp:
+                    ok = resp.status_code < 500 and resp.status_code != 429
+                    yield resp
+            except httpx.HTTPError:
+                self.errors += 1
+                ok = False
+                raise
+            finally:
+                # Recorded once, when the caller is done: a body that fails
+                # after good headers counts as one failed call.
+                if ok is not None:
+                    breaker.record(ok)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "http2": OUTBOUND_HTTP2,
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "connection_reuse_rate": round(1 - self.connections_opened / self.requests, 4) if self.requests else 0.0,
+            "errors": self.errors,
+            "per_host_limit": OUTBOUND_PER_HOST,
+            "hosts": sorted(self._host_limits),
+            "breakers": {host: breaker.stats() for host, breaker in sorted(self._breakers.items())},
+        }
+
+
+HTTP_CLIENT = OutboundClient()
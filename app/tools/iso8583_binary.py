@@ -0,0 +1,589 @@
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import asyncio
+import json
+import logging
+import os
+import string
+
+from app.tools.iso8583_parser import FIELD_DEFINITIONS, MTI_DEFINITIONS, _enrich_fields
+
+logger = logging.getLogger(__name__)
+
+# Parser for ISO 8583 messages as they come off the wire: a bytes buffer with a
+# binary or hex bitmap and fields in ASCII, EBCDIC, packed BCD or raw binary.
+#
+# Parsing only walks the length prefixes and records where each field sits in
+# the caller's buffer; nothing is copied or decoded until a field is read. The
+# encodings are described by a Dialect, so the same parser serves the ASCII
+# test-tool format used by parse_iso8583 and the binary formats hosts send.
+#
+# Encodings:
+#   ascii    one byte per character
+#   ebcdic   one byte per character, code page 037
+#   bcd      packed decimal, two digits per byte, right-aligned (odd lengths
+#            have a leading zero nibble)
+#   binary   raw bytes, shown as upper-case hex
+#   hex      raw bytes carried as two ASCII hex characters each
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+# Fields whose content is numeric and therefore packed when a dialect says bcd.
+NUMERIC_FIELDS = frozenset(
+    list(range(2, 27)) + [32, 33, 49, 50, 51, 53, 90]
+)
+# Fields that are bit strings: PIN block, ICC data, MAC.
+BINARY_FIELDS = frozenset({52, 55, 64})
+
+_PREFIX_DIGITS = {"llvar": 2, "lllvar": 3}
+_HEX_DIGITS = string.hexdigits.encode()
+
+
+class ISO8583Error(ValueError):
+    pass
+
+
+def _digits_size(encoding: str, units: int) -> int:
+    if encoding == "bcd":
+        return (units + 1) // 2
+    if encoding == "hex":
+        return units * 2
+    return units
+
+
+def _read_ascii_number(buf: memoryview, start: int, end: int) -> int:
+    # int() alone would also take signs, spaces and underscores.
+    raw = bytes(buf[start:end])
+    if not raw.isdigit():
+        raise ISO8583Error(f"invalid ASCII digits {raw!r}")
+    return int(raw)
+
+
+def _read_ebcdic_number(buf: memoryview, start: int, end: int) -> int:
+    value = 0
+    for byte in buf[start:end]:
+        if not 0xF0 <= byte <= 0xF9:
+            raise ValueError(f"invalid EBCDIC digit 0x{byte:02X}")
+        value = value * 10 + (byte & 0x0F)
+    return value
+
+
+def _read_bcd_number(buf: memoryview, start: int, end: int) -> int:
+    return int(buf[start:end].hex())
+
+
+def _read_binary_number(buf: memoryview, start: int, end: int) -> int:
+    return int.from_bytes(buf[start:end], "big")
+
+
+_NUMBER_READERS: Dict[str, Callable[[memoryview, int, int], int]] = {
+    "ascii": _read_ascii_number,
+    "ebcdic": _read_ebcdic_number,
+    "bcd": _read_bcd_number,
+    "binary": _read_binary_number,
+}
+
+
+def _decode_ascii(raw: memoryview, units: int) -> str:
+    return str(raw, "ascii", "replace")
+
+
+def _decode_ebcdic(raw: memoryview, units: int) -> str:
+    return str(raw, "cp037")
+
+
+def _decode_bcd(raw: memoryview, units: int) -> str:
+    digits = raw.hex()
+    return digits[len(digits) - units:]
+
+
+def _decode_binary(raw: memoryview, units: int) -> str:
+    return raw.hex().upper()
+
+
+_DECODERS: Dict[str, Callable[[memoryview, int], str]] = {
+    "ascii": _decode_ascii,
+    "ebcdic": _decode_ebcdic,
+    "bcd": _decode_bcd,
+    "binary": _decode_binary,
+    "hex": _decode_ascii,
+}
+
+
+_DIALECT_SETTINGS = ("mti", "bitmap", "prefix", "numeric", "text", "binary")
+
+
+class Dialect:
+    """How one host encodes the MTI, bitmaps, length prefixes and fields.
+
+    Field definitions default to FIELD_DEFINITIONS; `numeric`, `text` and
+    `binary` pick the content encoding by field class and `overrides` maps
+    individual field numbers to an encoding. Everything is resolved once into
+    a per-field tuple so the parse loop does no dictionary work beyond one get.
+    """
+
+    def __init__(self, name: str, mti: str = "ascii", bitmap: str = "binary", prefix: str = "ascii",
+                 numeric: str = "ascii", text: str = "ascii", binary: str = "binary",
+                 overrides: Optional[Dict[int, str]] = None,
+                 fields: Optional[Dict[int, Dict[str, Any]]] = None, description: str = "") -> None:
+        if bitmap not in ("binary", "hex"):
+            raise ValueError(f"bitmap encoding must be binary or hex, not {bitmap!r}")
+        if prefix not in _NUMBER_READERS:
+            raise ValueError(f"length prefix encoding must be one of {sorted(_NUMBER_READERS)}, not {prefix!r}")
+        self.name = name
+        self.description = description
+        self.numeric = numeric
+        self.text = text
+        self.binary = binary
+        self.overrides = dict(overrides or {})
+        self.definitions = dict(fields or FIELD_DEFINITIONS)
+        self.mti = mti
+        self.bitmap = bitmap
+        self.prefix = prefix
+        if mti not in ("ascii", "ebcdic", "bcd"):
+            raise ValueError(f"MTI encoding must be ascii, ebcdic or bcd, not {mti!r}")
+        self.bitmap_size = 8 if bitmap == "binary" else 16
+        self.mti_size = _digits_size(mti, 4)
+        self._read_prefix = _NUMBER_READERS[prefix]
+        overrides = self.overrides
+        # field -> (name, prefix bytes or 0, fixed length or max length,
+        #           encoding, decoder, packed, bytes per unit when not packed)
+        self.fields: Dict[int, Tuple[str, int, int, str, Callable[[memoryview, int], str], bool, int]] = {}
+        for number, defn in self.definitions.items():
+            if number == 1:
+                continue
+            if defn.get("type") not in ("fixed", "llvar", "lllvar", "b"):
+                raise ValueError(f"Field {number}: unknown type {defn.get('type')!r}")
+            if number in overrides:
+                encoding = overrides[number]
+            elif number in BINARY_FIELDS or defn["type"] == "b":
+                encoding = binary
+            elif number in NUMERIC_FIELDS:
+                encoding = numeric
+            else:
+                encoding = text
+            digits = _PREFIX_DIGITS.get(defn["type"], 0)
+            prefix_size = (1 if digits == 2 else 2) if prefix in ("bcd", "binary") and digits else digits
+            limit = defn["length"] if digits == 0 else defn["max"]
+            if encoding not in _DECODERS:
+                raise ValueError(f"Unknown encoding {encoding!r} for field {number}")
+            self.fields[number] = (defn["name"], prefix_size, limit, encoding, _DECODERS[encoding],
+                                   encoding == "bcd", 2 if encoding == "hex" else 1)
+
+    def __repr__(self) -> str:
+        return f"Dialect({self.name!r})"
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "description": self.description,
+            **{setting: getattr(self, setting) for setting in _DIALECT_SETTINGS},
+            "fields_defined": len(self.fields),
+            "field_overrides": {str(k): v for k, v in sorted(self.overrides.items())},
+        }
+
+    @classmethod
+    def from_spec(cls, spec: Dict[str, Any], base: Optional["Dialect"] = None) -> "Dialect":
+        """Build a dialect from a data-file spec, starting from `base` when given.
+
+        Field entries are merged over the base definitions, so a spec only
+        lists the fields it adds or changes; an "encoding" key on a field
+        overrides that field's content encoding.
+        """
+        settings = {setting: getattr(base, setting) for setting in _DIALECT_SETTINGS} if base else {}
+        settings.update({setting: spec[setting] for setting in _DIALECT_SETTINGS if setting in spec})
+        definitions = dict(base.definitions if base else FIELD_DEFINITIONS)
+        overrides = dict(base.overrides if base else {})
+        for key, entry in (spec.get("fields") or {}).items():
+            number = int(key)
+            entry = dict(entry)
+            encoding = entry.pop("encoding", None)
+            if encoding:
+                overrides[number] = encoding
+            if entry:
+                definitions[number] = {**definitions.get(number, {"name": f"Field {number}"}), **entry}
+        return cls(spec["name"], overrides=overrides, fields=definitions,
+                   description=spec.get("description", ""), **settings)
+
+
+DIALECTS: Dict[str, Dialect] = {
+    "ascii": Dialect("ascii", bitmap="hex", binary="ascii",
+                     description="The format parse_iso8583 accepts: ASCII throughout, hex bitmaps."),
+    "bcd": Dialect("bcd", mti="bcd", prefix="bcd", numeric="bcd",
+                   description="Generic binary host link: BCD MTI, numerics and lengths, ASCII text."),
+    "ebcdic": Dialect("ebcdic", mti="ebcdic", prefix="ebcdic", numeric="ebcdic", text="ebcdic",
+                      description="Mainframe hosts: EBCDIC characters with binary bitmaps."),
+}
+
+# Network and acquirer layouts live in JSON files, one dialect per file, so a
+# new variant is a data change. ISO8583_DIALECT_DIR adds directories (separated
+# by os.pathsep) on top of the bundled one; a later file replaces an earlier
+# dialect of the same name.
+ISO8583_DIALECT_DIRS = [os.path.join(os.path.dirname(__file__), "..", "data", "iso8583_dialects")] + [
+    path for path in os.getenv("ISO8583_DIALECT_DIR", "").split(os.pathsep) if path
+]
+
+
+def load_dialect_files(directories: List[str]) -> List[str]:
+    """Compile every *.json spec in `directories` into DIALECTS. Returns the names loaded."""
+    specs = []
+    for directory in directories:
+        if not os.path.isdir(directory):
+            continue
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith(".json"):
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                with open(path, encoding="utf-8") as f:
+                    specs.append((path, json.load(f)))
+            except (OSError, ValueError) as e:
+                logger.error("ISO 8583 dialect %s: cannot read: %s", path, e)
+
+    # Specs may build on each other, so keep compiling until no more resolve.
+    loaded = []
+    while specs:
+        remaining = []
+        for path, spec in specs:
+            base_name = spec.get("base")
+            if base_name and base_name not in DIALECTS:
+                remaining.append((path, spec))
+                continue
+            try:
+                DIALECTS[spec["name"]] = Dialect.from_spec(spec, DIALECTS.get(base_name) if base_name else None)
+                loaded.append(spec["name"])
+            except (KeyError, TypeError, ValueError) as e:
+                logger.error("ISO 8583 dialect %s: invalid spec: %s", path, e)
+        if len(remaining) == len(specs):
+            for path, spec in remaining:
+                logger.error("ISO 8583 dialect %s: unknown base dialect %r", path, spec.get("base"))
+            break
+        specs = remaining
+    return loaded
+
+
+def list_dialects() -> Dict[str, Any]:
+    return {
+        "status": "success",
+        "dialects": [DIALECTS[name].describe() for name in sorted(DIALECTS)],
+    }
+
+
+load_dialect_files(ISO8583_DIALECT_DIRS)
+
+
+class ParsedMessage:
+    """Field offsets into the original buffer. Values are decoded on access."""
+
+    __slots__ = ("buffer", "dialect", "mti", "fields_present", "spans")
+
+    def __init__(self, buffer: memoryview, dialect: Dialect, mti: str,
+                 fields_present: List[int], spans: Dict[int, Tuple[int, int, int]]) -> None:
+        self.buffer = buffer
+        self.dialect = dialect
+        self.mti = mti
+        self.fields_present = fields_present
+        # field -> (start, end, length in the field's own units)
+        self.spans = spans
+
+    def __contains__(self, field: int) -> bool:
+        return field in self.spans
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.spans)
+
+    def raw(self, field: int) -> memoryview:
+        start, end, _ = self.spans[field]
+        return self.buffer[start:end]
+
+    def value(self, field: int) -> str:
+        start, end, units = self.spans[field]
+        return self.dialect.fields[field][4](self.buffer[start:end], units)
+
+    def __getitem__(self, field: int) -> str:
+        return self.value(field)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The same response shape parse_iso8583 returns."""
+        mti_info = MTI_DEFINITIONS.get(self.mti, {"name": "Unknown MTI", "direction": "Unknown", "category": "Unknown"})
+        specs = self.dialect.fields
+        buf = self.buffer
+        fields = {}
+        for number, (start, end, units) in self.spans.items():
+            spec = specs[number]
+            fields[number] = {"name": spec[0], "value": spec[4](buf[start:end], units).strip()}
+        return {
+            "status": "success",
+            "mti": self.mti,
+            "mti_name": mti_info["name"],
+            "mti_direction": mti_info["direction"],
+            "mti_category": mti_info["category"],
+            "has_secondary_bitmap": 1 in self.fields_present,
+            "fields_present": self.fields_present,
+            "field_count": len(self.fields_present),
+            "fields": _enrich_fields(fields),
+        }
+
+
+def _read_bitmap(buf: memoryview, pos: int, dialect: Dialect) -> int:
+    end = pos + dialect.bitmap_size
+    if end > len(buf):
+        raise ISO8583Error("Message truncated inside bitmap")
+    if dialect.bitmap == "binary":
+        return int.from_bytes(buf[pos:end], "big")
+    # Hex digits only: int(..., 16) would also take a sign, spaces or "0x".
+    raw = bytes(buf[pos:end])
+    if raw.translate(None, _HEX_DIGITS):
+        raise ISO8583Error(f"Invalid bitmap: {raw!r}")
+    return int(raw, 16)
+
+
+def _bits_set(bitmap: int, first_field: int) -> List[int]:
+    # Highest bit is the lowest field number, so peeling bits off the top
+    # yields fields in ascending order without testing all 64 positions.
+    if not 0 <= bitmap < 1 << 64:
+        raise ISO8583Error("Bitmap must be 64 bits")
+    fields = []
+    while bitmap:
+        top = bitmap.bit_length()
+        fields.append(first_field + 64 - top)
+        bitmap ^= 1 << (top - 1)
+    return fields
+
+
+def _resolve_dialect(dialect: Union[Dialect, str]) -> Dialect:
+    if isinstance(dialect, Dialect):
+        return dialect
+    try:
+        return DIALECTS[dialect]
+    except KeyError:
+        raise ISO8583Error(f"Unknown dialect: {dialect}") from None
+
+
+def parse_message(data: Buffer, dialect: Union[Dialect, str] = "bcd") -> ParsedMessage:
+    """Locate every field of one message. Raises ISO8583Error on malformed input."""
+    dialect = _resolve_dialect(dialect)
+    buf = data if isinstance(data, memoryview) else memoryview(data)
+    size = len(buf)
+
+    pos = dialect.mti_size
+    if pos > size:
+        raise ISO8583Error("Message too short to contain an MTI")
+    mti = _DECODERS[dialect.mti](buf[:pos], 4)
+    if not mti.isdigit():
+        raise ISO8583Error(f"Invalid MTI: {mti}. Must be 4 digits.")
+
+    bitmap = _read_bitmap(buf, pos, dialect)
+    pos += dialect.bitmap_size
+    present = _bits_set(bitmap, 1)
+    if bitmap >> 63:
+        secondary = _read_bitmap(buf, pos, dialect)
+        pos += dialect.bitmap_size
+        present += _bits_set(secondary, 65)
+
+    fields = dialect.fields
+    read_prefix = dialect._read_prefix
+    spans: Dict[int, Tuple[int, int, int]] = {}
+    for number in present:
+        if number == 1:
+            continue
+        spec = fields.get(number)
+        if spec is None:
+            raise ISO8583Error(f"Field {number} is not defined for dialect {dialect.name}")
+        _, prefix_size, units, _, _, packed, scale = spec
+        if prefix_size:
+            end = pos + prefix_size
+            if end > size:
+                raise ISO8583Error(f"Message truncated in length of field {number}")
+            try:
+                length = read_prefix(buf, pos, end)
+            except ValueError:
+                raise ISO8583Error(f"Invalid length prefix for field {number}") from None
+            if length > units:
+                raise ISO8583Error(f"Field {number} length {length} exceeds maximum {units}")
+            units = length
+            pos = end
+        end = pos + ((units + 1) >> 1 if packed else units * scale)
+        if end > size:
+            raise ISO8583Error(f"Message truncated in field {number}")
+        spans[number] = (pos, end, units)
+        pos = end
+
+    return ParsedMessage(buf[:pos], dialect, mti, present, spans)
+
+
+# ---- Encoding ----
+#
+# The inverse of parse_message, driven by the same compiled dialect: values
+# are the strings ParsedMessage.value() returns (digits for bcd, hex for
+# binary), so parse(encode(fields)) gives the fields back.
+
+def _encode_ascii(value: str, units: int) -> bytes:
+    return value.encode("ascii")
+
+
+def _encode_ebcdic(value: str, units: int) -> bytes:
+    return value.encode("cp037")
+
+
+def _encode_bcd(value: str, units: int) -> bytes:
+    if not value.isdigit():
+        raise ValueError("BCD fields must be all digits")
+    return bytes.fromhex(value if units % 2 == 0 else "0" + value)
+
+
+def _encode_binary(value: str, units: int) -> bytes:
+    return bytes.fromhex(value)
+
+
+_ENCODERS: Dict[str, Callable[[str, int], bytes]] = {
+    "ascii": _encode_ascii,
+    "ebcdic": _encode_ebcdic,
+    "bcd": _encode_bcd,
+    "binary": _encode_binary,
+    "hex": _encode_ascii,
+}
+
+
+def _write_number(value: int, size: int, encoding: str) -> bytes:
+    if encoding == "binary":
+        return value.to_bytes(size, "big")
+    if encoding == "bcd":
+        return bytes.fromhex(f"{value:0{size * 2}d}")
+    return _ENCODERS[encoding](f"{value:0{size}d}", size)
+
+
+def _field_units(value: str, encoding: str) -> int:
+    return len(value) // 2 if encoding in ("binary", "hex") else len(value)
+
+
+def encode_message(mti: str, fields: Dict[int, str], dialect: Union[Dialect, str] = "bcd") -> bytes:
+    """Build one message. Fixed fields shorter than their length are padded
+    (zeros on the left for numerics, spaces on the right for text). Raises
+    ISO8583Error when a value does not fit its definition."""
+    dialect = _resolve_dialect(dialect)
+    if len(mti) != 4 or not mti.isdigit():
+        raise ISO8583Error(f"Invalid MTI: {mti}. Must be 4 digits.")
+    numbers = sorted(number for number in fields if number != 1)
+    if numbers and not 2 <= numbers[0] <= numbers[-1] <= 128:
+        raise ISO8583Error("Field numbers must be between 2 and 128")
+    primary = secondary = 0
+    for number in numbers:
+        if number <= 64:
+            primary |= 1 << (64 - number)
+        else:
+            secondary |= 1 << (128 - number)
+    if secondary:
+        primary |= 1 << 63
+
+    parts = [_ENCODERS[dialect.mti](mti, 4)]
+    for bitmap in ((primary, secondary) if secondary else (primary,)):
+        parts.append(bitmap.to_bytes(8, "big") if dialect.bitmap == "binary" else f"{bitmap:016X}".encode("ascii"))
+
+    for number in numbers:
+        spec = dialect.fields.get(number)
+        if spec is None:
+            raise ISO8583Error(f"Field {number} is not defined for dialect {dialect.name}")
+        _, prefix_size, limit, encoding, _, _, _ = spec
+        value = fields[number]
+        if isinstance(value, (bytes, bytearray)):
+            value = value.hex().upper() if encoding in ("binary", "hex") else value.decode("ascii")
+        value = str(value)
+        units = _field_units(value, encoding)
+        if units > limit:
+            raise ISO8583Error(f"Field {number} length {units} exceeds {'maximum ' if prefix_size else ''}{limit}")
+        if not prefix_size and units < limit:
+            if encoding in ("binary", "hex"):
+                value = value.ljust(limit * 2, "0")
+            elif number in NUMERIC_FIELDS:
+                value = value.rjust(limit, "0")
+            else:
+                value = value.ljust(limit)
+            units = limit
+        try:
+            if prefix_size:
+                parts.append(_write_number(units, prefix_size, dialect.prefix))
+            parts.append(_ENCODERS[encoding](value, units))
+        except (ValueError, UnicodeError) as e:
+            raise ISO8583Error(f"Field {number}: cannot encode as {encoding}: {e}") from None
+    return b"".join(parts)
+
+
+def frame_messages(messages: Iterable[bytes], header_size: int = 2, header_encoding: str = "binary") -> bytes:
+    """Join messages into the length-prefixed file format stream_iso8583 reads."""
+    return b"".join(_write_number(len(message), header_size, header_encoding) + message for message in messages)
+
+
+# ---- Length-prefixed message files ----
+#
+# Clearing files are a sequence of [length header][message]. The header is 2 or
+# 4 bytes, either a big-endian binary count or ASCII digits. Only the bytes of
+# the current network chunk plus one partial message are ever held.
+
+ISO8583_MAX_MESSAGE = int(os.getenv("ISO8583_MAX_MESSAGE", "65536"))
+
+
+async def iter_frames(chunks: AsyncIterator[bytes], header_size: int = 2,
+                      header_encoding: str = "binary") -> AsyncIterator[List[bytes]]:
+    """Yield the complete messages found after each chunk. Raises ISO8583Error on bad framing."""
+    if header_size not in (2, 4):
+        raise ISO8583Error("Length header must be 2 or 4 bytes")
+    if header_encoding not in ("binary", "ascii"):
+        raise ISO8583Error("Length header encoding must be binary or ascii")
+    read_length = _NUMBER_READERS[header_encoding]
+    pending = bytearray()
+    async for chunk in chunks:
+        pending += chunk
+        frames = []
+        pos = 0
+        while len(pending) - pos >= header_size:
+            try:
+                length = read_length(memoryview(pending), pos, pos + header_size)
+            except ValueError:
+                raise ISO8583Error(f"Invalid length header {bytes(pending[pos:pos + header_size])!r}") from None
+            if length > ISO8583_MAX_MESSAGE:
+                raise ISO8583Error(f"Message length {length} exceeds maximum {ISO8583_MAX_MESSAGE}")
+            end = pos + header_size + length
+            if end > len(pending):
+                break
+            frames.append(bytes(pending[pos + header_size:end]))
+            pos = end
+        del pending[:pos]
+        if frames:
+            yield frames
+    if pending:
+        raise ISO8583Error(f"File ends inside a message ({len(pending)} trailing bytes)")
+
+
+def _frames_to_ndjson(frames: List[bytes], dialect: Dialect, first_index: int) -> str:
+    lines = []
+    for index, frame in enumerate(frames, first_index):
+        try:
+            result = parse_message(frame, dialect).to_dict()
+        except ISO8583Error as e:
+            result = {"status": "error", "error": str(e)}
+        result["index"] = index
+        lines.append(json.dumps(result))
+    return "\n".join(lines) + "\n"
+
+
+async def stream_iso8583(chunks: AsyncIterator[bytes], header_size: int = 2, header_encoding: str = "binary",
+                         dialect: Union[Dialect, str] = "bcd") -> AsyncIterator[str]:
+    """Parse a length-prefixed message file into NDJSON, one line per message.
+
+    Messages that fail to parse produce an error line and the stream carries
+    on; a framing error ends the stream with a final error line, since the
+    position of the next message is no longer known.
+    """
+    if isinstance(dialect, str):
+        if dialect not in DIALECTS:
+            yield json.dumps({"status": "error", "error": f"Unknown dialect: {dialect}"}) + "\n"
+            return
+        dialect = DIALECTS[dialect]
+    count = 0
+    try:
+        async for frames in iter_frames(chunks, header_size, header_encoding):
+            # Each chunk's worth of messages is parsed off the event loop.
+            yield await asyncio.to_thread(_frames_to_ndjson, frames, dialect, count)
+            count += len(frames)
+    except ISO8583Error as e:
+        yield json.dumps({"status": "error", "error": str(e), "index": count}) + "\n"
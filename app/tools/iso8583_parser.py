@@ -141,39 +141,46 @@ def _parse_bitmap(bitmap_hex: str) -> list:
             bits.append((val >> i) & 1)
     return bits
 
+# FIELD_DEFINITIONS compiled once into (name, length-prefix digits, fixed
+# length) so the per-field loop below does no type dispatch.
+_PREFIX_DIGITS = {"fixed": 0, "llvar": 2, "lllvar": 3, "b": 0}
+
+def _compile_layout(definitions: Dict) -> Dict:
+    layout = {}
+    for field_num, defn in definitions.items():
+        kind = defn["type"]
+        if kind == "fixed":
+            length = defn["length"]
+        elif kind == "b":
+            length = 16
+        else:
+            length = 0
+        layout[field_num] = (defn["name"], _PREFIX_DIGITS.get(kind, 0), length)
+    return layout
+
+_FIELD_LAYOUT = _compile_layout(FIELD_DEFINITIONS)
+
 def _parse_fields(data: str, fields_present: list) -> Dict:
     pos = 0
     parsed = {}
+    layout = _FIELD_LAYOUT
     for field_num in fields_present:
         if field_num == 1:
             continue
-        if field_num not in FIELD_DEFINITIONS:
+        spec = layout.get(field_num)
+        if spec is None:
             parsed[field_num] = {"name": f"Field {field_num}", "value": "Unknown field", "raw": ""}
             continue
-        defn = FIELD_DEFINITIONS[field_num]
+        name, prefix, length = spec
         try:
-            if defn["type"] == "fixed":
-                length = defn["length"]
-                value = data[pos:pos+length]
-                pos += length
-            elif defn["type"] == "llvar":
-                length = int(data[pos:pos+2])
-                pos += 2
-                value = data[pos:pos+length]
-                pos += length
-            elif defn["type"] == "lllvar":
-                length = int(data[pos:pos+3])
-                pos += 3
-                value = data[pos:pos+length]
-                pos += length
-            elif defn["type"] == "b":
-                value = data[pos:pos+16]
-                pos += 16
-            else:
-                value = ""
-            parsed[field_num] = {"name": defn["name"], "value": value.strip()}
+            if prefix:
+                length = int(data[pos:pos+prefix])
+                pos += prefix
+            value = data[pos:pos+length]
+            pos += length
+            parsed[field_num] = {"name": name, "value": value.strip()}
         except Exception:
-            parsed[field_num] = {"name": defn["name"], "value": "parse_error"}
+            parsed[field_num] = {"name": name, "value": "parse_error"}
     return parsed
 
 def _enrich_fields(fields: Dict) -> Dict:
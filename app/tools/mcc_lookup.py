@@ -215,8 +215,11 @@ MCC_DATA: Dict[str, Dict[str, str]] = {
     "9405": {"category": "Intra-Government Purchases", "group": "Government", "restricted": "No"},
 }
 
+def normalize_mcc(mcc_code: str) -> str:
+    return mcc_code.strip().zfill(4)[:4]
+
 def get_mcc_details(mcc_code: str) -> Dict[str, Any]:
-    clean_mcc = mcc_code.strip().zfill(4)[:4]
+    clean_mcc = normalize_mcc(mcc_code)
 
     if not clean_mcc.isdigit():
         return {"status": "error", "error": "MCC must be a 4-digit number", "mcc": mcc_code}
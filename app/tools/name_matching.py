@@ -0,0 +1,324 @@
+from bisect import bisect_right
+from collections import Counter
+import heapq
+from typing import Dict, List, Tuple
+import re
+import unicodedata
+
+# Screening engine shared by the sanctions and PEP checkers.
+#
+# Records are indexed per distinct token (vocabulary), not per record, so the
+# expensive part of a fuzzy search -- Jaro-Winkler against every token -- only
+# runs on the handful of vocabulary entries that share a phonetic key, a
+# vowel-folded skeleton or enough character trigrams with a query token.
+# Postings then map the surviving tokens back to name variants, which are
+# scored with a soft token F1.
+
+MIN_TOKEN_SIMILARITY = 0.84
+MIN_FUZZY_TOKEN_LENGTH = 4
+MIN_GRAM_OVERLAP = 0.5
+MAX_FUZZY_CANDIDATES = 200
+CONTAINS_BONUS = 15
+MAX_MATCH_LIMIT = 50
+# Similarity of vowel-folded forms is discounted so an exact fold (Mohamed /
+# Muhammad, Hussein / Husayn) lands above the cut-off but below true typos.
+FOLDED_SIMILARITY_WEIGHT = 0.9
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+_SOUNDEX_CODES = {}
+for _letters, _digit in (("bfpv", "1"), ("cgjkqsxz", "2"), ("dt", "3"), ("l", "4"), ("mn", "5"), ("r", "6")):
+    for _c in _letters:
+        _SOUNDEX_CODES[_c] = _digit
+
+
+def normalize_name(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    ascii_only = "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+    return " ".join(_NON_ALNUM.sub(" ", ascii_only).split())
+
+
+def phonetic_key(token: str) -> str:
+    """Soundex-style consonant skeleton, kept at full length to keep buckets small."""
+    if not token or not token[0].isalpha():
+        return token
+    key = token[0]
+    last = _SOUNDEX_CODES.get(token[0], "")
+    for c in token[1:]:
+        code = _SOUNDEX_CODES.get(c, "")
+        if code and code != last:
+            key += code
+        # h and w do not separate letters with the same code; vowels do
+        if c not in "hw":
+            last = code
+    return key
+
+
+def fold_vowels(token: str) -> str:
+    """Collapse transliteration noise: vowels (and non-initial y) to 'a', doubled letters to one."""
+    out = []
+    for i, c in enumerate(token):
+        if c in "aeiou" or (c == "y" and i):
+            c = "a"
+        if not out or out[-1] != c:
+            out.append(c)
+    return "".join(out)
+
+
+def _trigrams(token: str) -> set:
+    padded = f"${token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def jaro_winkler(a: str, b: str) -> float:
+    if a == b:
+        return 1.0
+    la, lb = len(a), len(b)
+    if not la or not lb:
+        return 0.0
+    window = max(la, lb) // 2 - 1
+    if window < 0:
+        window = 0
+    a_flags = [False] * la
+    b_flags = [False] * lb
+    matches = 0
+    for i, ca in enumerate(a):
+        lo = max(0, i - window)
+        hi = min(lb, i + window + 1)
+        for j in range(lo, hi):
+            if not b_flags[j] and b[j] == ca:
+                a_flags[i] = b_flags[j] = True
+                matches += 1
+                break
+    if not matches:
+        return 0.0
+    transpositions = 0
+    j = 0
+    for i in range(la):
+        if a_flags[i]:
+            while not b_flags[j]:
+                j += 1
+            if a[i] != b[j]:
+                transpositions += 1
+            j += 1
+    m = float(matches)
+    jaro = (m / la + m / lb + (m - transpositions / 2) / m) / 3
+    prefix = 0
+    for ca, cb in zip(a[:4], b[:4]):
+        if ca != cb:
+            break
+        prefix += 1
+    return jaro + prefix * 0.1 * (1 - jaro)
+
+
+class NameIndex:
+    """Token, phonetic-key and trigram index over screening list names.
+
+    Records are added in list order and identified by their position, so the
+    caller's record list and the index stay aligned. Call finalize() once all
+    records are added; search() does it lazily otherwise.
+
+    Callers that reload their list swap records and index together as one
+    (records, index) tuple, so a screen running on a pool thread never pairs
+    an index with the wrong record list.
+    """
+
+    def __init__(self) -> None:
+        self.record_count = 0
+        self._vocab: Dict[str, int] = {}
+        self._tokens: List[str] = []
+        self._folded: List[str] = []
+        self._postings: List[List[int]] = []
+        self._phonetic: Dict[str, List[int]] = {}
+        self._by_fold: Dict[str, List[int]] = {}
+        self._grams: Dict[str, List[int]] = {}
+        self._variant_record: List[int] = []
+        self._variant_tokens: List[Tuple[int, ...]] = []
+        self._variant_size: List[int] = []
+        self._finalized = False
+
+    def __len__(self) -> int:
+        return self.record_count
+
+    def _token_id(self, token: str) -> int:
+        tid = self._vocab.get(token)
+        if tid is None:
+            tid = len(self._tokens)
+            self._vocab[token] = tid
+            self._tokens.append(token)
+            folded = fold_vowels(token)
+            self._folded.append(folded)
+            self._by_fold.setdefault(folded, []).append(tid)
+            self._postings.append([])
+            self._phonetic.setdefault(phonetic_key(token), []).append(tid)
+            if len(token) >= MIN_FUZZY_TOKEN_LENGTH:
+                for gram in _trigrams(token):
+                    self._grams.setdefault(gram, []).append(tid)
+        return tid
+
+    def add(self, name: str, aliases: str = "") -> int:
+        record_id = self.record_count
+        self.record_count += 1
+        self._finalized = False
+        seen = set()
+        for variant in [name] + aliases.split(";"):
+            tokens = set(normalize_name(variant).split())
+            key = frozenset(tokens)
+            if not tokens or key in seen:
+                continue
+            seen.add(key)
+            variant_id = len(self._variant_record)
+            self._variant_record.append(record_id)
+            token_ids = tuple(self._token_id(token) for token in tokens)
+            self._variant_tokens.append(token_ids)
+            self._variant_size.append(len(token_ids))
+            for tid in token_ids:
+                self._postings[tid].append(variant_id)
+        return record_id
+
+    def finalize(self) -> "NameIndex":
+        # Postings ordered by variant size let search() read only the short
+        # variants of a common token when longer ones cannot reach threshold.
+        size = self._variant_size.__getitem__
+        for postings in self._postings:
+            postings.sort(key=size)
+        self._finalized = True
+        return self
+
+    def _similar_tokens(self, token: str) -> Dict[int, float]:
+        sims: Dict[int, float] = {}
+        exact = self._vocab.get(token)
+        if exact is not None:
+            sims[exact] = 1.0
+        if len(token) < MIN_FUZZY_TOKEN_LENGTH:
+            return sims
+        grams = _trigrams(token)
+        needed = max(2, int(len(grams) * MIN_GRAM_OVERLAP))
+        # Count filtering: a token sharing `needed` of the query's G trigrams
+        # shares at least one of its G - needed + 1 rarest, so only those
+        # postings generate candidates; the common trigrams are checked as
+        # substrings of the candidates instead of walking their postings.
+        gram_postings = sorted(((self._grams.get(g, ()), g) for g in grams), key=lambda p: len(p[0]))
+        prefix = len(gram_postings) - needed + 1
+        shared: Counter = Counter()
+        for postings, _ in gram_postings[:prefix]:
+            shared.update(postings)
+        if prefix < len(gram_postings) and shared:
+            padded = {tid: f"${self._tokens[tid]}$" for tid in shared}
+            for _, gram in gram_postings[prefix:]:
+                for tid, text in padded.items():
+                    if gram in text:
+                        shared[tid] += 1
+        # A shared phonetic key counts as meeting the trigram bar on its own.
+        for tid in self._phonetic.get(phonetic_key(token), ()):
+            shared[tid] += needed
+        shared.pop(exact, None)
+        candidates = [tid for tid, count in shared.items() if count >= needed]
+        if len(candidates) > MAX_FUZZY_CANDIDATES:
+            candidates.sort(key=shared.__getitem__, reverse=True)
+            del candidates[MAX_FUZZY_CANDIDATES:]
+        # Tokens that fold to the same skeleton are always compared.
+        folded = fold_vowels(token)
+        candidates = set(candidates)
+        candidates.update(self._by_fold.get(folded, ()))
+        candidates.discard(exact)
+        tokens = self._tokens
+        for tid in candidates:
+            candidate = tokens[tid]
+            if len(candidate) < MIN_FUZZY_TOKEN_LENGTH:
+                continue
+            sim = jaro_winkler(token, candidate)
+            if sim < MIN_TOKEN_SIMILARITY:
+                sim = FOLDED_SIMILARITY_WEIGHT * jaro_winkler(folded, self._folded[tid])
+            if sim >= MIN_TOKEN_SIMILARITY:
+                sims[tid] = sim
+        return sims
+
+    def _max_variant_size(self, skipped: int, n_query: int, threshold: int) -> float:
+        # A variant matched by none of the generating tokens overlaps the
+        # query on at most `skipped` tokens, so its F1 is at most
+        # 2k / (n + max(s, k)). Only the bonus for matching every query token
+        # can lift it further.
+        if skipped == n_query:
+            threshold -= CONTAINS_BONUS
+        if threshold <= 0:
+            return float("inf")
+        limit = 200 * skipped / threshold - n_query
+        return limit if limit >= skipped else 0
+
+    def search(self, query: str, threshold: int = 60) -> List[Tuple[int, int]]:
+        """Return (record_id, score) for every record scoring >= threshold."""
+        q_tokens = set(normalize_name(query).split())
+        if not q_tokens:
+            return []
+        if not self._finalized:
+            self.finalize()
+        n_query = len(q_tokens)
+        postings = self._postings
+        size = self._variant_size
+        token_sims = [self._similar_tokens(token) for token in q_tokens]
+        costs = [sum(len(postings[tid]) for tid in sims) for sims in token_sims]
+        order = sorted(range(n_query), key=costs.__getitem__, reverse=True)
+        token_sims = [token_sims[i] for i in order]
+        costs = [costs[i] for i in order]
+
+        # The k most common query tokens only contribute candidates among
+        # variants short enough to still reach threshold; pick the k that
+        # reads the fewest postings.
+        best_cost, skip, max_size = sum(costs), 0, float("inf")
+        for k in range(1, n_query + 1):
+            limit = self._max_variant_size(k, n_query, threshold)
+            cost = sum(costs[k:])
+            for sims in token_sims[:k]:
+                for tid in sims:
+                    cost += bisect_right(postings[tid], limit, key=size.__getitem__)
+            if cost < best_cost:
+                best_cost, skip, max_size = cost, k, limit
+
+        soft: Dict[int, float] = {}
+        exact: Dict[int, int] = {}
+        for sims in token_sims[skip:]:
+            best: Dict[int, float] = {}
+            for tid, sim in sims.items():
+                for variant_id in postings[tid]:
+                    if sim > best.get(variant_id, 0.0):
+                        best[variant_id] = sim
+            for variant_id, sim in best.items():
+                soft[variant_id] = soft.get(variant_id, 0.0) + sim
+                if sim == 1.0:
+                    exact[variant_id] = exact.get(variant_id, 0) + 1
+        for sims in token_sims[:skip]:
+            for tid in sims:
+                tid_postings = postings[tid]
+                end = bisect_right(tid_postings, max_size, key=size.__getitem__)
+                for variant_id in tid_postings[:end]:
+                    soft.setdefault(variant_id, 0.0)
+        variant_tokens = self._variant_tokens
+        for sims in token_sims[:skip]:
+            for variant_id in soft:
+                sim = max(sims.get(tid, 0.0) for tid in variant_tokens[variant_id])
+                if sim:
+                    soft[variant_id] += sim
+                    if sim == 1.0:
+                        exact[variant_id] = exact.get(variant_id, 0) + 1
+
+        scores: Dict[int, int] = {}
+        for variant_id, overlap in soft.items():
+            if not overlap:
+                continue
+            precision = overlap / n_query
+            recall = min(1.0, overlap / size[variant_id])
+            f1 = 2 * precision * recall / (precision + recall)
+            bonus = CONTAINS_BONUS if exact.get(variant_id, 0) == n_query else 0
+            score = min(100, int(f1 * 100) + bonus)
+            if score < threshold:
+                continue
+            record_id = self._variant_record[variant_id]
+            if score > scores.get(record_id, -1):
+                scores[record_id] = score
+        return list(scores.items())
+
+    def top(self, query: str, threshold: int = 60, k: int = 5) -> Tuple[int, List[Tuple[int, int]]]:
+        """Return (total hits, best k (record_id, score) by score, then list order)."""
+        scores = self.search(query, threshold)
+        return len(scores), heapq.nlargest(k, scores, key=lambda hit: (hit[1], -hit[0]))
@@ -1,8 +1,16 @@
-﻿from typing import Dict, Any, Optional
-from app.tools.bin_lookup import get_bin_details
+﻿from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+import asyncio
+import csv
+import functools
+import json
+import math
+import operator
+import os
+
+from app.tools.bin_lookup import bins_loaded, get_bin_details, load_bins
 from app.tools.decline_codes import interpret_decline_code
 from app.tools.mcc_lookup import get_mcc_details
-from app.tools.fraud_score import calculate_fraud_score
+from app.tools.fraud_score import calculate_fraud_score, load_fraud_rules
 
 RETRY_MATRIX = {
     "do_not_retry": {
@@ -47,21 +55,34 @@ HIGH_RISK_MCC = {
     "5962": "Direct Marketing",
 }
 
-def get_retry_strategy(decline_code: str) -> Dict[str, Any]:
+DEFAULT_RETRY = {
+    "strategy": "retry_later",
+    "retry_window_minutes": 60,
+    "retry_probability_pct": 40,
+    "retry_advice": "Unknown decline code. Wait 60 minutes before retrying."
+}
+
+
+def _build_retry_index() -> Dict[str, Dict[str, Any]]:
+    # Upper-cased code -> strategy; a code listed under two strategies keeps
+    # the first, as the old linear scan did.
+    index: Dict[str, Dict[str, Any]] = {}
     for strategy, data in RETRY_MATRIX.items():
-        if decline_code.upper() in [c.upper() for c in data["codes"]]:
-            return {
-                "strategy": strategy,
-                "retry_window_minutes": data["window_minutes"],
-                "retry_probability_pct": data["probability"],
-                "retry_advice": data["advice"]
-            }
-    return {
-        "strategy": "retry_later",
-        "retry_window_minutes": 60,
-        "retry_probability_pct": 40,
-        "retry_advice": "Unknown decline code. Wait 60 minutes before retrying."
-    }
+        result = {
+            "strategy": strategy,
+            "retry_window_minutes": data["window_minutes"],
+            "retry_probability_pct": data["probability"],
+            "retry_advice": data["advice"]
+        }
+        for code in data["codes"]:
+            index.setdefault(code.upper(), result)
+    return index
+
+
+RETRY_BY_CODE = _build_retry_index()
+
+def get_retry_strategy(decline_code: str) -> Dict[str, Any]:
+    return dict(RETRY_BY_CODE.get(decline_code.upper(), DEFAULT_RETRY))
 
 def get_amount_risk(amount: float, mcc: str) -> Dict[str, Any]:
     risk_flags = []
@@ -94,79 +115,385 @@ def build_recommendation(
         return "RETRY WITH CAUTION: Moderate retry probability. Monitor for fraud patterns."
     return "HOLD: Low retry probability. Wait for cardholder to resolve with their bank."
 
-async def analyze_payment(
-    card_bin: str,
-    decline_code: str,
-    merchant_mcc: str,
-    transaction_amount: float,
-    country_code: str = "US",
-    card_type: str = "credit",
-    network: str = "Visa"
-) -> Dict[str, Any]:
+# Sub-lookups are pure functions of their inputs (BIN results of the table
+# version too, fraud scores of the rules version), and decline files repeat the same BINs, codes and MCCs
+# heavily, so each is memoised. Cached dicts are shared; nothing below
+# mutates them.
+PAYMENT_MEMO_SIZE = int(os.getenv("PAYMENT_MEMO_SIZE", "65536"))
+
+
+@functools.lru_cache(maxsize=PAYMENT_MEMO_SIZE)
+def _bin_lookup(version: str, card_bin: str) -> Dict[str, Any]:
+    return get_bin_details(card_bin)
+
+
+_decline_lookup = functools.lru_cache(maxsize=PAYMENT_MEMO_SIZE)(interpret_decline_code)
+_mcc_lookup = functools.lru_cache(maxsize=PAYMENT_MEMO_SIZE)(get_mcc_details)
+
 
-    # Pull from existing tools
-    bin_data = get_bin_details(card_bin) if card_bin else {}
-    decline_data = interpret_decline_code(decline_code) if decline_code else {}
-    mcc_data = get_mcc_details(merchant_mcc) if merchant_mcc else {}
+@functools.lru_cache(maxsize=PAYMENT_MEMO_SIZE)
+def _fraud_lookup(rules_version: str, card_type: str, network: str, country_code: str,
+                  is_commercial: bool, is_anonymous: bool) -> Dict[str, Any]:
+    return calculate_fraud_score(card_type, network, country_code, is_commercial, is_anonymous)
+
+
+def _versions() -> Tuple[str, str]:
+    """(BIN table version, fraud rules version) that card sections are keyed on."""
+    return load_bins().version, load_fraud_rules().version
+
+
+# The response is built from sections that each depend on only some of the
+# inputs, so each section is memoised on just those.
+@functools.lru_cache(maxsize=PAYMENT_MEMO_SIZE)
+def _card_sections(versions: Tuple[str, str], card_bin: str, country_code: str, card_type: str,
+                   network: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """The "card" and "fraud" sections."""
+    bin_version, rules_version = versions
+    bin_data = _bin_lookup(bin_version, card_bin) if card_bin else {}
 
     # Use BIN data if available
     resolved_card_type = bin_data.get("card_type", card_type) or card_type
     resolved_network = bin_data.get("network", network) or network
     resolved_country = bin_data.get("country_code", country_code) or country_code
 
-    fraud_data = calculate_fraud_score(
-        card_type=resolved_card_type,
-        network=resolved_network,
-        country_code=resolved_country,
-        is_commercial=bin_data.get("is_commercial", False),
-        is_anonymous=False
-    )
+    fraud_data = _fraud_lookup(rules_version, resolved_card_type, resolved_network, resolved_country,
+                               bin_data.get("is_commercial", False), False)
+    card = {
+        "bin": card_bin,
+        "network": resolved_network,
+        "card_type": resolved_card_type,
+        "issuing_country": resolved_country,
+        "bank": bin_data.get("bank_name", "Unknown")
+    }
+    fraud = {
+        "score": fraud_data["fraud_score"],
+        "risk_level": fraud_data["risk_level"],
+        "risk_factors": fraud_data["risk_factors"],
+        "rules_version": fraud_data["rules_version"]
+    }
+    return card, fraud
+
+
+@functools.lru_cache(maxsize=PAYMENT_MEMO_SIZE)
+def _decline_sections(decline_code: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """The "retry" and "decline" sections."""
+    decline_data = _decline_lookup(decline_code) if decline_code else {}
+    retry = RETRY_BY_CODE.get(decline_code.upper(), DEFAULT_RETRY)
+    return {
+        "strategy": retry["strategy"],
+        "probability_pct": retry["retry_probability_pct"],
+        "window_minutes": retry["retry_window_minutes"],
+        "advice": retry["retry_advice"]
+    }, {
+        "code": decline_code,
+        "meaning": decline_data.get("meaning", "Unknown"),
+        "category": decline_data.get("category", "Unknown"),
+        "retryable": decline_data.get("retryable", "Unknown")
+    }
+
 
-    retry = get_retry_strategy(decline_code)
+@functools.lru_cache(maxsize=PAYMENT_MEMO_SIZE)
+def _merchant_section(merchant_mcc: str) -> Dict[str, Any]:
+    mcc_data = _mcc_lookup(merchant_mcc) if merchant_mcc else {}
+    return {
+        "mcc": merchant_mcc,
+        "category": mcc_data.get("description", "Unknown"),
+        "high_risk": merchant_mcc in HIGH_RISK_MCC
+    }
+
+
+DATA_SOURCES = ["Internal BIN DB", "OFAC Logic", "IRS Prefix Rules", "Payments Domain Intelligence"]
+
+
+def _analyze(
+    card_bin: str,
+    decline_code: str,
+    merchant_mcc: str,
+    transaction_amount: float,
+    country_code: str,
+    card_type: str,
+    network: str,
+) -> Dict[str, Any]:
+    card, fraud = _card_sections(_versions(), card_bin, country_code, card_type, network)
+    retry, decline = _decline_sections(decline_code)
     amount_risk = get_amount_risk(transaction_amount, merchant_mcc)
     recommendation = build_recommendation(
         retry["strategy"],
-        fraud_data["risk_level"],
-        retry["retry_probability_pct"],
+        fraud["risk_level"],
+        retry["probability_pct"],
         amount_risk["amount_risk_flags"]
     )
-
+    # Sections are shared with the memo, so callers get copies.
     return {
         "status": "success",
         "recommendation": recommendation,
-        "retry": {
-            "strategy": retry["strategy"],
-            "probability_pct": retry["retry_probability_pct"],
-            "window_minutes": retry["retry_window_minutes"],
-            "advice": retry["retry_advice"]
-        },
-        "fraud": {
-            "score": fraud_data["fraud_score"],
-            "risk_level": fraud_data["risk_level"],
-            "risk_factors": fraud_data["risk_factors"]
-        },
-        "decline": {
-            "code": decline_code,
-            "meaning": decline_data.get("meaning", "Unknown"),
-            "category": decline_data.get("category", "Unknown"),
-            "retryable": decline_data.get("retryable", "Unknown")
-        },
-        "card": {
-            "bin": card_bin,
-            "network": resolved_network,
-            "card_type": resolved_card_type,
-            "issuing_country": resolved_country,
-            "bank": bin_data.get("bank_name", "Unknown")
-        },
-        "merchant": {
-            "mcc": merchant_mcc,
-            "category": mcc_data.get("description", "Unknown"),
-            "high_risk": amount_risk["high_risk_mcc"]
-        },
+        "retry": dict(retry),
+        "fraud": {**fraud, "risk_factors": list(fraud["risk_factors"])},
+        "decline": dict(decline),
+        "card": dict(card),
+        "merchant": dict(_merchant_section(merchant_mcc)),
         "transaction": {
             "amount": transaction_amount,
             "risk_flags": amount_risk["amount_risk_flags"]
         },
-        "data_sources": ["Internal BIN DB", "OFAC Logic", "IRS Prefix Rules", "Payments Domain Intelligence"]
+        "data_sources": list(DATA_SOURCES)
+    }
+
+
+def get_memo_stats() -> Dict[str, Any]:
+    # The batch JSON fragment caches are defined below; looked up at call time.
+    return {
+        "status": "success",
+        "memo_size": PAYMENT_MEMO_SIZE,
+        "caches": {
+            name: cache.cache_info()._asdict()
+            for name, cache in (
+                ("bin", _bin_lookup), ("decline", _decline_lookup), ("mcc", _mcc_lookup), ("fraud", _fraud_lookup),
+                ("card_sections", _card_sections), ("decline_sections", _decline_sections),
+                ("merchant_section", _merchant_section), ("card_json", _card_json), ("decline_json", _decline_json),
+                ("merchant_json", _merchant_json), ("flags_json", _flags_json),
+                ("recommendation_json", _recommendation_json),
+            )
+        },
     }
 
+
+async def analyze_payment(
+    card_bin: str,
+    decline_code: str,
+    merchant_mcc: str,
+    transaction_amount: float,
+    country_code: str = "US",
+    card_type: str = "credit",
+    network: str = "Visa"
+) -> Dict[str, Any]:
+    # Every enrichment is an in-memory table lookup; only a first BIN table
+    # load touches the disk, so that is done off the event loop.
+    if not bins_loaded():
+        await asyncio.to_thread(load_bins)
+    return _analyze(card_bin, decline_code, merchant_mcc, transaction_amount, country_code, card_type, network)
+
+
+# Batch mode for decline files: CSV with a header row, or NDJSON, using the
+# GET endpoint's parameter names as columns/keys (plus an optional "id" that
+# is echoed back). Rows are analysed as they arrive and answered as NDJSON,
+# one line per row in input order.
+#
+# Files repeat the same BINs, decline codes and MCCs, so rather than building
+# and serialising a response per row, each section's JSON is cached on the
+# inputs it depends on (the card profile, the decline code, the MCC, the
+# amount band) and a row's line is spliced together from those fragments.
+# The output is byte-for-byte what json.dumps gives for the GET response.
+PAYMENT_BATCH_MAX = int(os.getenv("PAYMENT_BATCH_MAX", "2000000"))
+
+BATCH_FIELDS = ("card_bin", "decline_code", "merchant_mcc", "transaction_amount", "country_code", "card_type", "network")
+BATCH_DEFAULTS = {"card_bin": "", "decline_code": "", "merchant_mcc": "", "country_code": "US", "card_type": "credit", "network": "Visa"}
+# One amount per band get_amount_risk distinguishes: < 1, normal, > 5000.
+_BAND_AMOUNTS = (0.5, 100.0, 10000.0)
+_DATA_SOURCES_JSON = json.dumps(DATA_SOURCES)
+
+
+def _amount_band(amount: float) -> int:
+    return 0 if amount < 1.00 else 2 if amount > 5000 else 1
+
+
+@functools.lru_cache(maxsize=PAYMENT_MEMO_SIZE)
+def _card_json(versions: Tuple[str, str], card_bin: str, country_code: str, card_type: str,
+               network: str) -> Tuple[str, str, str]:
+    card, fraud = _card_sections(versions, card_bin, country_code, card_type, network)
+    return fraud["risk_level"], json.dumps(fraud), json.dumps(card)
+
+
+@functools.lru_cache(maxsize=PAYMENT_MEMO_SIZE)
+def _decline_json(decline_code: str) -> Tuple[str, int, str, str]:
+    retry, decline = _decline_sections(decline_code)
+    return retry["strategy"], retry["probability_pct"], json.dumps(retry), json.dumps(decline)
+
+
+@functools.lru_cache(maxsize=PAYMENT_MEMO_SIZE)
+def _merchant_json(merchant_mcc: str) -> str:
+    return json.dumps(_merchant_section(merchant_mcc))
+
+
+@functools.lru_cache(maxsize=PAYMENT_MEMO_SIZE)
+def _flags_json(band: int, merchant_mcc: str) -> Tuple[List[str], str]:
+    flags = get_amount_risk(_BAND_AMOUNTS[band], merchant_mcc)["amount_risk_flags"]
+    return flags, json.dumps(flags)
+
+
+@functools.lru_cache(maxsize=PAYMENT_MEMO_SIZE)
+def _recommendation_json(strategy: str, risk_level: str, probability: int, band: int, merchant_mcc: str) -> str:
+    return json.dumps(build_recommendation(strategy, risk_level, probability, _flags_json(band, merchant_mcc)[0]))
+
+
+class PaymentBatch:
+    """Turns decline-file lines into NDJSON. feed() is called with successive
+    groups of newline-terminated lines and keeps the format, header and row
+    count. A bad CSV header, a malformed CSV row or too many rows ends the
+    batch with a final error line and sets `finished`."""
+
+    def __init__(self) -> None:
+        self.format: Optional[str] = None
+        self.count = 0
+        self.width = 0
+        self.tail: List[str] = []
+        self.getter: Optional[Callable[[List[str]], tuple]] = None
+        self.finished = False
+        # CSV lines held back until the quotes seen so far balance, so a quoted
+        # field spanning lines or chunks reaches csv.reader in one piece (as
+        # in sanctions_checker._iter_csv_rows).
+        self._pending: List[str] = []
+        self._pending_size = 0
+        self._quotes = 0
+
+    def _header(self, values: List[str]) -> None:
+        columns = [c.strip().lower() for c in values]
+        if "transaction_amount" not in columns:
+            raise ValueError("CSV header must include transaction_amount")
+        # Rows are padded to the header's width and followed by the defaults
+        # of absent columns, so one itemgetter pulls out every field.
+        self.width = len(columns)
+        missing = [f for f in BATCH_FIELDS if f not in columns]
+        self.tail = [BATCH_DEFAULTS[f] for f in missing]
+        positions = [columns.index(f) if f in columns else self.width + missing.index(f) for f in BATCH_FIELDS]
+        id_position = columns.index("id") if "id" in columns else self.width + len(missing)
+        self.tail.append("")
+        self.getter = operator.itemgetter(id_position, *positions)
+
+    def _complete_lines(self, lines: List[str], final: bool) -> List[str]:
+        """CSV lines up to the last one that ends a record; the rest wait for more."""
+        pending = self._pending
+        complete = 0
+        for line in lines:
+            pending.append(line)
+            self._pending_size += len(line)
+            self._quotes += line.count('"')
+            if not self._quotes & 1:
+                complete = len(pending)
+        if final:
+            complete = len(pending)
+        ready = pending[:complete]
+        del pending[:complete]
+        self._quotes &= 1
+        self._pending_size = sum(map(len, pending))
+        if self._pending_size > csv.field_size_limit():
+            raise csv.Error(f"field larger than field limit ({csv.field_size_limit()})")
+        return ready
+
+    def _rows(self, lines: List[str]) -> Iterator[Any]:
+        """(id, fields in BATCH_FIELDS order) per row, or the ValueError for it."""
+        if self.format == "csv":
+            for values in csv.reader(lines):
+                if not values or (len(values) == 1 and not values[0].strip()):
+                    continue
+                if self.getter is None:
+                    self._header(values)
+                    continue
+                width = self.width
+                if len(values) != width:
+                    values = (values + [""] * width)[:width]
+                id_, *fields = map(str.strip, self.getter(values + self.tail))
+                yield id_, fields
+            return
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield ValueError(f"Invalid JSON: {e}")
+                continue
+            if not isinstance(row, dict):
+                yield ValueError("Expected a JSON object")
+                continue
+            fields = [str(row[f]).strip() if row.get(f) is not None else BATCH_DEFAULTS.get(f, "") for f in BATCH_FIELDS]
+            yield row.get("id"), fields
+
+    def feed(self, lines: List[str], final: bool = False) -> str:
+        """NDJSON for the rows the lines complete; final=True flushes held lines."""
+        if self.finished:
+            return ""
+        if self.format is None:
+            first = next((i for i, line in enumerate(lines) if line.strip()), None)
+            if first is None:
+                return ""
+            lines = list(lines)
+            lines[first] = lines[first].lstrip("\ufeff")
+            self.format = "ndjson" if lines[first].startswith("{") else "csv"
+        # One BIN table and rules version per chunk, like lookup_bins.
+        versions = _versions()
+        out = []
+        try:
+            if self.format == "csv":
+                lines = self._complete_lines(lines, final)
+            for row in self._rows(lines):
+                if self.count >= PAYMENT_BATCH_MAX:
+                    raise ValueError(f"At most {PAYMENT_BATCH_MAX} rows per file")
+                index = self.count
+                self.count += 1
+                if isinstance(row, ValueError):
+                    out.append(f'{{"index": {index}, ' + json.dumps({"status": "error", "error": str(row)})[1:])
+                    continue
+                id_, (card_bin, decline_code, merchant_mcc, amount, country_code, card_type, network) = row
+                head = f'{{"index": {index}, "id": {json.dumps(id_)}, ' if id_ not in (None, "") else f'{{"index": {index}, '
+                try:
+                    amount = float(amount)
+                    if not math.isfinite(amount):
+                        raise ValueError("transaction_amount must be a finite number")
+                except ValueError as e:
+                    out.append(head + json.dumps({"status": "error", "error": str(e)})[1:])
+                    continue
+                band = _amount_band(amount)
+                risk_level, fraud, card = _card_json(versions, card_bin, country_code, card_type, network)
+                strategy, probability, retry, decline = _decline_json(decline_code)
+                out.append("".join((
+                    head, '"status": "success", "recommendation": ',
+                    _recommendation_json(strategy, risk_level, probability, band, merchant_mcc),
+                    ', "retry": ', retry, ', "fraud": ', fraud, ', "decline": ', decline, ', "card": ', card,
+                    ', "merchant": ', _merchant_json(merchant_mcc), ', "transaction": {"amount": ', repr(amount),
+                    ', "risk_flags": ', _flags_json(band, merchant_mcc)[1], '}, "data_sources": ', _DATA_SOURCES_JSON, "}",
+                )))
+        except (ValueError, csv.Error) as e:
+            # Rows already analysed still go out, followed by the error; its
+            # index is the first row that wasn't analysed.
+            self.finished = True
+            out.append(json.dumps({"status": "error", "error": str(e), "index": self.count}))
+        return "\n".join(out) + "\n" if out else ""
+
+
+async def _iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[List[str]]:
+    # Lines keep their "\n" (and any "\r") for csv.reader; the file's last
+    # line may have neither.
+    pending = bytearray()
+    async for chunk in chunks:
+        pending += chunk
+        cut = pending.rfind(b"\n")
+        if cut == -1:
+            continue
+        text = pending[:cut].decode("utf-8", errors="replace")
+        del pending[:cut + 1]
+        yield [line + "\n" for line in text.split("\n")]
+    if pending:
+        yield [pending.decode("utf-8", errors="replace")]
+
+
+async def stream_payment_batch(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Analyse a CSV or NDJSON decline file into NDJSON, one line per row.
+
+    Rows with a bad amount or unparseable JSON produce an error line and the
+    stream carries on; a bad CSV header, a malformed CSV row or too many rows
+    ends it with a final error line.
+    """
+    batch = PaymentBatch()
+    if not bins_loaded():
+        await asyncio.to_thread(load_bins)
+    async for lines in _iter_lines(chunks):
+        # Each network chunk's worth of rows is analysed off the event loop.
+        text = await asyncio.to_thread(batch.feed, lines)
+        if text:
+            yield text
+        if batch.finished:
+            return
+    text = batch.feed([], final=True)
+    if text:
+        yield text
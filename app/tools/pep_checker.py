@@ -1,22 +1,49 @@
-﻿from typing import Dict, Any, List
+﻿from typing import Dict, Any, List, Optional, Tuple
+import asyncio
 import csv
+import logging
 import os
+import time
+from app.tools.cache import TTLCache
+from app.tools.name_matching import MAX_MATCH_LIMIT, NameIndex, normalize_name
+from app.tools.screening_pool import SCREENING_POOL
 
 PEP_FILE = os.path.join(os.path.dirname(__file__), "..", "..", "app", "data", "peps.csv")
+# Seconds between checks of peps.csv for changes. Checks and rebuilds run on a
+# worker thread while screens keep using the list already loaded.
+PEP_RECHECK_INTERVAL = float(os.getenv("PEP_RECHECK_INTERVAL", "60"))
 
-_PEP_CACHE: List[Dict] = []
+logger = logging.getLogger(__name__)
 
-def _load_pep_list() -> List[Dict]:
-    global _PEP_CACHE
-    if _PEP_CACHE:
-        return _PEP_CACHE
-    records = []
+# (records, index) snapshot, replaced as a whole; see NameIndex.
+_PEP_CACHE: Tuple[List[Dict], NameIndex] = ([], NameIndex())
+_PEP_VERSION: str = ""
+_CHECKED_AT = float("-inf")
+# The one check/rebuild in flight; screens that need the list wait for it.
+_LOADING: Optional["asyncio.Task[None]"] = None
+
+# Screening results keyed by (normalised name, threshold, limit, file version);
+# the list is reloaded and the cache cleared whenever peps.csv changes on disk.
+_RESULT_CACHE = TTLCache(
+    maxsize=int(os.getenv("SCREENING_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("SCREENING_CACHE_TTL", "3600")),
+)
+
+def _read_pep_list(current_version: str) -> Optional[Tuple[List[Dict], NameIndex, str]]:
+    """Parse peps.csv and build its index, or None if it hasn't changed."""
     filepath = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "peps.csv"))
+    st = os.stat(filepath)
+    version = f"{st.st_mtime_ns:x}-{st.st_size:x}"
+    if version == current_version:
+        return None
+    records = []
+    index = NameIndex()
     with open(filepath, encoding="utf-8", errors="replace") as f:
         reader = csv.DictReader(f)
         for row in reader:
             name = row.get("name", "").strip()
             if name:
+                index.add(name, row.get("aliases", ""))
                 records.append({
                     "name": name.lower(),
                     "display_name": name,
@@ -24,65 +51,90 @@ def _load_pep_list() -> List[Dict]:
                     "positions": row.get("position", ""),
                     "countries": row.get("countries", ""),
                 })
-    _PEP_CACHE = records
-    return records
+    return records, index.finalize(), version
 
-def _fuzzy_score(query: str, candidate: str, aliases: str = "") -> int:
-    q_words = set(query.lower().split())
-    c_clean = candidate.lower().replace(",", " ")
-    a_clean = aliases.lower().replace(";", " ").replace(",", " ")
-    combined = c_clean + " " + a_clean
-    c_words = set(combined.split())
-    if not q_words or not c_words:
-        return 0
-    intersection = q_words & c_words
-    if not intersection:
-        return 0
-    precision = len(intersection) / len(q_words)
-    recall = len(intersection) / len(c_words)
-    if precision + recall == 0:
-        return 0
-    f1 = 2 * precision * recall / (precision + recall)
-    contains_bonus = 15 if all(w in combined for w in q_words) else 0
-    return min(100, int(f1 * 100) + contains_bonus)
+async def _reload_pep_list() -> None:
+    global _PEP_CACHE, _PEP_VERSION, _LOADING
+    try:
+        loaded = await asyncio.to_thread(_read_pep_list, _PEP_VERSION if _PEP_CACHE[0] else "")
+    except OSError as e:
+        logger.error("PEP list: cannot read peps.csv: %s", e)
+        return
+    finally:
+        _LOADING = None
+    if loaded is None:
+        return
+    records, index, version = loaded
+    _PEP_CACHE = (records, index)
+    _PEP_VERSION = version
+    SCREENING_POOL.reset()
+    _RESULT_CACHE.clear()
 
-async def check_pep(name: str, threshold: int = 60):
+async def _load_pep_list() -> List[Dict]:
+    global _CHECKED_AT, _LOADING
+    records = _PEP_CACHE[0]
+    if records and time.monotonic() - _CHECKED_AT < PEP_RECHECK_INTERVAL:
+        return records
+    if _LOADING is None:
+        _CHECKED_AT = time.monotonic()
+        _LOADING = asyncio.create_task(_reload_pep_list())
+    if records:
+        # Keep screening against the loaded list while the check runs.
+        return records
+    # Shielded so a caller that disconnects doesn't cancel everyone's load.
+    await asyncio.shield(_LOADING)
+    return _PEP_CACHE[0]
+
+async def check_pep(name: str, threshold: int = 60, limit: int = 5):
     if not name or len(name.strip()) < 2:
         return {"status": "error", "error": "Name must be at least 2 characters"}
-    records = _load_pep_list()
+    if not 1 <= limit <= MAX_MATCH_LIMIT:
+        return {"status": "error", "error": f"limit must be between 1 and {MAX_MATCH_LIMIT}"}
+    records = await _load_pep_list()
     if not records:
         return {"status": "error", "error": "PEP list unavailable"}
-    query = name.strip().lower()
-    matches = []
-    for record in records:
-        score = _fuzzy_score(query, record["name"], record["aliases"])
-        if score >= threshold:
-            matches.append({
-                "matched_name": record["display_name"],
-                "aliases": record["aliases"],
-                "score": score,
-                "positions": record["positions"],
-                "countries": record["countries"],
-                "list": "PEP"
-            })
-    matches.sort(key=lambda x: x["score"], reverse=True)
-    top_matches = matches[:5]
+    key = (normalize_name(name), threshold, limit, _PEP_VERSION)
+    result = _RESULT_CACHE.get(key)
+    if result is None:
+        result = await SCREENING_POOL.run(_screen, name, threshold, limit)
+        _RESULT_CACHE.set(key, result)
+    total_hits, top_matches = result
     return {
         "status": "success",
         "query": name,
         "threshold": threshold,
         "hit": len(top_matches) > 0,
         "match_count": len(top_matches),
+        "total_hits": total_hits,
         "matches": top_matches,
         "list_source": "PEP List via OpenSanctions"
     }
 
+def _screen(name: str, threshold: int, limit: int) -> Tuple[int, List[Dict]]:
+    records, index = _PEP_CACHE
+    total_hits, top = index.top(name, threshold, limit)
+    matches = []
+    for record_id, score in top:
+        record = records[record_id]
+        matches.append({
+            "matched_name": record["display_name"],
+            "aliases": record["aliases"],
+            "score": score,
+            "positions": record["positions"],
+            "countries": record["countries"],
+            "list": "PEP"
+        })
+    return total_hits, matches
+
 async def get_pep_status():
-    records = _load_pep_list()
+    records = await _load_pep_list()
     return {
         "status": "success",
         "list": "PEP",
         "source": "OpenSanctions",
         "records_loaded": len(records),
+        "list_version": _PEP_VERSION,
+        "result_cache": _RESULT_CACHE.stats(),
+        "worker_pool": SCREENING_POOL.stats(),
         "update_frequency": "Daily"
     }
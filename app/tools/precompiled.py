@@ -0,0 +1,63 @@
+from typing import Any, Callable, Dict, Iterable, Tuple
+import hashlib
+import json
+import os
+
+from fastapi import Request, Response
+
+from app.tools.cache import TTLCache
+from app.tools.decline_codes import DECLINE_CODES, interpret_decline_code, normalize_decline_code
+from app.tools.mcc_lookup import MCC_DATA, get_mcc_details, normalize_mcc
+from app.tools.routing_validator import ROUTING_NUMBERS, lookup_routing, normalize_routing
+from app.tools.swift_lookup import SWIFT_DATA, lookup_swift, normalize_swift
+
+# The static lookup tools are pure functions of their normalised code, so every
+# response for a code in their tables is serialised once at import and served
+# as raw bytes. Codes outside the tables (unknown, partial and error results)
+# are computed on first use and kept in a bounded cache keyed by the raw input,
+# since error bodies echo it back.
+STATIC_LOOKUP_MAX_AGE = int(os.getenv("STATIC_LOOKUP_MAX_AGE", "86400"))
+STATIC_LOOKUP_MISS_CACHE = int(os.getenv("STATIC_LOOKUP_MISS_CACHE", "4096"))
+
+
+def _serialise(result: Dict[str, Any]) -> Tuple[bytes, str]:
+    # Same encoding FastAPI's JSONResponse would produce.
+    body = json.dumps(result, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+    return body, '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+
+
+class PrecompiledResponses:
+    def __init__(self, lookup: Callable[[str], Dict[str, Any]], normalize: Callable[[str], str],
+                 codes: Iterable[str]) -> None:
+        self.lookup = lookup
+        self.normalize = normalize
+        self._table: Dict[str, Tuple[bytes, str]] = {
+            normalize(code): _serialise(lookup(code)) for code in codes
+        }
+        self._misses = TTLCache(maxsize=STATIC_LOOKUP_MISS_CACHE, ttl=STATIC_LOOKUP_MAX_AGE)
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def get(self, code: str) -> Tuple[bytes, str]:
+        entry = self._table.get(self.normalize(code))
+        if entry is None:
+            entry = self._misses.get(code)
+            if entry is None:
+                entry = _serialise(self.lookup(code))
+                self._misses.set(code, entry)
+        return entry
+
+    def respond(self, request: Request, code: str) -> Response:
+        body, etag = self.get(code)
+        headers = {"ETag": etag, "Cache-Control": f"public, max-age={STATIC_LOOKUP_MAX_AGE}"}
+        if etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+
+MCC_RESPONSES = PrecompiledResponses(get_mcc_details, normalize_mcc, MCC_DATA)
+DECLINE_RESPONSES = PrecompiledResponses(interpret_decline_code, normalize_decline_code, DECLINE_CODES)
+# 8-character base codes only; branch (11-character) codes fall through to the miss cache.
+SWIFT_RESPONSES = PrecompiledResponses(lookup_swift, normalize_swift, SWIFT_DATA)
+ROUTING_RESPONSES = PrecompiledResponses(lookup_routing, normalize_routing, ROUTING_NUMBERS)
@@ -77,8 +77,11 @@ def _checksum(routing: str) -> bool:
     total = (3*(d[0]+d[3]+d[6]) + 7*(d[1]+d[4]+d[7]) + 1*(d[2]+d[5]+d[8]))
     return total % 10 == 0
 
+def normalize_routing(routing_number: str) -> str:
+    return routing_number.strip().replace("-", "").replace(" ", "")
+
 def lookup_routing(routing_number: str) -> dict:
-    rn = routing_number.strip().replace("-", "").replace(" ", "")
+    rn = normalize_routing(routing_number)
 
     if not rn.isdigit():
         return {"status": "error", "error": "Routing number must contain only digits"}
@@ -1,91 +1,199 @@
-﻿from typing import Dict, Any, List
-import httpx
+﻿from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+import asyncio
+import codecs
 import csv
-import io
+import logging
+import os
+import hashlib
+import time
+
+from app.tools.cache import TTLCache
+from app.tools.circuit_breaker import UpstreamUnavailable
+from app.tools.http_client import HTTP_CLIENT
+from app.tools.name_matching import MAX_MATCH_LIMIT, NameIndex, normalize_name
+from app.tools.screening_pool import SCREENING_POOL
 
 OFAC_URL = "https://data.opensanctions.org/datasets/latest/us_ofac_sdn/targets.simple.csv"
+# Seconds to wait after a failed download before trying again; meanwhile the
+# previous day's list keeps being served.
+OFAC_RETRY_INTERVAL = float(os.getenv("OFAC_RETRY_INTERVAL", "60"))
+
+logger = logging.getLogger(__name__)
 
-_SDN_CACHE: List[Dict] = []
+# (records, index) snapshot, replaced as a whole; see NameIndex.
+_SDN_CACHE: Tuple[List[Dict], NameIndex] = ([], NameIndex())
 _CACHE_DATE: str = ""
+_LIST_VERSION: str = ""
+# Validators from the last full download, sent back so an unchanged list is a 304.
+_ETAG: str = ""
+_LAST_MODIFIED: str = ""
+# The one download in flight; screens that arrive meanwhile wait for it.
+_LOADING: Optional["asyncio.Task[List[Dict]]"] = None
+_FAILED_AT = float("-inf")
+
+# Screening results keyed by (normalised name, threshold, limit, list version);
+# a new list version clears it, so a hit is always against the current snapshot.
+_RESULT_CACHE = TTLCache(
+    maxsize=int(os.getenv("SCREENING_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("SCREENING_CACHE_TTL", "3600")),
+)
+
+async def _iter_csv_rows(chunks: AsyncIterator[bytes], digest) -> AsyncIterator[Dict[str, str]]:
+    # Decodes and parses the body chunk by chunk. Lines are only handed to the
+    # csv module once the quotes seen so far balance, so a quoted field that
+    # spans lines or chunks is never split between two csv.reader calls.
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    header: List[str] = []
+    pending: List[str] = []
+    tail = ""
+    quotes = 0
+
+    def rows(lines: List[str]):
+        for row in csv.reader(lines):
+            if not header:
+                header.extend(row)
+            elif row:
+                yield dict(zip(header, row))
+
+    async for chunk in chunks:
+        digest.update(chunk)
+        parts = (tail + decoder.decode(chunk)).split("\n")
+        tail = parts.pop()
+        complete = 0
+        for part in parts:
+            pending.append(part + "\n")
+            quotes += part.count('"')
+            if not quotes & 1:
+                complete = len(pending)
+        if complete:
+            for row in rows(pending[:complete]):
+                yield row
+            del pending[:complete]
+            quotes &= 1
+    pending.append(tail + decoder.decode(b"", final=True))
+    for row in rows(pending):
+        yield row
+
+def _build_list(rows: List[Tuple[str, str, str, str]]) -> Tuple[List[Dict], NameIndex]:
+    # CPU-bound (tens of thousands of name variants), so run off the event loop.
+    records = []
+    index = NameIndex()
+    for name, aliases, sanctions, schema in rows:
+        index.add(name, aliases)
+        records.append({
+            "name": name.lower(),
+            "display_name": name,
+            "aliases": aliases,
+            "type": schema,
+            "program": sanctions,
+        })
+    return records, index.finalize()
+
+async def _download(headers: Dict[str, str], digest) -> Optional[Tuple[List[Tuple[str, str, str, str]], str, str]]:
+    """Rows and validators of a full download, or None if the list is unchanged (304)."""
+    rows = []
+    async with HTTP_CLIENT.stream("GET", OFAC_URL, headers=headers, timeout=60) as resp:
+        if resp.status_code == 304:
+            return None
+        if resp.status_code != 200:
+            raise UpstreamUnavailable(f"OpenSanctions returned HTTP {resp.status_code}")
+        async for row in _iter_csv_rows(resp.aiter_bytes(), digest):
+            name = row.get("name", "").strip()
+            if name:
+                rows.append((name, row.get("aliases", "").strip(), row.get("sanctions", "").strip(),
+                             row.get("schema", "").strip()))
+        return rows, resp.headers.get("etag", ""), resp.headers.get("last-modified", "")
+
+async def _fetch_ofac_list(today: str) -> List[Dict]:
+    global _SDN_CACHE, _CACHE_DATE, _LIST_VERSION, _ETAG, _LAST_MODIFIED, _LOADING, _FAILED_AT
+    try:
+        headers = {}
+        if _SDN_CACHE[0]:
+            if _ETAG:
+                headers["If-None-Match"] = _ETAG
+            if _LAST_MODIFIED:
+                headers["If-Modified-Since"] = _LAST_MODIFIED
+        digest = hashlib.sha1()
+        try:
+            downloaded = await _download(headers, digest)
+            if downloaded is None:
+                _CACHE_DATE = today
+                return _SDN_CACHE[0]
+            rows, etag, last_modified = downloaded
+            snapshot = await asyncio.to_thread(_build_list, rows)
+        except Exception as e:
+            # Network errors, a malformed body or a failed build all keep the
+            # previous list; retried after OFAC_RETRY_INTERVAL.
+            logger.warning("OFAC list: update failed, keeping %d records: %s: %s",
+                           len(_SDN_CACHE[0]), type(e).__name__, e)
+            _FAILED_AT = time.monotonic()
+            return _SDN_CACHE[0]
+        _SDN_CACHE = snapshot
+        _ETAG, _LAST_MODIFIED = etag, last_modified
+        _CACHE_DATE = today
+        SCREENING_POOL.reset()
+        version = digest.hexdigest()[:16]
+        if version != _LIST_VERSION:
+            _LIST_VERSION = version
+            _RESULT_CACHE.clear()
+        return _SDN_CACHE[0]
+    finally:
+        _LOADING = None
 
 async def _load_ofac_list() -> List[Dict]:
-    global _SDN_CACHE, _CACHE_DATE
+    global _LOADING
     from datetime import date
     today = str(date.today())
-    if _SDN_CACHE and _CACHE_DATE == today:
-        return _SDN_CACHE
-    async with httpx.AsyncClient(follow_redirects=True) as client:
-        resp = await client.get(OFAC_URL, timeout=60)
-        raw = resp.content.decode("utf-8", errors="replace")
-    records = []
-    reader = csv.DictReader(io.StringIO(raw))
-    for row in reader:
-        name = row.get("name", "").strip()
-        aliases = row.get("aliases", "").strip()
-        sanctions = row.get("sanctions", "").strip()
-        schema = row.get("schema", "").strip()
-        if name:
-            records.append({
-                "name": name.lower(),
-                "display_name": name,
-                "aliases": aliases,
-                "type": schema,
-                "program": sanctions,
-            })
-    _SDN_CACHE = records
-    _CACHE_DATE = today
-    return records
-
-def _fuzzy_score(query: str, candidate: str, aliases: str = "") -> int:
-    q_words = set(query.lower().split())
-    c_clean = candidate.lower().replace(",", " ")
-    a_clean = aliases.lower().replace(";", " ").replace(",", " ")
-    combined = c_clean + " " + a_clean
-    c_words = set(combined.split())
-    if not q_words or not c_words:
-        return 0
-    intersection = q_words & c_words
-    if not intersection:
-        return 0
-    precision = len(intersection) / len(q_words)
-    recall = len(intersection) / len(c_words)
-    if precision + recall == 0:
-        return 0
-    f1 = 2 * precision * recall / (precision + recall)
-    contains_bonus = 15 if all(w in combined for w in q_words) else 0
-    return min(100, int(f1 * 100) + contains_bonus)
+    if _SDN_CACHE[0] and _CACHE_DATE == today:
+        return _SDN_CACHE[0]
+    if _LOADING is None and time.monotonic() - _FAILED_AT < OFAC_RETRY_INTERVAL:
+        return _SDN_CACHE[0]
+    if _LOADING is None:
+        _LOADING = asyncio.create_task(_fetch_ofac_list(today))
+    # Shielded so a caller that disconnects doesn't cancel everyone's download.
+    return await asyncio.shield(_LOADING)
 
-async def check_sanctions(name: str, threshold: int = 60):
+async def check_sanctions(name: str, threshold: int = 60, limit: int = 5):
     if not name or len(name.strip()) < 2:
         return {"status": "error", "error": "Name must be at least 2 characters"}
+    if not 1 <= limit <= MAX_MATCH_LIMIT:
+        return {"status": "error", "error": f"limit must be between 1 and {MAX_MATCH_LIMIT}"}
     records = await _load_ofac_list()
     if not records:
         return {"status": "error", "error": "Sanctions list unavailable. Please try again shortly."}
-    query = name.strip().lower()
-    matches = []
-    for record in records:
-        score = _fuzzy_score(query, record["name"], record["aliases"])
-        if score >= threshold:
-            matches.append({
-                "matched_name": record["display_name"],
-                "aliases": record["aliases"],
-                "score": score,
-                "type": record["type"],
-                "program": record["program"],
-                "list": "OFAC SDN"
-            })
-    matches.sort(key=lambda x: x["score"], reverse=True)
-    top_matches = matches[:5]
+    key = (normalize_name(name), threshold, limit, _LIST_VERSION)
+    result = _RESULT_CACHE.get(key)
+    if result is None:
+        result = await SCREENING_POOL.run(_screen, name, threshold, limit)
+        _RESULT_CACHE.set(key, result)
+    total_hits, top_matches = result
     return {
         "status": "success",
         "query": name,
         "threshold": threshold,
         "hit": len(top_matches) > 0,
         "match_count": len(top_matches),
+        "total_hits": total_hits,
         "matches": top_matches,
         "list_source": "OFAC SDN via OpenSanctions"
     }
 
+def _screen(name: str, threshold: int, limit: int) -> Tuple[int, List[Dict]]:
+    records, index = _SDN_CACHE
+    total_hits, top = index.top(name, threshold, limit)
+    matches = []
+    for record_id, score in top:
+        record = records[record_id]
+        matches.append({
+            "matched_name": record["display_name"],
+            "aliases": record["aliases"],
+            "score": score,
+            "type": record["type"],
+            "program": record["program"],
+            "list": "OFAC SDN"
+        })
+    return total_hits, matches
+
 async def get_sanctions_status():
     from datetime import date
     records = await _load_ofac_list()
@@ -96,5 +204,8 @@ async def get_sanctions_status():
         "url": OFAC_URL,
         "records_loaded": len(records),
         "cache_date": str(date.today()),
+        "list_version": _LIST_VERSION,
+        "result_cache": _RESULT_CACHE.stats(),
+        "worker_pool": SCREENING_POOL.stats(),
         "update_frequency": "Daily"
     }
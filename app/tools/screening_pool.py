@@ -0,0 +1,95 @@
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+import asyncio
+import multiprocessing
+import os
+import threading
+
+# Sanctions / PEP scoring is pure CPU work. Running it on the event loop stalls
+# every other request on the worker, so screens are dispatched to this pool.
+#
+#   SCREENING_POOL_MODE     thread (default) or process
+#   SCREENING_POOL_WORKERS  executor size
+#   SCREENING_QUEUE_DEPTH   screens allowed to wait for a free worker before
+#                           new ones are rejected with ScreeningBusy (HTTP 429)
+#
+# Process mode forks its workers, which inherit the lists already loaded in the
+# parent; reset() is called after every list reload so new workers see it.
+# Platforms without fork fall back to threads.
+
+SCREENING_POOL_MODE = os.getenv("SCREENING_POOL_MODE", "thread").lower()
+SCREENING_POOL_WORKERS = int(os.getenv("SCREENING_POOL_WORKERS", "2"))
+SCREENING_QUEUE_DEPTH = int(os.getenv("SCREENING_QUEUE_DEPTH", "32"))
+
+
+class ScreeningBusy(Exception):
+    pass
+
+
+class ScreeningPool:
+    def __init__(self, mode: str = "thread", workers: int = 2, queue_depth: int = 32) -> None:
+        if mode == "process" and "fork" not in multiprocessing.get_all_start_methods():
+            mode = "thread"
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.queue_depth = max(0, queue_depth)
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.mode == "process":
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("fork"))
+            else:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="screening")
+        return self._executor
+
+    async def run(self, fn: Callable, *args: Any) -> Any:
+        with self._lock:
+            if self._in_flight >= self.workers + self.queue_depth:
+                self.rejected += 1
+                raise ScreeningBusy("Screening capacity exhausted. Please retry shortly.")
+            self._in_flight += 1
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            with self._lock:
+                self._in_flight -= 1
+            raise
+        # The slot is released when the job ends, not when its caller stops
+        # waiting: a disconnected client's screen keeps running on the pool.
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, future: "Future[Any]") -> None:
+        # Called on a pool thread (or in run() if the job already finished).
+        with self._lock:
+            self._in_flight -= 1
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def reset(self) -> None:
+        # Threads share the parent's memory and never need recycling.
+        if self.mode == "process" and self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "queue_depth": self.queue_depth,
+            "in_flight": self._in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+
+SCREENING_POOL = ScreeningPool(SCREENING_POOL_MODE, SCREENING_POOL_WORKERS, SCREENING_QUEUE_DEPTH)
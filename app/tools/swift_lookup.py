@@ -92,8 +92,11 @@ COUNTRY_CODES: Dict[str, str] = {
     "KE": "Kenya", "GH": "Ghana", "TZ": "Tanzania",
 }
 
+def normalize_swift(swift_code: str) -> str:
+    return swift_code.strip().upper().replace(" ", "")
+
 def lookup_swift(swift_code: str) -> Dict[str, Any]:
-    clean = swift_code.strip().upper().replace(" ", "")
+    clean = normalize_swift(swift_code)
 
     if len(clean) not in (8, 11):
         return {"status": "error", "error": "SWIFT/BIC must be 8 or 11 characters", "swift": swift_code}
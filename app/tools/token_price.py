@@ -1,7 +1,12 @@
-import httpx
-from typing import Optional
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import os
 
-COINGECKO_BASE = "https://api.coingecko.com/api/v3"
+from app.tools.cache import TTLCache
+from app.tools.circuit_breaker import deadline_scope, wait_shared
+from app.tools.http_client import HTTP_CLIENT
+
+COINGECKO_BASE = os.getenv("COINGECKO_BASE", "https://api.coingecko.com/api/v3")
 
 SYMBOL_MAP = {
     "btc": "bitcoin", "eth": "ethereum", "usdt": "tether", "usdc": "usd-coin",
@@ -15,6 +20,160 @@ SYMBOL_MAP = {
 
 SUPPORTED_CURRENCIES = ["usd", "eur", "gbp", "jpy", "cad", "aud", "chf", "cny", "krw", "inr"]
 
+# Prices are served from a short-lived cache. Lookups that miss within the
+# same TOKEN_PRICE_BATCH_WINDOW are merged into one simple/price call carrying
+# every requested id and currency (split at TOKEN_PRICE_MAX_IDS ids), so a
+# burst of single-token requests costs one upstream call. Ids CoinGecko does
+# not know are cached as misses too. When CoinGecko fails, is slow past the
+# request's deadline or has its circuit open, the last price seen within
+# TOKEN_PRICE_STALE_TTL is served instead, marked stale.
+TOKEN_PRICE_TTL = float(os.getenv("TOKEN_PRICE_TTL", "30"))
+TOKEN_PRICE_STALE_TTL = float(os.getenv("TOKEN_PRICE_STALE_TTL", "3600"))
+TOKEN_PRICE_BATCH_WINDOW = float(os.getenv("TOKEN_PRICE_BATCH_WINDOW", "0.05"))
+TOKEN_PRICE_MAX_IDS = int(os.getenv("TOKEN_PRICE_MAX_IDS", "100"))
+MAX_TOKENS_PER_REQUEST = 100
+
+_NOT_FOUND = ()
+
+
+class PriceService:
+    def __init__(self) -> None:
+        self.cache = TTLCache(maxsize=10000, ttl=TOKEN_PRICE_TTL)
+        self.last_known = TTLCache(maxsize=10000, ttl=TOKEN_PRICE_STALE_TTL)
+        self._pending: Dict[Tuple[str, str], "asyncio.Future"] = {}
+        self._flush_scheduled = False
+        # Strong references to running flushes; the loop itself only keeps
+        # weak ones, and a collected flush would strand its waiting callers.
+        self._flushes: Set["asyncio.Task[None]"] = set()
+        self.upstream_calls = 0
+
+    async def get_many(self, keys: Iterable[Tuple[str, str]],
+                       stale: Optional[Set[Tuple[str, str]]] = None) -> Dict[Tuple[str, str], tuple]:
+        """(coin_id, currency) -> (price, change_24h, market_cap, volume_24h,
+        last_updated_at), or () when CoinGecko doesn't know the id. Keys
+        answered from the last-known prices are added to `stale`."""
+        found: Dict[Tuple[str, str], tuple] = {}
+        waiting = {}
+        for key in keys:
+            cached = self.cache.get(key)
+            if cached is not None:
+                found[key] = cached
+                continue
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pending[key] = asyncio.get_running_loop().create_future()
+                # Callers past their deadline stop waiting; don't warn about
+                # errors nobody is left to read.
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            waiting[key] = future
+        if waiting:
+            if not self._flush_scheduled:
+                self._flush_scheduled = True
+                asyncio.get_running_loop().call_later(TOKEN_PRICE_BATCH_WINDOW, self._start_flush)
+            # Shielded so one caller going away doesn't fail the shared batch.
+            for key, future in waiting.items():
+                try:
+                    found[key] = await wait_shared(future)
+                except Exception:
+                    last = self.last_known.get(key)
+                    if last is None:
+                        raise
+                    found[key] = last
+                    if stale is not None:
+                        stale.add(key)
+        return found
+
+    def _start_flush(self) -> None:
+        self._flush_scheduled = False
+        pending, self._pending = self._pending, {}
+        if pending:
+            task = asyncio.get_running_loop().create_task(self._flush(pending))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, pending: Dict[Tuple[str, str], "asyncio.Future"]) -> None:
+        ids = sorted({coin_id for coin_id, _ in pending})
+        currencies = sorted({currency for _, currency in pending})
+        chunks = [ids[i:i + TOKEN_PRICE_MAX_IDS] for i in range(0, len(ids), TOKEN_PRICE_MAX_IDS)]
+        # Serves every waiting caller, so it runs on its own timeout rather
+        # than the deadline of the request that scheduled it.
+        with deadline_scope(None):
+            results = await asyncio.gather(*(self._fetch(chunk, currencies) for chunk in chunks), return_exceptions=True)
+        data: Dict[str, Any] = {}
+        failures: Dict[str, BaseException] = {}
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, BaseException):
+                failures.update((coin_id, result) for coin_id in chunk)
+            else:
+                data.update(result)
+        for (coin_id, currency), future in pending.items():
+            if future.done():
+                continue
+            if coin_id in failures:
+                future.set_exception(failures[coin_id])
+                continue
+            d = data.get(coin_id)
+            value = _NOT_FOUND if d is None or currency not in d else (
+                d.get(currency),
+                d.get(f"{currency}_24h_change"),
+                d.get(f"{currency}_market_cap"),
+                d.get(f"{currency}_24h_vol"),
+                d.get("last_updated_at"),
+            )
+            self.cache.set((coin_id, currency), value)
+            if value != _NOT_FOUND:
+                self.last_known.set((coin_id, currency), value)
+            future.set_result(value)
+
+    async def _fetch(self, ids: List[str], currencies: List[str]) -> Dict[str, Any]:
+        self.upstream_calls += 1
+        r = await HTTP_CLIENT.get(
+            f"{COINGECKO_BASE}/simple/price",
+            params={
+                "ids": ",".join(ids),
+                "vs_currencies": ",".join(currencies),
+                "include_24hr_change": "true",
+                "include_24hr_vol": "true",
+                "include_market_cap": "true",
+                "include_last_updated_at": "true",
+            },
+            timeout=10,
+        )
+        r.raise_for_status()
+        return r.json()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "upstream_calls": self.upstream_calls,
+            "pending": len(self._pending),
+            "flushes_in_flight": len(self._flushes),
+            "cache": self.cache.stats(),
+            "last_known": self.last_known.stats(),
+        }
+
+
+PRICE_SERVICE = PriceService()
+
+
+def _price_result(token: str, coin_id: str, currency: str, value: tuple, stale: bool = False) -> dict:
+    if value == _NOT_FOUND:
+        return {"status": "error", "message": f"Token '{token}' not found. Try using the full CoinGecko ID (e.g. 'bitcoin')."}
+    price, change, market_cap, volume, last_updated_at = value
+    return {
+        "status": "success",
+        "token": token.upper(),
+        "coin_id": coin_id,
+        "currency": currency.upper(),
+        "price": price,
+        "price_change_24h_pct": round(change, 4) if change is not None else None,
+        "market_cap": market_cap,
+        "volume_24h": volume,
+        "last_updated_at": last_updated_at,
+        "stale": stale,
+        "data_source": "CoinGecko"
+    }
+
+
 async def get_token_price(token: str, currency: str = "usd") -> dict:
     token_clean = token.strip().lower()
     currency_clean = currency.strip().lower()
@@ -25,38 +184,46 @@ async def get_token_price(token: str, currency: str = "usd") -> dict:
     coin_id = SYMBOL_MAP.get(token_clean, token_clean)
 
     try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            r = await client.get(
-                f"{COINGECKO_BASE}/simple/price",
-                params={
-                    "ids": coin_id,
-                    "vs_currencies": currency_clean,
-                    "include_24hr_change": "true",
-                    "include_24hr_vol": "true",
-                    "include_market_cap": "true",
-                    "include_last_updated_at": "true",
-                }
-            )
-        r.raise_for_status()
-        data = r.json()
-        if coin_id not in data:
-            return {"status": "error", "message": f"Token '{token}' not found. Try using the full CoinGecko ID (e.g. 'bitcoin')."}
+        key = (coin_id, currency_clean)
+        stale: Set[Tuple[str, str]] = set()
+        prices = await PRICE_SERVICE.get_many([key], stale)
+        return _price_result(token, coin_id, currency_clean, prices[key], key in stale)
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
 
-        d = data[coin_id]
-        change = d.get(f"{currency_clean}_24h_change")
 
-        return {
-            "status": "success",
-            "token": token.upper(),
-            "coin_id": coin_id,
-            "currency": currency_clean.upper(),
-            "price": d.get(currency_clean),
-            "price_change_24h_pct": round(change, 4) if change is not None else None,
-            "market_cap": d.get(f"{currency_clean}_market_cap"),
-            "volume_24h": d.get(f"{currency_clean}_24h_vol"),
-            "last_updated_at": d.get("last_updated_at"),
-            "data_source": "CoinGecko"
-        }
+async def get_token_prices(tokens: List[str], currency: str = "usd") -> dict:
+    currency_clean = currency.strip().lower()
+    if currency_clean not in SUPPORTED_CURRENCIES:
+        return {"status": "error", "message": f"Unsupported currency. Supported: {', '.join(SUPPORTED_CURRENCIES)}"}
+    tokens = [t.strip() for t in tokens if t.strip()]
+    if not tokens:
+        return {"status": "error", "message": "No tokens supplied"}
+    if len(tokens) > MAX_TOKENS_PER_REQUEST:
+        return {"status": "error", "message": f"At most {MAX_TOKENS_PER_REQUEST} tokens per request"}
 
+    coin_ids = [SYMBOL_MAP.get(t.lower(), t.lower()) for t in tokens]
+    stale: Set[Tuple[str, str]] = set()
+    try:
+        prices = await PRICE_SERVICE.get_many(((coin_id, currency_clean) for coin_id in coin_ids), stale)
     except Exception as e:
         return {"status": "error", "message": str(e)}
+    return {
+        "status": "success",
+        "currency": currency_clean.upper(),
+        "prices": [
+            _price_result(token, coin_id, currency_clean, prices[(coin_id, currency_clean)],
+                          (coin_id, currency_clean) in stale)
+            for token, coin_id in zip(tokens, coin_ids)
+        ],
+    }
+
+
+def get_price_service_status() -> dict:
+    return {
+        "status": "success",
+        "ttl_seconds": TOKEN_PRICE_TTL,
+        "stale_ttl_seconds": TOKEN_PRICE_STALE_TTL,
+        "batch_window_seconds": TOKEN_PRICE_BATCH_WINDOW,
+        **PRICE_SERVICE.stats(),
+    }
@@ -0,0 +1,98 @@
+from typing import Callable, Generic, Optional, Tuple, TypeVar
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class VersionedFile(Generic[T]):
+    """A data file compiled into an immutable snapshot that is swapped on change.
+
+    `build(raw, digest, stat)` turns the file's bytes into a snapshot carrying a
+    `version`; `current` holds `initial` until a file builds. Readers take one
+    reference to `current` and use it for the whole request, so a reload never
+    mixes two versions. A file that can't be read or built, or that `reject`
+    returns a reason for, is logged and kept in `last_error`, and the current
+    snapshot stays in place.
+    """
+
+    def __init__(self, name: str, path: str, build: Callable[[bytes, str, os.stat_result], T], initial: T,
+                 reject: Optional[Callable[[T, T], Optional[str]]] = None) -> None:
+        self.name = name
+        self.path = path
+        self.current = initial
+        self.digest = ""
+        self.loaded = False
+        self.last_error = ""
+        self._build = build
+        self._reject = reject
+        self._lock = threading.Lock()
+        # (mtime_ns, size) of the last file we tried to load, good or bad, so a
+        # broken file is reported once rather than re-parsed on every poll.
+        self._last_attempt: Tuple[int, int] = (0, 0)
+
+    def _reload(self, force: bool) -> bool:
+        current = self.current
+        try:
+            stat = os.stat(self.path)
+        except OSError as e:
+            if self.last_error != str(e):
+                logger.error("%s: cannot stat %s; using version %r: %s", self.name, self.path, current.version, e)
+            self.last_error = str(e)
+            return False
+        attempt = (stat.st_mtime_ns, stat.st_size)
+        if not force and attempt == self._last_attempt:
+            return False
+        self._last_attempt = attempt
+        try:
+            with open(self.path, "rb") as f:
+                raw = f.read()
+            digest = hashlib.sha1(raw).hexdigest()[:16]
+            if digest == self.digest:
+                self.last_error = ""
+                return False
+            snapshot = self._build(raw, digest, stat)
+            reason = self._reject(snapshot, current) if self._reject else None
+        except Exception as e:
+            logger.error("%s: failed to load %s; keeping version %r: %s", self.name, self.path, current.version, e,
+                         exc_info=not isinstance(e, (OSError, ValueError)))
+            self.last_error = f"{type(e).__name__}: {e}"
+            return False
+        if reason:
+            logger.error("%s: %s; keeping version %r", self.name, reason, current.version)
+            self.last_error = reason
+            return False
+        if snapshot.version == current.version:
+            logger.warning("%s: %s changed but still says version %r", self.name, self.path, snapshot.version)
+        self.current, self.digest, self.last_error = snapshot, digest, ""
+        logger.info("%s: loaded version %s (%s)", self.name, snapshot.version, digest)
+        return True
+
+    def reload(self, force: bool = False) -> bool:
+        """Load the file if it changed (or always, with force). Returns True on a swap."""
+        with self._lock:
+            try:
+                return self._reload(force)
+            finally:
+                # Set only once this load is done, so a first-time reader that
+                # arrives meanwhile waits on the lock instead of seeing `initial`.
+                self.loaded = True
+
+    def get(self) -> T:
+        if not self.loaded:
+            self.reload()
+        return self.current
+
+    async def watch(self, interval: float) -> None:
+        """Poll the file and reload it off the event loop whenever it changes."""
+        while True:
+            try:
+                await asyncio.to_thread(self.reload)
+            except Exception:
+                logger.exception("%s: watcher iteration failed", self.name)
+            await asyncio.sleep(interval)
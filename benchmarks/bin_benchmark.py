@@ -0,0 +1,118 @@
+"""Lookup latency and memory of the BIN index against the legacy 6-digit dict.
+
+Usage:
+    python -m benchmarks.bin_benchmark [--csv PATH] [--bins N] [--lookups N]
+
+Without --csv a synthetic table of N 6-digit BINs (10% with 8-digit
+sub-ranges) is generated. Memory is the tracemalloc peak while building each
+structure from the same parsed rows; retained is what is still allocated once
+it is built. Lookups include materialising the response record.
+"""
+import argparse
+import csv
+import random
+import sys
+import time
+import tracemalloc
+
+from app.tools import bin_lookup
+from app.tools.bin_lookup import BinIndex
+
+BRANDS = ["Visa", "Mastercard", "American Express", "Discover", "JCB", "UnionPay"]
+TYPES = ["credit", "debit", "prepaid", "charge"]
+COUNTRIES = [("US", "United States"), ("GB", "United Kingdom"), ("DE", "Germany"), ("BR", "Brazil"), ("IN", "India")]
+
+
+def _synthetic_rows(count: int, rng: random.Random) -> list:
+    rows = []
+    for bin6 in rng.sample(range(400000, 700000), count):
+        country, country_name = rng.choice(COUNTRIES)
+        row = {
+            "bin": str(bin6), "bank": f"Bank {bin6 % 5000}", "brand": rng.choice(BRANDS),
+            "type": rng.choice(TYPES), "country_code": country, "country_name": country_name,
+            "prepaid": rng.choice(["Yes", "No"]),
+        }
+        rows.append(row)
+        if rng.random() < 0.1:
+            rows.append(dict(row, bin=f"{bin6}{rng.randrange(100):02d}", bank=f"Bank {bin6 % 5000} Sub"))
+    return rows
+
+
+def _record(row: dict) -> dict:
+    return {
+        "bank": row.get("bank", "Unknown"), "brand": row.get("brand", "Unknown"),
+        "type": row.get("type", "Unknown"), "country": row.get("country_code", "Unknown"),
+        "country_name": row.get("country_name", "Unknown"), "prepaid": row.get("prepaid", "Unknown"),
+    }
+
+
+def _build_dict(rows: list) -> dict:
+    table = {}
+    for row in rows:
+        table[str(row.get("bin", "")).strip().zfill(6)[:6]] = _record(row)
+    return table
+
+
+def _build_index(rows: list) -> BinIndex:
+    ranges = []
+    for row in rows:
+        bin_range = bin_lookup._row_range(row)
+        if bin_range:
+            ranges.append((bin_range[0], bin_range[1], bin_lookup._row_fields(row)))
+    return BinIndex(ranges)
+
+
+def _measure(build, rows: list):
+    tracemalloc.start()
+    started = time.perf_counter()
+    table = build(rows)
+    elapsed = time.perf_counter() - started
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return table, elapsed, retained, peak
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--csv", help="binlist.csv to load (default: synthetic table)")
+    parser.add_argument("--bins", type=int, default=300000)
+    parser.add_argument("--lookups", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=411111)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.csv:
+        with open(args.csv, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        rows = _synthetic_rows(args.bins, rng)
+
+    legacy, legacy_s, legacy_kept, legacy_peak = _measure(_build_dict, rows)
+    index, index_s, index_kept, index_peak = _measure(_build_index, rows)
+
+    queries = [str(row.get("bin", "")).strip()[:6] + f"{rng.randrange(100):02d}"
+               for row in rng.choices(rows, k=args.lookups)]
+
+    started = time.perf_counter()
+    for q in queries:
+        legacy.get(q[:6])
+    legacy_ns = (time.perf_counter() - started) / len(queries) * 1e9
+
+    find, record = index.find, index.record
+    started = time.perf_counter()
+    for q in queries:
+        entry = find(q)
+        if entry != -1:
+            record(entry)
+    index_ns = (time.perf_counter() - started) / len(queries) * 1e9
+
+    print(f"{len(rows)} rows, {args.lookups} lookups")
+    print(f"  dict (6-digit only)  build {legacy_s:6.2f}s  retained {legacy_kept / 2**20:6.1f} MiB  "
+          f"peak {legacy_peak / 2**20:6.1f} MiB  lookup {legacy_ns:6.0f} ns  entries {len(legacy)}")
+    print(f"  BinIndex (compact)   build {index_s:6.2f}s  retained {index_kept / 2**20:6.1f} MiB  "
+          f"peak {index_peak / 2**20:6.1f} MiB  lookup {index_ns:6.0f} ns  entries {len(index)}  segments {len(index.seg_starts)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
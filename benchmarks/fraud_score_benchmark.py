@@ -0,0 +1,117 @@
+"""Batch fraud scoring: equivalence with the scalar scorer, and throughput.
+
+Usage:
+    python -m benchmarks.fraud_score_benchmark [--profiles N] [--checks N] [--repeat N] [--seed N]
+
+First score_profiles is checked against calculate_fraud_score, with NumPy and
+with the pure-Python fallback: on every combination of table entries and
+flags, then on --checks random profiles mixing table entries with unknown,
+empty, missing and wrongly-cased values. The run exits non-zero on any
+difference. Then --profiles random profiles are scored in one batch and one
+by one, best of --repeat runs.
+"""
+import argparse
+import itertools
+import random
+import sys
+import time
+
+from app.tools import fraud_score
+from app.tools.fraud_score import calculate_fraud_score, load_fraud_rules, score_profiles
+
+
+def _random_value(rng: random.Random, table: dict, odd: list):
+    if rng.random() < 0.8:
+        value = rng.choice(list(table))
+        return rng.choice([value, value.lower(), value.upper()]) if rng.random() < 0.2 else value
+    return rng.choice(odd)
+
+
+def random_profiles(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    rules = load_fraud_rules()
+    return [
+        (
+            _random_value(rng, rules.card_type_risk, ["", "virtual", "Gift"]),
+            _random_value(rng, rules.network_risk, ["", None, "visa", "Elo", "RuPay"]),
+            _random_value(rng, rules.country_risk, ["", None, "zz", "XK", "usa"]),
+            rng.random() < 0.2,
+            rng.random() < 0.1,
+        )
+        for _ in range(count)
+    ]
+
+
+def _columns(profiles: list) -> tuple:
+    return tuple(list(column) for column in zip(*profiles))
+
+
+def _mismatches(profiles: list) -> int:
+    scores = score_profiles(*_columns(profiles))
+    bad = 0
+    for profile, score, level in zip(profiles, scores.fraud_score, scores.risk_level):
+        expected = calculate_fraud_score(*profile)
+        bad += score != expected["fraud_score"] or level != expected["risk_level"]
+    return bad
+
+
+def _check(profiles: list) -> int:
+    numpy = fraud_score.np
+    failures = 0
+    for label, module in (("numpy", numpy), ("python", None)):
+        if label == "numpy" and numpy is None:
+            print("  numpy                not installed, skipped")
+            continue
+        fraud_score.np = module
+        try:
+            bad = _mismatches(profiles)
+        finally:
+            fraud_score.np = numpy
+        failures += bad
+        print(f"  {label:<20} {'OK' if not bad else f'{bad} MISMATCHED'} ({len(profiles)} profiles)")
+    return failures
+
+
+def _rate(label: str, fn, count: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    print(f"  {label:<28} {count / best:>12,.0f} profiles/s  {best:7.3f} s")
+    return count / best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profiles", type=int, default=1000000)
+    parser.add_argument("--checks", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=49)
+    args = parser.parse_args()
+
+    rules = load_fraud_rules()
+    every = list(itertools.product(rules.card_type_risk, rules.network_risk, rules.country_risk, (False, True), (False, True)))
+    print(f"fraud rules version {rules.version} ({rules.digest})")
+    print("equivalence with calculate_fraud_score")
+    failures = _check(every) + _check(random_profiles(args.checks, args.seed))
+
+    profiles = random_profiles(args.profiles, args.seed + 1)
+    columns = _columns(profiles)
+    print(f"\n{args.profiles} profiles")
+    scalar = _rate("calculate_fraud_score loop", lambda: [calculate_fraud_score(*p) for p in profiles],
+                   len(profiles), args.repeat)
+    numpy = fraud_score.np
+    fraud_score.np = None
+    try:
+        _rate("score_profiles, python", lambda: score_profiles(*columns), len(profiles), args.repeat)
+    finally:
+        fraud_score.np = numpy
+    if numpy is not None:
+        vector = _rate("score_profiles, numpy", lambda: score_profiles(*columns), len(profiles), args.repeat)
+        print(f"  numpy vs scalar loop: {vector / scalar:.1f}x")
+    return 0 if not failures else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
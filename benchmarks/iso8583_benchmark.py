@@ -0,0 +1,105 @@
+"""Parse / encode throughput and allocations of the ISO 8583 tools.
+
+Usage:
+    python -m benchmarks.iso8583_benchmark [--messages N] [--repeat N] [--seed N]
+
+Runs offline on synthetic traffic from benchmarks.iso8583_synthetic. First
+every loaded dialect is round-tripped (encode, parse, compare); the run exits
+non-zero on any mismatch. Then N messages per dialect are timed, best of
+--repeat runs. "locate" only finds field offsets, "read 2" also decodes the PAN
+and amount, "full" builds the same response dict as parse_iso8583. Allocations
+are the blocks and bytes still held per message when 1000 results are kept.
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+
+from app.tools.iso8583_binary import DIALECTS, encode_message, parse_message
+from app.tools.iso8583_parser import parse_iso8583
+from benchmarks.iso8583_synthetic import random_messages
+
+ALLOC_SAMPLE = 1000
+
+
+def _round_trip(dialect: str, count: int, seed: int) -> int:
+    failures = 0
+    for mti, fields, message in random_messages(count, dialect, seed):
+        parsed = parse_message(message, dialect)
+        if parsed.mti != mti or {n: parsed.value(n) for n in parsed} != fields:
+            failures += 1
+    return failures
+
+
+def _allocations(fn, inputs: list) -> tuple:
+    sample = inputs[:ALLOC_SAMPLE]
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = [fn(item) for item in sample]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    diff = after.compare_to(before, "filename")
+    blocks = sum(stat.count_diff for stat in diff)
+    size = sum(stat.size_diff for stat in diff)
+    del kept
+    return blocks / len(sample), size / len(sample)
+
+
+def _rate(label: str, fn, inputs: list, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for item in inputs:
+            fn(item)
+        best = min(best, time.perf_counter() - started)
+    rate = len(inputs) / best
+    blocks, size = _allocations(fn, inputs)
+    print(f"  {label:<34} {rate:>10,.0f} msg/s  {blocks:6.1f} blocks/msg  {size:8,.0f} B/msg")
+    return rate
+
+
+def _read_two(message: bytes) -> tuple:
+    parsed = parse_message(message, "bcd")
+    return parsed, parsed.value(2), parsed.value(4)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=8583)
+    args = parser.parse_args()
+
+    ok = True
+    print("round trip")
+    for name in sorted(DIALECTS):
+        failures = _round_trip(name, 500, args.seed)
+        ok = ok and not failures
+        print(f"  {name:<20} {'OK' if not failures else f'{failures} FAILED'}")
+
+    ascii_set = random_messages(args.messages, "ascii", args.seed)
+    bcd_set = random_messages(args.messages, "bcd", args.seed)
+    ascii_bytes = [message for _, _, message in ascii_set]
+    ascii_text = [message.decode("ascii") for message in ascii_bytes]
+    bcd_bytes = [message for _, _, message in bcd_set]
+    ascii_inputs = [(mti, fields) for mti, fields, _ in ascii_set]
+    bcd_inputs = [(mti, fields) for mti, fields, _ in bcd_set]
+    fields = sum(len(f) for _, f in ascii_inputs) / len(ascii_inputs)
+
+    print(f"\n{args.messages} messages per dialect, {fields:.1f} fields on average")
+    print("encode")
+    _rate("encode_message ascii", lambda m: encode_message(m[0], m[1], "ascii"), ascii_inputs, args.repeat)
+    _rate("encode_message bcd", lambda m: encode_message(m[0], m[1], "bcd"), bcd_inputs, args.repeat)
+    print("parse")
+    baseline = _rate("parse_iso8583 (ASCII str)", parse_iso8583, ascii_text, args.repeat)
+    _rate("parse_message ascii, full", lambda m: parse_message(m, "ascii").to_dict(), ascii_bytes, args.repeat)
+    _rate("parse_message ascii, locate", lambda m: parse_message(m, "ascii"), ascii_bytes, args.repeat)
+    _rate("parse_message bcd, full", lambda m: parse_message(m, "bcd").to_dict(), bcd_bytes, args.repeat)
+    _rate("parse_message bcd, read 2", _read_two, bcd_bytes, args.repeat)
+    fastest = _rate("parse_message bcd, locate", lambda m: parse_message(m, "bcd"), bcd_bytes, args.repeat)
+    print(f"  locate vs parse_iso8583: {fastest / baseline:.1f}x")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+"""Synthetic ISO 8583 traffic for the parser benchmarks.
+
+random_fields() picks a realistic authorisation field set (fixed, LLVAR and
+LLLVAR fields, and secondary-bitmap fields on a share of messages) with
+values valid for the given dialect's encodings; random_messages() encodes
+them with encode_message.
+"""
+import random
+from typing import Dict, List, Tuple, Union
+
+from app.tools.iso8583_binary import NUMERIC_FIELDS, Dialect, _resolve_dialect, encode_message
+
+MTIS = ["0100", "0110", "0200", "0210", "0400", "0420", "0800"]
+# Present on every message: a mix of fixed numerics, LLVAR and fixed text.
+CORE_FIELDS = [2, 3, 4, 7, 11, 12, 13, 14, 22, 25, 32, 35, 37, 41, 42, 43, 49]
+# Each added with OPTIONAL_RATE, mostly LLLVAR.
+OPTIONAL_FIELDS = [38, 39, 44, 48, 52, 54, 55, 60, 61, 62, 63]
+OPTIONAL_RATE = 0.3
+SECONDARY_FIELDS = [90, 95, 102, 103]
+
+DIGITS = "0123456789"
+TEXT = "ABCDEFGHJKLMNPQRSTUVWXYZ0123456789"
+HEX = "0123456789ABCDEF"
+
+
+def _value(rng: random.Random, number: int, spec: tuple) -> str:
+    _, prefix_size, limit, encoding, _, _, _ = spec
+    units = rng.randint(1, min(limit, 120)) if prefix_size else limit
+    if encoding in ("binary", "hex"):
+        return "".join(rng.choice(HEX) for _ in range(units * 2))
+    alphabet = DIGITS if encoding == "bcd" or number in NUMERIC_FIELDS else TEXT
+    return "".join(rng.choice(alphabet) for _ in range(units))
+
+
+def random_fields(rng: random.Random, dialect: Union[Dialect, str] = "ascii",
+                  secondary_ratio: float = 0.2) -> Dict[int, str]:
+    dialect = _resolve_dialect(dialect)
+    numbers = list(CORE_FIELDS)
+    numbers += [n for n in OPTIONAL_FIELDS if rng.random() < OPTIONAL_RATE]
+    if rng.random() < secondary_ratio:
+        numbers += rng.sample(SECONDARY_FIELDS, rng.randint(1, len(SECONDARY_FIELDS)))
+    return {n: _value(rng, n, dialect.fields[n]) for n in sorted(numbers) if n in dialect.fields}
+
+
+def random_messages(count: int, dialect: Union[Dialect, str] = "ascii", seed: int = 8583,
+                    secondary_ratio: float = 0.2) -> List[Tuple[str, Dict[int, str], bytes]]:
+    """(mti, fields, encoded message) triples."""
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        mti = rng.choice(MTIS)
+        fields = random_fields(rng, dialect, secondary_ratio)
+        messages.append((mti, fields, encode_message(mti, fields, dialect)))
+    return messages
@@ -0,0 +1,92 @@
+"""Local stand-in for CoinGecko's simple/price endpoint.
+
+Usage:
+    python -m benchmarks.mock_coingecko [--port 8900] [--latency-ms 50]
+    COINGECKO_BASE=http://127.0.0.1:8900/api/v3 uvicorn app.main:app
+
+Prices are deterministic per (id, currency) so runs are comparable; ids
+containing "unknown" are left out of the response like ids CoinGecko does not
+list. Every request is counted and printed, which makes it easy to see
+concurrent token lookups being merged into one upstream call.
+"""
+import argparse
+import hashlib
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+_calls = 0
+_lock = threading.Lock()
+
+
+def _price(coin_id: str, currency: str) -> float:
+    seed = int(hashlib.sha1(f"{coin_id}:{currency}".encode()).hexdigest()[:8], 16)
+    return round(0.01 + (seed % 10_000_000) / 100, 2)
+
+
+def simple_price(query: dict) -> dict:
+    ids = [i for i in query.get("ids", [""])[0].split(",") if i]
+    currencies = [c for c in query.get("vs_currencies", [""])[0].split(",") if c]
+    body = {}
+    for coin_id in ids:
+        if "unknown" in coin_id:
+            continue
+        entry = {}
+        for currency in currencies:
+            price = _price(coin_id, currency)
+            entry[currency] = price
+            entry[f"{currency}_market_cap"] = price * 1_000_000
+            entry[f"{currency}_24h_vol"] = price * 10_000
+            entry[f"{currency}_24h_change"] = (price % 20) - 10
+        entry["last_updated_at"] = int(time.time())
+        body[coin_id] = entry
+    return body
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+
+    def do_GET(self) -> None:
+        global _calls
+        url = urlsplit(self.path)
+        if url.path != "/api/v3/simple/price":
+            self.send_error(404)
+            return
+        with _lock:
+            _calls += 1
+            call = _calls
+        query = parse_qs(url.query)
+        time.sleep(self.latency)
+        payload = json.dumps(simple_price(query)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+        print(f"call {call}: ids={query.get('ids', [''])[0]} vs={query.get('vs_currencies', [''])[0]}", flush=True)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    args = parser.parse_args()
+    _Handler.latency = args.latency_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), _Handler)
+    print(f"mock CoinGecko on http://127.0.0.1:{args.port}/api/v3", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""Per-call cost of payment intelligence analysis, legacy vs memoised pipeline.
+
+Usage:
+    python -m benchmarks.payment_intelligence_benchmark [--calls N] [--distinct N] [--repeat N] [--seed N]
+
+Calls are drawn from --distinct BINs and the decline code and MCC tables, the
+way a decline file repeats them. "legacy" is the previous analyze_payment
+body (sequential lookups, linear retry-matrix scan); "pipeline" is the
+current one, timed cold (memo caches cleared first) and warm. "batch" is the
+whole set fed through PaymentBatch as one CSV, timed per file. Responses are
+checked against legacy; the run exits non-zero on a mismatch.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+from app.tools import payment_intelligence as pi
+from app.tools.bin_lookup import get_bin_details, load_bins
+from app.tools.decline_codes import DECLINE_CODES, interpret_decline_code
+from app.tools.fraud_score import calculate_fraud_score
+from app.tools.mcc_lookup import MCC_DATA, get_mcc_details
+
+
+def _legacy_retry_strategy(decline_code: str) -> dict:
+    for strategy, data in pi.RETRY_MATRIX.items():
+        if decline_code.upper() in [c.upper() for c in data["codes"]]:
+            return {
+                "strategy": strategy,
+                "retry_window_minutes": data["window_minutes"],
+                "retry_probability_pct": data["probability"],
+                "retry_advice": data["advice"]
+            }
+    return dict(pi.DEFAULT_RETRY)
+
+
+def _legacy_analyze(card_bin, decline_code, merchant_mcc, transaction_amount,
+                    country_code="US", card_type="credit", network="Visa") -> dict:
+    bin_data = get_bin_details(card_bin) if card_bin else {}
+    decline_data = interpret_decline_code(decline_code) if decline_code else {}
+    mcc_data = get_mcc_details(merchant_mcc) if merchant_mcc else {}
+    resolved_card_type = bin_data.get("card_type", card_type) or card_type
+    resolved_network = bin_data.get("network", network) or network
+    resolved_country = bin_data.get("country_code", country_code) or country_code
+    fraud_data = calculate_fraud_score(
+        card_type=resolved_card_type,
+        network=resolved_network,
+        country_code=resolved_country,
+        is_commercial=bin_data.get("is_commercial", False),
+        is_anonymous=False
+    )
+    retry = _legacy_retry_strategy(decline_code)
+    amount_risk = pi.get_amount_risk(transaction_amount, merchant_mcc)
+    recommendation = pi.build_recommendation(
+        retry["strategy"], fraud_data["risk_level"], retry["retry_probability_pct"], amount_risk["amount_risk_flags"]
+    )
+    return {
+        "status": "success",
+        "recommendation": recommendation,
+        "retry": {
+            "strategy": retry["strategy"],
+            "probability_pct": retry["retry_probability_pct"],
+            "window_minutes": retry["retry_window_minutes"],
+            "advice": retry["retry_advice"]
+        },
+        "fraud": {
+            "score": fraud_data["fraud_score"],
+            "risk_level": fraud_data["risk_level"],
+            "risk_factors": fraud_data["risk_factors"],
+            "rules_version": fraud_data["rules_version"]
+        },
+        "decline": {
+            "code": decline_code,
+            "meaning": decline_data.get("meaning", "Unknown"),
+            "category": decline_data.get("category", "Unknown"),
+            "retryable": decline_data.get("retryable", "Unknown")
+        },
+        "card": {
+            "bin": card_bin,
+            "network": resolved_network,
+            "card_type": resolved_card_type,
+            "issuing_country": resolved_country,
+            "bank": bin_data.get("bank_name", "Unknown")
+        },
+        "merchant": {
+            "mcc": merchant_mcc,
+            "category": mcc_data.get("description", "Unknown"),
+            "high_risk": amount_risk["high_risk_mcc"]
+        },
+        "transaction": {
+            "amount": transaction_amount,
+            "risk_flags": amount_risk["amount_risk_flags"]
+        },
+        "data_sources": ["Internal BIN DB", "OFAC Logic", "IRS Prefix Rules", "Payments Domain Intelligence"]
+    }
+
+
+def _calls(count: int, distinct: int, seed: int) -> list:
+    rng = random.Random(seed)
+    bins = [str(rng.randrange(400000, 560000)) for _ in range(distinct)]
+    codes = list(DECLINE_CODES) + ["XX", "ZZ"]
+    mccs = list(MCC_DATA) + list(pi.HIGH_RISK_MCC)
+    calls = []
+    for _ in range(count):
+        calls.append((
+            rng.choice(bins), rng.choice(codes), rng.choice(mccs),
+            round(rng.choice([0.5, 25.0, 120.0, 980.0, 7500.0]) * rng.random() + 0.5, 2),
+            rng.choice(["US", "GB", "BR", "NG", "DE"]), rng.choice(["credit", "debit", "prepaid"]),
+            rng.choice(["Visa", "Mastercard", "UnionPay"]),
+        ))
+    return calls
+
+
+def _clear_memo() -> None:
+    for cache in (pi._bin_lookup, pi._decline_lookup, pi._mcc_lookup, pi._fraud_lookup,
+                  pi._card_sections, pi._decline_sections, pi._merchant_section,
+                  pi._card_json, pi._decline_json, pi._merchant_json, pi._flags_json, pi._recommendation_json):
+        cache.cache_clear()
+
+
+def _csv_lines(calls: list) -> list:
+    return [",".join(pi.BATCH_FIELDS) + "\n"] + [",".join(map(str, call)) + "\n" for call in calls]
+
+
+def _feed(lines: list) -> int:
+    batch = pi.PaymentBatch()
+    batch.feed(lines, final=True)
+    return batch.count
+
+
+def _time(label: str, fn, calls: list, repeat: int, before=None) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        if before:
+            before()
+        started = time.perf_counter()
+        for call in calls:
+            fn(*call)
+        best = min(best, time.perf_counter() - started)
+    per_call = best / len(calls) * 1e6
+    print(f"  {label:<28} {per_call:8.2f} us/call  {len(calls) / best:>12,.0f} calls/s")
+    return per_call
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=100000)
+    parser.add_argument("--distinct", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=47)
+    args = parser.parse_args()
+
+    snapshot = load_bins()
+    calls = _calls(args.calls, args.distinct, args.seed)
+    mismatches = sum(1 for call in calls[:5000] if pi._analyze(*call) != _legacy_analyze(*call))
+    print(f"BIN table version {snapshot.version or '(none)'}, {snapshot.rows} rows")
+    print(f"{args.calls} calls over {args.distinct} BINs; {mismatches} mismatches against legacy")
+
+    codes = [call[1] for call in calls]
+    print("retry strategy")
+    _time("linear scan (legacy)", _legacy_retry_strategy, [(c,) for c in codes], args.repeat)
+    _time("precomputed dict", pi.get_retry_strategy, [(c,) for c in codes], args.repeat)
+    print("analysis")
+    legacy = _time("legacy", _legacy_analyze, calls, args.repeat)
+    _time("pipeline, cold memo", pi._analyze, calls, args.repeat, before=_clear_memo)
+    warm = _time("pipeline, warm memo", pi._analyze, calls, args.repeat)
+    print(f"  warm pipeline vs legacy: {legacy / warm:.1f}x")
+
+    lines = _csv_lines(calls)
+    batch = pi.PaymentBatch()
+    output = batch.feed(lines, final=True).splitlines()
+    mismatches += sum(1 for i, call in enumerate(calls[:5000])
+                      if output[i] != json.dumps({"index": i, **_legacy_analyze(*call)}))
+    print(f"batch (CSV, NDJSON out); {mismatches} mismatches against legacy")
+    for label, before in (("cold", _clear_memo), ("warm", None)):
+        best = float("inf")
+        for _ in range(args.repeat):
+            if before:
+                before()
+            started = time.perf_counter()
+            _feed(lines)
+            best = min(best, time.perf_counter() - started)
+        print(f"  {'PaymentBatch.feed, ' + label:<28} {best / len(calls) * 1e6:8.2f} us/row   {len(calls) / best:>12,.0f} rows/s")
+    return 0 if not mismatches else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""Recall / latency benchmark for the sanctions and PEP screening engine.
+
+Usage:
+    python -m benchmarks.screening_benchmark [--ofac-csv PATH] [--pep-csv PATH]
+                                             [--queries N] [--budget-ms MS]
+
+Without --ofac-csv the OpenSanctions OFAC SDN file is downloaded. Each list is
+indexed once, then N names sampled from it are perturbed (transliteration
+swaps, dropped letters, transpositions) and screened. A query counts as
+recalled when its source record is among the top 5 matches. Exits non-zero
+when any list's p99 latency is over budget.
+"""
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+import time
+
+import httpx
+
+from app.tools.name_matching import NameIndex
+from app.tools.sanctions_checker import OFAC_URL
+
+PEP_CSV = os.path.join(os.path.dirname(__file__), "..", "app", "data", "peps.csv")
+
+TRANSLITERATIONS = [
+    ("mohammed", "muhammad"), ("mohamed", "mohammad"), ("ou", "u"), ("ph", "f"),
+    ("ck", "k"), ("ei", "ey"), ("ss", "s"), ("kh", "h"), ("y", "i"), ("v", "w"),
+]
+
+
+def _read_names(reader) -> list:
+    rows = []
+    for row in csv.DictReader(reader):
+        name = (row.get("name") or "").strip()
+        if name:
+            rows.append((name, row.get("aliases") or ""))
+    return rows
+
+
+def _perturb(name: str, rng: random.Random) -> str:
+    out = name.lower()
+    for src, dst in rng.sample(TRANSLITERATIONS, len(TRANSLITERATIONS)):
+        if src in out:
+            return out.replace(src, dst, 1)
+    words = out.split()
+    longest = max(range(len(words)), key=lambda i: len(words[i]))
+    word = words[longest]
+    if len(word) >= 5:
+        i = rng.randrange(1, len(word) - 2)
+        if rng.random() < 0.5:
+            word = word[:i] + word[i + 1:]
+        else:
+            word = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    words[longest] = word
+    return " ".join(words)
+
+
+def _percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(label: str, rows: list, queries: int, threshold: int, budget_ms: float, seed: int) -> bool:
+    started = time.perf_counter()
+    index = NameIndex()
+    for name, aliases in rows:
+        index.add(name, aliases)
+    index.finalize()
+    build_s = time.perf_counter() - started
+
+    rng = random.Random(seed)
+    latencies = []
+    recalled = 0
+    for record_id in rng.sample(range(len(rows)), min(queries, len(rows))):
+        query = _perturb(rows[record_id][0], rng)
+        t0 = time.perf_counter()
+        _, top = index.top(query, threshold, 5)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        if any(rid == record_id for rid, _ in top):
+            recalled += 1
+
+    p50, p99 = _percentile(latencies, 50), _percentile(latencies, 99)
+    ok = p99 <= budget_ms
+    print(f"{label}: {len(rows)} records indexed in {build_s:.1f}s")
+    print(f"  recall@5  {recalled / len(latencies):.1%} over {len(latencies)} perturbed queries")
+    print(f"  latency   p50 {p50:.2f} ms  p99 {p99:.2f} ms  max {max(latencies):.2f} ms  "
+          f"(budget {budget_ms:.0f} ms: {'OK' if ok else 'OVER'})")
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ofac-csv", help="local copy of targets.simple.csv (default: download)")
+    parser.add_argument("--pep-csv", default=PEP_CSV)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--threshold", type=int, default=60)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("SCREENING_P99_BUDGET_MS", "50")))
+    parser.add_argument("--seed", type=int, default=8583)
+    args = parser.parse_args()
+
+    if args.ofac_csv:
+        with open(args.ofac_csv, encoding="utf-8", errors="replace") as f:
+            ofac_rows = _read_names(f)
+    else:
+        resp = httpx.get(OFAC_URL, timeout=120, follow_redirects=True)
+        resp.raise_for_status()
+        ofac_rows = _read_names(io.StringIO(resp.text))
+
+    ok = run("OFAC SDN", ofac_rows, args.queries, args.threshold, args.budget_ms, args.seed)
+    if os.path.exists(args.pep_csv):
+        with open(args.pep_csv, encoding="utf-8", errors="replace") as f:
+            pep_rows = _read_names(f)
+        ok = run("PEP", pep_rows, args.queries, args.threshold, args.budget_ms, args.seed) and ok
+    else:
+        print(f"PEP: {args.pep_csv} not found, skipped")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,34 @@
+import asyncio
+
+import httpx
+import pytest
+
+
+class _Client:
+    """Blocking calls into the ASGI app, one event loop per request."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        async def call():
+            transport = httpx.ASGITransport(app=self.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+                return await client.request(method, url, **kwargs)
+        return asyncio.run(call())
+
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("POST", url, **kwargs)
+
+
+@pytest.fixture
+def client():
+    """Client for the full app, skipped where it can't start (e.g. no Postgres)."""
+    try:
+        from app.main import app
+    except Exception as e:
+        pytest.skip(f"app.main unavailable: {type(e).__name__}: {e}")
+    return _Client(app)
@@ -0,0 +1,280 @@
+import asyncio
+import csv
+import os
+import random
+
+import pytest
+
+from app.tools import bin_lookup
+from app.tools.bin_lookup import BinIndex, get_bin_details, lookup_bins
+from app.tools.versioned_file import VersionedFile
+
+FIELDS = ("Bank", "Visa", "credit", "US", "United States", "No")
+
+
+def _fields(bank):
+    return (bank,) + FIELDS[1:]
+
+
+def _reference_finder(rows):
+    """Brute force: the narrowest kept range containing every key the digits can expand to."""
+    by_range = {}
+    for start, end, fields in rows:
+        by_range[(start, end)] = fields
+    kept = []
+    for start, end in sorted(by_range, key=lambda r: (r[0], -r[1])):
+        if any(s <= start <= e < end for s, e in kept):
+            continue
+        kept.append((start, end))
+
+    def find(digits):
+        q_start, q_end = bin_lookup._prefix_range(digits)
+        covering = [(e - s, s, e) for s, e in kept if s <= q_start and q_end <= e]
+        if not covering:
+            return None
+        _, start, end = min(covering)
+        return start, end, by_range[(start, end)]
+    return find
+
+
+def _found(index, digits):
+    entry = index.find(digits)
+    if entry == -1:
+        return None
+    return index.starts[entry], index.ends[entry], tuple(index.record(entry).values())
+
+
+def _row(bin_key=None, start=None, end=None, bank="Bank"):
+    row = {"bank": bank, "brand": "Visa", "type": "credit", "country_code": "US",
+           "country_name": "United States", "prepaid": "No"}
+    if bin_key is not None:
+        row["bin"] = bin_key
+    if start is not None:
+        row["bin_start"], row["bin_end"] = start, end
+    return row
+
+
+def _index(rows):
+    ranges = []
+    for row in rows:
+        bin_range = bin_lookup._row_range(row)
+        if bin_range:
+            ranges.append((bin_range[0], bin_range[1], bin_lookup._row_fields(row)))
+    return BinIndex(ranges)
+
+
+NESTED = [
+    _row(start="411110", end="411112", bank="Range"),
+    _row("411111", bank="Six"),
+    _row("41111111", bank="Eight"),
+    _row("41111122", bank="Eight B"),
+    _row("520000", bank="Other"),
+]
+
+
+@pytest.mark.parametrize("digits, bank", [
+    ("41111111", "Eight"),
+    ("41111122", "Eight B"),
+    ("41111112", "Six"),
+    ("411111", "Six"),
+    ("4111111", "Six"),
+    ("4111112", "Six"),
+    ("41111000", "Range"),
+    ("411112", "Range"),
+    ("41111299", "Range"),
+    ("411113", None),
+    ("411110", "Range"),
+    ("520000", "Other"),
+    ("52000099", "Other"),
+    ("520001", None),
+])
+def test_longest_prefix_wins(digits, bank):
+    index = _index(NESTED)
+    assert index.conflicts == 0
+    entry = index.find(digits)
+    assert (index.record(entry)["bank"] if entry != -1 else None) == bank
+
+
+def test_short_queries_match_only_enclosing_ranges():
+    index = _index(NESTED)
+    # A 5-digit prefix spans more than any loaded range.
+    assert index.find("41111") == -1
+    index = _index(NESTED + [_row(start="41", end="41", bank="Wide")])
+    assert index.record(index.find("41111"))["bank"] == "Wide"
+    assert index.record(index.find("41111111"))["bank"] == "Eight"
+
+
+def test_partial_overlap_keeps_first_range():
+    index = _index(NESTED + [_row(start="41111150", end="41111250", bank="Straddles")])
+    assert index.conflicts == 1
+    assert index.record(index.find("41111160"))["bank"] == "Six"
+    assert index.record(index.find("41111240"))["bank"] == "Range"
+
+
+def test_later_rows_replace_earlier_ones_for_the_same_range():
+    index = _index(NESTED + [_row("411111", bank="Six v2")])
+    assert index.record(index.find("41111112"))["bank"] == "Six v2"
+    assert len(index) == 5
+
+
+@pytest.mark.parametrize("seed", [31, 32, 33])
+def test_find_matches_brute_force(seed):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(400):
+        kind = rng.random()
+        base = rng.randrange(41000000, 41100000)
+        if kind < 0.4:
+            start, end = bin_lookup._prefix_range(str(base)[:6])
+        elif kind < 0.7:
+            start = end = base
+        else:
+            start = base
+            end = min(start + rng.choice([9, 99, 999, 9999, rng.randrange(1, 5000)]), 99999999)
+        rows.append((start, end, _fields(f"Bank {i}")))
+    index = BinIndex(rows)
+    reference = _reference_finder(rows)
+    assert index.conflicts > 0
+    for _ in range(3000):
+        digits = str(rng.randrange(41000000, 41100000))[:rng.choice([6, 7, 8])]
+        assert _found(index, digits) == reference(digits), digits
+
+
+@pytest.fixture
+def bin_csv(tmp_path, monkeypatch):
+    """Point the loader at a temp binlist.csv with the nested fixture rows."""
+    path = tmp_path / "binlist.csv"
+
+    def write(rows):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=["bin", "bin_start", "bin_end", "bank", "brand", "type",
+                                                   "country_code", "country_name", "prepaid"])
+            writer.writeheader()
+            writer.writerows(rows)
+
+    write(NESTED)
+    empty = bin_lookup.BinSnapshot(BinIndex([]), "", 0, "", 0.0, 0, 0)
+    monkeypatch.setattr(bin_lookup, "BIN_TABLE", VersionedFile("BIN table", str(path), bin_lookup._build_snapshot,
+                                                               empty, bin_lookup._reject_snapshot))
+    return write
+
+
+def test_details_echo_six_digits_and_report_matched_range(bin_csv):
+    result = get_bin_details("4111 1111 1111 1111")
+    assert result["status"] == "success"
+    assert result["bin"] == "411111"
+    assert result["bank"] == "Eight"
+    assert result["bin_range"] == {"start": "41111111", "end": "41111111"}
+    result = get_bin_details("411111")
+    assert (result["bin"], result["bank"]) == ("411111", "Six")
+    assert result["bin_range"] == {"start": "41111100", "end": "41111199"}
+
+
+def test_details_short_and_unknown_bins(bin_csv):
+    assert get_bin_details("4111-1")["status"] == "error"
+    assert get_bin_details("") == {"status": "error", "error": "BIN must contain at least 6 digits", "bin": ""}
+    assert get_bin_details("41111399") == {"status": "not_found", "bin": "411113",
+                                           "message": "BIN not found in database"}
+
+
+def test_lookup_bins_dedupes_on_all_digits(bin_csv):
+    results = list(lookup_bins(["41111111", "41111112", "4111-1111", "41111111"]))
+    assert [r["bank"] for r in results] == ["Eight", "Six"]
+    results = list(lookup_bins(["41111111", "41111112", "4111-1111"], unique=False))
+    assert [r["bank"] for r in results] == ["Eight", "Six", "Eight"]
+
+
+def _touch(path_str):
+    # Make sure the watcher sees a new mtime even on coarse-grained filesystems.
+    st = os.stat(path_str)
+    os.utime(path_str, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+
+def test_reload_swaps_snapshot_on_change(bin_csv):
+    old = bin_lookup.load_bins()
+    assert old.rows == len(NESTED)
+    bin_csv(NESTED + [_row("411113", bank="New")])
+    _touch(bin_lookup.BIN_TABLE.path)
+    assert bin_lookup.reload_bins()
+    new = bin_lookup.load_bins()
+    assert new.version != old.version
+    assert get_bin_details("411113")["bank"] == "New"
+    # A reader still holding the old snapshot keeps a consistent table.
+    assert old.index.find("411113") == -1
+
+
+def test_reload_is_a_no_op_when_file_is_unchanged(bin_csv, monkeypatch):
+    snapshot = bin_lookup.load_bins()
+
+    def fail(raw, digest, stat):
+        raise AssertionError("unchanged file was re-parsed")
+
+    monkeypatch.setattr(bin_lookup.BIN_TABLE, "_build", fail)
+    assert not bin_lookup.reload_bins()
+    # Same bytes under a new mtime: read, but the digest matches.
+    _touch(bin_lookup.BIN_TABLE.path)
+    assert not bin_lookup.reload_bins()
+    assert not bin_lookup.reload_bins(force=True)
+    assert bin_lookup.load_bins() is snapshot
+    assert bin_lookup.get_bin_status()["last_error"] is None
+
+
+@pytest.mark.parametrize("content", [
+    b"bin,bank\n",
+    b"bin,bank\nnot-a-bin,Bank\n",
+    b"bin,bank\n411111,\xff\xfe broken\n",
+])
+def test_reload_keeps_old_table_on_empty_or_broken_file(bin_csv, content):
+    snapshot = bin_lookup.load_bins()
+    with open(bin_lookup.BIN_TABLE.path, "wb") as f:
+        f.write(content)
+    _touch(bin_lookup.BIN_TABLE.path)
+    assert not bin_lookup.reload_bins()
+    assert bin_lookup.load_bins() is snapshot
+    assert get_bin_details("411111")["bank"] == "Six"
+    status = bin_lookup.get_bin_status()
+    assert status["status"] == "success"
+    assert status["last_error"]
+    # Reported once per file version, not re-parsed on every tick.
+    assert not bin_lookup.reload_bins()
+
+
+def test_reload_keeps_old_table_when_file_disappears(bin_csv):
+    snapshot = bin_lookup.load_bins()
+    os.remove(bin_lookup.BIN_TABLE.path)
+    assert not bin_lookup.reload_bins(force=True)
+    assert bin_lookup.load_bins() is snapshot
+    assert "No such file" in bin_lookup.get_bin_status()["last_error"]
+
+
+def test_watcher_picks_up_changes(bin_csv):
+    async def main():
+        watcher = asyncio.create_task(bin_lookup.watch_bins(interval=0.01))
+        try:
+            for _ in range(500):
+                if bin_lookup.bins_loaded():
+                    break
+                await asyncio.sleep(0.01)
+            version = bin_lookup.load_bins().version
+            bin_csv(NESTED + [_row("411113", bank="New")])
+            _touch(bin_lookup.BIN_TABLE.path)
+            for _ in range(500):
+                if bin_lookup.load_bins().version != version:
+                    return
+                await asyncio.sleep(0.01)
+            raise AssertionError("watcher did not reload binlist.csv")
+        finally:
+            watcher.cancel()
+
+    asyncio.run(main())
+    assert get_bin_details("411113")["bank"] == "New"
+
+
+def test_reload_endpoint(bin_csv, client, monkeypatch):
+    monkeypatch.setenv("API_KEYS", "test-key")
+    assert client.post("/v1/tools/bin/reload").status_code == 401
+    body = client.post("/v1/tools/bin/reload", headers={"X-API-Key": "test-key"}).json()
+    assert body["reloaded"] and body["rows_loaded"] == len(NESTED)
+    body = client.post("/v1/tools/bin/reload", headers={"X-API-Key": "test-key"}).json()
+    assert not body["reloaded"] and body["last_error"] is None
+    assert client.get("/v1/tools/bin/status").json()["version"] == body["version"]
@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.tools import cache
+from app.tools.cache import TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_entries_expire_after_ttl(clock):
+    c = TTLCache(maxsize=10, ttl=5)
+    c.set("a", 1)
+    clock[0] += 5
+    assert c.get("a") == 1
+    clock[0] += 0.001
+    assert c.get("a") is None
+    assert c.stats()["size"] == 0
+    assert (c.hits, c.misses) == (1, 1)
+
+
+def test_set_refreshes_expiry(clock):
+    c = TTLCache(maxsize=10, ttl=5)
+    c.set("a", 1)
+    clock[0] += 4
+    c.set("a", 2)
+    clock[0] += 4
+    assert c.get("a") == 2
+
+
+def test_evicts_least_recently_used(clock):
+    c = TTLCache(maxsize=3, ttl=60)
+    for key in "abc":
+        c.set(key, key)
+    assert c.get("a") == "a"
+    c.set("d", "d")
+    assert c.get("b") is None
+    c.set("c", "c2")
+    c.set("e", "e")
+    assert c.get("a") is None
+    assert [c.get(key) for key in "cde"] == ["c2", "d", "e"]
+    assert c.evictions == 2
+
+
+@pytest.mark.parametrize("maxsize", [0, -1])
+def test_non_positive_maxsize_disables_cache(maxsize):
+    c = TTLCache(maxsize=maxsize, ttl=60)
+    c.set("a", 1)
+    assert c.get("a") is None
+    assert c.stats()["size"] == 0
+    assert c.evictions == 0
+
+
+def test_clear_and_stats():
+    c = TTLCache(maxsize=10, ttl=60)
+    c.set("a", 1)
+    c.get("a")
+    c.get("b")
+    c.clear()
+    assert c.get("a") is None
+    stats = c.stats()
+    assert stats["size"] == 0
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 2, round(1 / 3, 4))
@@ -0,0 +1,242 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+from app.tools import circuit_breaker
+from app.tools.circuit_breaker import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, DeadlineMiddleware, UpstreamUnavailable, bounded_timeout,
+    deadline_scope, request_budget, time_left, wait_shared,
+)
+from app.tools.http_client import HTTP_CLIENT
+
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    # Pinned so the tests don't depend on the BREAKER_* environment.
+    for name, value in (("BREAKER_WINDOW", 20), ("BREAKER_MIN_CALLS", 5), ("BREAKER_FAILURE_RATE", 0.5),
+                        ("BREAKER_SLOW_CALL", 2.0), ("BREAKER_SLOW_RATE", 0.8), ("BREAKER_OPEN_SECONDS", 30.0),
+                        ("BREAKER_PROBES", 2), ("REQUEST_DEADLINE", 5.0)):
+        monkeypatch.setattr(circuit_breaker, name, value)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def _open_breaker(breaker):
+    for _ in range(5):
+        breaker.record(False, 0.1)
+    assert breaker.state == OPEN
+
+
+def test_opens_on_failure_rate(clock):
+    breaker = CircuitBreaker("upstream")
+    for _ in range(4):
+        breaker.record(False, 0.1)
+    # Too few calls to judge yet.
+    assert breaker.state == CLOSED
+    breaker.record(True, 0.1)
+    assert breaker.state == OPEN
+    assert breaker.trips == 1
+
+
+def test_stays_closed_below_failure_rate(clock):
+    breaker = CircuitBreaker("upstream")
+    for ok in (True, True, True, False, False):
+        breaker.record(ok, 0.1)
+    assert breaker.state == CLOSED
+    assert breaker.stats()["failure_rate"] == 0.4
+    breaker.record(False, 0.1)
+    assert breaker.state == OPEN
+
+
+def test_opens_on_slow_call_rate(clock):
+    breaker = CircuitBreaker("upstream")
+    for elapsed in (3.0, 3.0, 3.0, 0.1):
+        breaker.record(True, elapsed)
+    assert breaker.state == CLOSED
+    breaker.record(True, 2.5)
+    assert breaker.state == OPEN
+
+
+def test_untimed_calls_are_never_slow(clock):
+    breaker = CircuitBreaker("upstream")
+    for _ in range(10):
+        breaker.record(True)
+    assert breaker.state == CLOSED
+    assert breaker.stats()["slow_rate"] == 0.0
+
+
+def test_rejects_while_open_then_closes_after_probes(clock):
+    breaker = CircuitBreaker("upstream")
+    _open_breaker(breaker)
+    clock[0] += 29
+    with pytest.raises(UpstreamUnavailable, match="circuit open"):
+        breaker.before_call()
+    assert breaker.rejected == 1
+
+    clock[0] += 1
+    breaker.before_call()
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(UpstreamUnavailable, match="half-open"):
+        breaker.before_call()
+    breaker.record(True, 0.1)
+    assert breaker.state == HALF_OPEN
+    breaker.record(True, 0.1)
+    assert breaker.state == CLOSED
+    assert breaker.stats()["window_calls"] == 0
+    breaker.before_call()
+
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker("upstream")
+    _open_breaker(breaker)
+    clock[0] += 30
+    breaker.before_call()
+    breaker.record(True, 0.1)
+    breaker.before_call()
+    breaker.record(False, 0.1)
+    assert breaker.state == OPEN
+    assert breaker.trips == 2
+    with pytest.raises(UpstreamUnavailable):
+        breaker.before_call()
+
+
+def test_recovers_from_probes_that_never_report_back(clock):
+    breaker = CircuitBreaker("upstream")
+    _open_breaker(breaker)
+    clock[0] += 30
+    breaker.before_call()
+    breaker.before_call()
+    # Both probe callers were cancelled and never call record().
+    clock[0] += 29
+    with pytest.raises(UpstreamUnavailable):
+        breaker.before_call()
+    clock[0] += 1
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    breaker.record(True, 0.1)
+    breaker.before_call()
+    breaker.record(True, 0.1)
+    assert breaker.state == CLOSED
+
+
+@pytest.mark.parametrize("header, budget", [
+    (None, 5.0), ("", 5.0), ("1.5", 1.5), ("100", 5.0), ("-3", 0.0), ("soon", 5.0),
+])
+def test_request_budget_clamps_header(header, budget):
+    assert request_budget(header) == budget
+
+
+def test_bounded_timeout():
+    assert bounded_timeout(10) == 10
+    assert bounded_timeout(None) is None
+    with deadline_scope(1):
+        assert 0.9 < bounded_timeout(10) <= 1
+        assert bounded_timeout(0.5) == 0.5
+    with deadline_scope(0):
+        with pytest.raises(UpstreamUnavailable):
+            bounded_timeout(10)
+    with deadline_scope(1):
+        with deadline_scope(None):
+            assert time_left() is None
+
+
+def _asgi_call(scope):
+    seen = {}
+
+    async def app(scope, receive, send):
+        seen["left"] = time_left()
+
+    asyncio.run(DeadlineMiddleware(app)(scope, None, None))
+    return seen["left"]
+
+
+def test_middleware_sets_deadline_from_header():
+    assert 4.5 < _asgi_call({"type": "http", "headers": []}) <= 5
+    assert 0 < _asgi_call({"type": "http", "headers": [(b"x-request-timeout", b"0.5")]}) <= 0.5
+    assert 4.5 < _asgi_call({"type": "http", "headers": [(b"x-request-timeout", b"60")]}) <= 5
+    assert _asgi_call({"type": "lifespan"}) is None
+
+
+def test_wait_shared_gives_up_at_deadline_without_cancelling():
+    async def main():
+        shared = asyncio.ensure_future(asyncio.sleep(0.3, "done"))
+        with deadline_scope(0.05):
+            with pytest.raises(UpstreamUnavailable):
+                await wait_shared(shared)
+        assert not shared.cancelled()
+        assert await wait_shared(shared) == "done"
+
+    asyncio.run(main())
+
+
+class _Slow(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        self.server.requests += 1
+        time.sleep(1)
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def slow_upstream():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Slow)
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _run(coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            await HTTP_CLIENT.close()
+    return asyncio.run(main())
+
+
+def test_deadline_cuts_get_short(slow_upstream):
+    url = f"http://127.0.0.1:{slow_upstream.server_port}/slow"
+
+    async def call():
+        with deadline_scope(0.2):
+            await HTTP_CLIENT.get(url, timeout=10)
+
+    started = time.monotonic()
+    with pytest.raises(UpstreamUnavailable, match="deadline"):
+        _run(call())
+    assert time.monotonic() - started < 0.8
+    # Cut short by the caller, not failed by the upstream.
+    breaker = HTTP_CLIENT.breaker(url)
+    assert breaker.state == CLOSED
+    assert breaker.stats()["failure_rate"] == 0.0
+
+
+def test_expired_deadline_sends_nothing(slow_upstream):
+    url = f"http://127.0.0.1:{slow_upstream.server_port}/slow"
+
+    async def call():
+        with deadline_scope(0):
+            await HTTP_CLIENT.get(url)
+
+    with pytest.raises(UpstreamUnavailable):
+        _run(call())
+    assert slow_upstream.requests == 0
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from app.tools import enrichment
+from app.tools.enrichment import enrich_records, parse_enrich_batch
+
+
+def _broken(value):
+    raise RuntimeError("lookup exploded")
+
+
+def test_one_failing_tool_only_fails_its_field(monkeypatch):
+    monkeypatch.setitem(enrichment.ENRICH_TOOLS, "swift", _broken)
+    result = enrich_records([
+        {"id": "a", "mcc": "5411", "swift": "DEUTDEFF"},
+        {"id": "b", "mcc": "5411"},
+    ])
+    first, second = result["results"]
+    assert first["swift"] == {"status": "error", "error": "swift lookup failed"}
+    assert first["mcc"]["status"] == "success"
+    assert second["mcc"] is first["mcc"]
+    assert "swift" not in second
+
+
+def test_batch_bin_failure_falls_back_to_per_record_lookups(monkeypatch):
+    def broken_batch(bins, unique=True):
+        raise RuntimeError("snapshot unavailable")
+        yield
+
+    monkeypatch.setattr(enrichment, "lookup_bins", broken_batch)
+    monkeypatch.setitem(enrichment.ENRICH_TOOLS, "bin", lambda value: {"status": "success", "bin": value[:6]})
+    result = enrich_records([{"bin": "41111111"}, {"bin": 52000000}])
+    assert [r["bin"]["bin"] for r in result["results"]] == ["411111", "520000"]
+
+
+@pytest.mark.parametrize("value", [{"x": 1}, ["5411"], True, False])
+def test_non_scalar_values_are_rejected_per_field(value):
+    result = enrich_records([{"mcc": value, "decline_code": "05"}])["results"][0]
+    assert result["mcc"] == {"status": "error", "error": "mcc must be a string or number"}
+    assert result["decline_code"]["status"] == "success"
+
+
+def test_numbers_are_looked_up_like_strings():
+    result = enrich_records([{"mcc": 5411}, {"mcc": "5411"}])
+    assert result["results"][0]["mcc"]["mcc"] == "5411"
+    assert result["distinct_lookups"] == 1
+
+
+def test_parse_rejects_bad_bodies():
+    for body in (b"", b"{}", b'{"records": {}}', b"[1, 2]", b"[]"):
+        with pytest.raises(ValueError):
+            parse_enrich_batch(body)
+    assert parse_enrich_batch(b'{"records": [{"mcc": "5411"}]}') == [{"mcc": "5411"}]
+
+
+def test_enrich_endpoint(client, monkeypatch):
+    monkeypatch.setitem(enrichment.ENRICH_TOOLS, "swift", _broken)
+    resp = client.post("/v1/tools/enrich", content=json.dumps([
+        {"id": 1, "mcc": "5411", "swift": "DEUTDEFF", "iban": {"nested": True}},
+        {"id": 2, "decline_code": "05"},
+    ]))
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["count"] == 2
+    first, second = body["results"]
+    assert first["id"] == 1 and first["mcc"]["status"] == "success"
+    assert first["swift"]["error"] == "swift lookup failed"
+    assert first["iban"]["error"] == "iban must be a string or number"
+    assert second["decline_code"]["status"] == "success"
+
+
+def test_enrich_endpoint_rejects_bad_body(client):
+    resp = client.post("/v1/tools/enrich", content=b'{"records": "nope"}')
+    assert resp.status_code == 400
+    assert resp.json()["status"] == "error"
@@ -0,0 +1,136 @@
+import itertools
+import json
+
+import pytest
+
+from app.tools import fraud_score
+from app.tools.fraud_score import calculate_fraud_score, load_fraud_rules, parse_fraud_batch, score_profiles
+from app.tools.versioned_file import VersionedFile
+from benchmarks.fraud_score_benchmark import random_profiles
+
+
+@pytest.fixture(params=["numpy", "python"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        if fraud_score.np is None:
+            pytest.skip("numpy not installed")
+    else:
+        monkeypatch.setattr(fraud_score, "np", None)
+    return request.param
+
+
+def _assert_matches_scalar(profiles):
+    scores = score_profiles(*(list(column) for column in zip(*profiles)))
+    for profile, score, level in zip(profiles, scores.fraud_score, scores.risk_level):
+        expected = calculate_fraud_score(*profile)
+        assert (score, level) == (expected["fraud_score"], expected["risk_level"]), profile
+
+
+def test_every_table_combination_matches_scalar(backend):
+    rules = load_fraud_rules()
+    _assert_matches_scalar(list(itertools.product(
+        rules.card_type_risk, rules.network_risk, rules.country_risk, (False, True), (False, True),
+    )))
+
+
+@pytest.mark.parametrize("seed", [49, 50, 51])
+def test_random_profiles_match_scalar(backend, seed):
+    # Mixes table entries with unknown, empty, missing and wrongly-cased values.
+    _assert_matches_scalar(random_profiles(20000, seed))
+
+
+def test_parse_rejects_mismatched_columns():
+    with pytest.raises(ValueError, match="same length"):
+        parse_fraud_batch(b'{"card_type": ["credit"], "network": [], "country_code": ["US"]}')
+
+
+@pytest.fixture
+def rules_file(tmp_path, monkeypatch):
+    """A private copy of the shipped rules file, with the loader state reset."""
+    path = tmp_path / "fraud_rules.json"
+    with open(fraud_score.FRAUD_RULES_PATH, "rb") as f:
+        path.write_bytes(f.read())
+    monkeypatch.setattr(fraud_score, "FRAUD_RULES_FILE",
+                        VersionedFile("Fraud rules", str(path), fraud_score._build_rules, fraud_score._BUILTIN))
+    return path
+
+
+def _score(rules, profile, monkeypatch):
+    monkeypatch.setattr(fraud_score.FRAUD_RULES_FILE, "current", rules)
+    result = calculate_fraud_score(*profile)
+    result.pop("rules_version")
+    return result
+
+
+def test_builtin_rules_match_shipped_file(rules_file, monkeypatch):
+    shipped = load_fraud_rules()
+    assert shipped.version != "builtin"
+    for profile in random_profiles(5000, 7):
+        assert _score(shipped, profile, monkeypatch) == _score(fraud_score._BUILTIN, profile, monkeypatch)
+
+
+def test_missing_rules_file_falls_back_to_builtin(rules_file):
+    rules_file.unlink()
+    result = calculate_fraud_score("credit", "Visa", "US")
+    assert result["status"] == "success"
+    assert result["rules_version"] == "builtin"
+    status = fraud_score.get_fraud_rules_status()
+    assert status["source"] == "builtin"
+    assert status["last_error"]
+
+
+def test_reload_swaps_valid_rules_and_keeps_them_on_bad_input(rules_file):
+    load_fraud_rules()
+    spec = json.loads(rules_file.read_text())
+    spec["version"] = "test.2"
+    spec["country_risk"]["US"] = 90
+    rules_file.write_text(json.dumps(spec))
+    assert fraud_score.reload_fraud_rules(force=True)
+    assert calculate_fraud_score("credit", "Visa", "US")["rules_version"] == "test.2"
+    assert score_profiles(["credit"], ["Visa"], ["US"]).rules_version == "test.2"
+
+    spec["risk_bands"][1]["max_score"] = 5
+    rules_file.write_text(json.dumps(spec))
+    assert not fraud_score.reload_fraud_rules(force=True)
+    rules_file.write_text("{broken")
+    assert not fraud_score.reload_fraud_rules(force=True)
+    assert load_fraud_rules().version == "test.2"
+    assert "JSONDecodeError" in fraud_score.get_fraud_rules_status()["last_error"]
+
+
+def _batch_scores(body):
+    return fraud_score.score_fraud_batch(parse_fraud_batch(json.dumps(body).encode()))["fraud_score"]
+
+
+def test_string_flags_are_rejected_not_truth_tested():
+    profile = {"card_type": "credit", "network": "Visa", "country_code": "US"}
+    true_score, false_score = _batch_scores([dict(profile, is_commercial=True, is_anonymous=True),
+                                             dict(profile, is_commercial=False, is_anonymous=False)])
+    assert true_score != false_score
+    with pytest.raises(ValueError, match=r"Row 1: is_commercial must be true or false"):
+        parse_fraud_batch(json.dumps([profile, dict(profile, is_commercial="false", is_anonymous="false")]).encode())
+
+
+@pytest.mark.parametrize("flag", ["false", "true", "", {}, [], 2, -1, 0.5, 1.0])
+def test_non_boolean_flags_are_rejected(flag):
+    with pytest.raises(ValueError, match="Row 0: is_anonymous"):
+        parse_fraud_batch(json.dumps([{"is_anonymous": flag}]).encode())
+    with pytest.raises(ValueError, match="Row 1: is_anonymous"):
+        parse_fraud_batch(json.dumps({"card_type": ["credit", "debit"], "network": ["Visa", "Visa"],
+                                      "country_code": ["US", "US"], "is_anonymous": [False, flag]}).encode())
+
+
+def test_zero_one_and_null_flags_are_accepted():
+    profile = {"card_type": "credit", "network": "Visa", "country_code": "US"}
+    scores = _batch_scores([dict(profile, is_commercial=flag, is_anonymous=flag) for flag in (True, 1, False, 0, None)]
+                           + [profile])
+    assert scores[0] == scores[1]
+    assert scores[2:] == [scores[2]] * 4
+    assert scores[0] != scores[2]
+
+
+def test_batch_endpoint_names_bad_row(client):
+    resp = client.post("/v1/tools/fraud-score/batch",
+                       content=json.dumps([{"is_commercial": True}, {"is_commercial": "false"}]))
+    assert resp.status_code == 400
+    assert resp.json()["error"].startswith("Row 1: is_commercial")
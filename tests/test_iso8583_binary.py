@@ -0,0 +1,62 @@
+import asyncio
+import json
+
+import pytest
+
+from app.tools.iso8583_binary import ISO8583Error, encode_message, frame_messages, iter_frames, parse_message
+
+# Field 2 (PAN) is LLVAR, so an "ascii" message carries its length as two ASCII digits
+# right after the 16-character hex bitmap.
+PAN_MESSAGE = b"0100" + b"4000000000000000" + b"16" + b"4111111111111111"
+
+
+def test_round_trip():
+    fields = {2: "4111111111111111", 3: "000000", 4: "000000001000"}
+    parsed = parse_message(encode_message("0100", fields, "ascii"), "ascii")
+    assert parsed.fields_present == [2, 3, 4]
+    assert {number: parsed[number] for number in parsed} == fields
+
+
+def test_valid_pan_message():
+    assert parse_message(PAN_MESSAGE, "ascii")[2] == "4111111111111111"
+
+
+@pytest.mark.parametrize("bitmap", [
+    b"-000000000000001",
+    b"+000000000000001",
+    b" 000000000000001",
+    b"0x00000000000001",
+    b"0000_00000000001",
+    b"00000000000000g1",
+])
+def test_rejects_signed_or_malformed_hex_bitmap(bitmap):
+    with pytest.raises(ISO8583Error, match="Invalid bitmap"):
+        parse_message(b"0100" + bitmap, "ascii")
+
+
+@pytest.mark.parametrize("prefix", [b"-1", b"+5", b" 1", b"1 ", b"1_"])
+def test_rejects_non_digit_length_prefix(prefix):
+    with pytest.raises(ISO8583Error, match="Invalid length prefix for field 2"):
+        parse_message(b"0100" + b"4000000000000000" + prefix + b"4111111111111111", "ascii")
+
+
+@pytest.mark.parametrize("header", [b"-001", b"+010", b" 010", b"0_10"])
+def test_rejects_non_digit_ascii_frame_header(header):
+    async def frames():
+        async def chunks():
+            yield header + b"0100"
+        return [frame async for frame in iter_frames(chunks(), 4, "ascii")]
+
+    with pytest.raises(ISO8583Error, match="Invalid length header"):
+        asyncio.run(frames())
+
+
+def test_stream_endpoint(client):
+    messages = [encode_message("0100", {2: "4111111111111111", 4: f"{i:012d}"}, "ascii") for i in range(3)]
+    body = frame_messages(messages)
+    resp = client.post("/v1/tools/iso8583/stream?dialect=ascii", content=body)
+    assert resp.status_code == 200
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert len(lines) == 3
+    assert [line["index"] for line in lines] == [0, 1, 2]
+    assert all(line["fields"]["2"]["value"] == "4111111111111111" for line in lines)
@@ -0,0 +1,107 @@
+import random
+
+import pytest
+
+from app.tools.name_matching import CONTAINS_BONUS, NameIndex, normalize_name
+
+SYLLABLES = ["al", "ba", "mo", "ha", "med", "ri", "ka", "sun", "ov", "ter", "li", "na", "zar", "ek", "do", "vic"]
+# A few tokens shared by many records, so search() takes its pruned path.
+COMMON = ["al", "bin", "mohammed", "ivan", "trading", "company"]
+
+
+def _random_token(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4)))
+
+
+def _random_name(rng):
+    tokens = [_random_token(rng) for _ in range(rng.randint(1, 5))]
+    for _ in range(rng.randint(0, 2)):
+        tokens.insert(rng.randrange(len(tokens) + 1), rng.choice(COMMON))
+    return " ".join(tokens)
+
+
+def _perturb(name, rng):
+    tokens = name.split()
+    if rng.random() < 0.5:
+        i = rng.randrange(len(tokens))
+        word = tokens[i]
+        if len(word) > 4:
+            j = rng.randrange(1, len(word) - 1)
+            tokens[i] = word[:j] + word[j + 1:]
+    if len(tokens) > 1 and rng.random() < 0.3:
+        tokens.pop(rng.randrange(len(tokens)))
+    if rng.random() < 0.3:
+        tokens.append(rng.choice(COMMON + [_random_token(rng)]))
+    return " ".join(tokens)
+
+
+def _unpruned_search(index, query, threshold):
+    # Scores every variant in the index with the same soft F1 as search().
+    q_tokens = set(normalize_name(query).split())
+    if not q_tokens:
+        return {}
+    token_sims = [index._similar_tokens(token) for token in q_tokens]
+    scores = {}
+    for variant_id, tids in enumerate(index._variant_tokens):
+        overlap, exact = 0.0, 0
+        for sims in token_sims:
+            sim = max(sims.get(tid, 0.0) for tid in tids)
+            overlap += sim
+            exact += sim == 1.0
+        if not overlap:
+            continue
+        precision = overlap / len(q_tokens)
+        recall = min(1.0, overlap / len(tids))
+        f1 = 2 * precision * recall / (precision + recall)
+        score = min(100, int(f1 * 100) + (CONTAINS_BONUS if exact == len(q_tokens) else 0))
+        if score < threshold:
+            continue
+        record_id = index._variant_record[variant_id]
+        scores[record_id] = max(score, scores.get(record_id, -1))
+    return scores
+
+
+@pytest.mark.parametrize("seed", [26, 27, 28])
+def test_search_matches_unpruned_scan(seed):
+    rng = random.Random(seed)
+    index = NameIndex()
+    names = []
+    for _ in range(1000):
+        name = _random_name(rng)
+        aliases = ";".join(_random_name(rng) for _ in range(rng.randint(0, 2)))
+        index.add(name, aliases)
+        names.append(name)
+    index.finalize()
+    for _ in range(120):
+        query = _perturb(rng.choice(names), rng) if rng.random() < 0.8 else _random_name(rng)
+        threshold = rng.choice([40, 60, 75, 90])
+        assert dict(index.search(query, threshold)) == _unpruned_search(index, query, threshold), query
+
+
+def test_search_on_empty_query_or_index():
+    assert NameIndex().search("Ivan Petrov") == []
+    index = NameIndex()
+    index.add("Ivan Petrov")
+    assert index.search("  --  ") == []
+
+
+@pytest.mark.parametrize("query", [
+    "Muhammad Ali Husayn",
+    "Mohamed Ali Hussain",
+    "Mohammad Aly Hussein",
+    "Husayn Muhammad",
+])
+def test_transliterations_are_recalled(query):
+    index = NameIndex()
+    for name in ["Ivan Petrov", "Mohammed Ali Hussein", "Acme Trading Ltd", "Ali Hassan"]:
+        index.add(name)
+    total, top = index.top(query, threshold=60, k=1)
+    assert total >= 1
+    assert top[0][0] == 1, top
+
+
+def test_aliases_resolve_to_their_record():
+    index = NameIndex()
+    index.add("Ivan Petrov")
+    index.add("Acme Trading Ltd", "Acme Holdings;ATL Group")
+    assert dict(index.search("Acme Holdings")) == {1: 100}
@@ -0,0 +1,127 @@
+import asyncio
+import json
+
+import pytest
+
+from app.tools import payment_intelligence as pi
+from app.tools.payment_intelligence import PaymentBatch, stream_payment_batch
+
+CSV_BODY = (
+    "id,card_bin,decline_code,merchant_mcc,transaction_amount,country_code,card_type,network\r\n"
+    "a,411111,51,5411,100.00,US,credit,Visa\r\n"
+    "b,520000,05,7995,7500,GB,debit,Mastercard\r\n"
+    "\r\n"
+    "c,411111,51,5411,lots,US,credit,Visa\r\n"
+    "d,411111,14,5812,0.5,NG,prepaid,Visa\r\n"
+)
+
+
+def _expected(index, id_, card_bin, decline_code, mcc, amount, country, card_type, network):
+    result = {"index": index, "id": id_} if id_ is not None else {"index": index}
+    return json.dumps({**result, **pi._analyze(card_bin, decline_code, mcc, amount, country, card_type, network)})
+
+
+def _stream(body: bytes, chunk_size: int = 7) -> list:
+    async def chunks():
+        for i in range(0, len(body), chunk_size):
+            yield body[i:i + chunk_size]
+
+    async def main():
+        return "".join([text async for text in stream_payment_batch(chunks())])
+
+    return asyncio.run(main()).splitlines()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_csv_rows_match_single_analysis(chunk_size):
+    lines = _stream(CSV_BODY.encode(), chunk_size)
+    assert len(lines) == 4
+    assert lines[0] == _expected(0, "a", "411111", "51", "5411", 100.0, "US", "credit", "Visa")
+    assert lines[1] == _expected(1, "b", "520000", "05", "7995", 7500.0, "GB", "debit", "Mastercard")
+    assert json.loads(lines[2]) == {"index": 2, "id": "c", "status": "error",
+                                    "error": "could not convert string to float: 'lots'"}
+    assert lines[3] == _expected(3, "d", "411111", "14", "5812", 0.5, "NG", "prepaid", "Visa")
+
+
+def test_csv_missing_columns_take_defaults():
+    lines = _stream(b"\xef\xbb\xbftransaction_amount,decline_code\n12.5,51")
+    assert lines == [_expected(0, None, "", "51", "", 12.5, "US", "credit", "Visa")]
+
+
+def test_csv_header_without_amount_ends_stream():
+    lines = _stream(b"card_bin,decline_code\n411111,51\n")
+    assert json.loads(lines[-1]) == {"status": "error", "error": "CSV header must include transaction_amount",
+                                     "index": 0}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 4096])
+def test_quoted_newlines_stay_in_one_row(chunk_size):
+    body = b'id,transaction_amount,decline_code\n"multi\nline\r\nid",10,51\n"x ""y""",20,05\n'
+    lines = [json.loads(line) for line in _stream(body, chunk_size)]
+    assert [(r["index"], r["id"], r["status"]) for r in lines] == [
+        (0, "multi\nline\r\nid", "success"), (1, 'x "y"', "success"),
+    ]
+
+
+def test_ndjson_rows():
+    body = "\n".join([
+        json.dumps({"id": 7, "card_bin": "411111", "decline_code": "51", "merchant_mcc": "5411",
+                    "transaction_amount": 100}),
+        "",
+        "{not json",
+        "[1, 2]",
+        json.dumps({"transaction_amount": "nan"}),
+        json.dumps({"transaction_amount": 3}),
+    ]).encode()
+    lines = _stream(body)
+    assert lines[0] == _expected(0, 7, "411111", "51", "5411", 100.0, "US", "credit", "Visa")
+    errors = [json.loads(line) for line in lines[1:4]]
+    assert [e["index"] for e in errors] == [1, 2, 3]
+    assert errors[0]["error"].startswith("Invalid JSON")
+    assert errors[1]["error"] == "Expected a JSON object"
+    assert errors[2]["error"] == "transaction_amount must be a finite number"
+    assert lines[4] == _expected(4, None, "", "", "", 3.0, "US", "credit", "Visa")
+
+
+def test_row_limit_flushes_analysed_rows_then_reports_first_rejected_index(monkeypatch):
+    monkeypatch.setattr(pi, "PAYMENT_BATCH_MAX", 3)
+    body = "transaction_amount\n" + "".join(f"{i}\n" for i in range(1, 6))
+    lines = _stream(body.encode(), chunk_size=4096)
+    assert [json.loads(line)["status"] for line in lines[:3]] == ["success"] * 3
+    assert json.loads(lines[3]) == {"status": "error", "error": "At most 3 rows per file", "index": 3}
+    assert len(lines) == 4
+
+
+def test_csv_error_mid_chunk_keeps_earlier_rows():
+    huge = '"' + "x" * 200000 + '"'
+    body = f"id,transaction_amount\na,1\nb,2\n{huge},3\nc,4\n"
+    lines = _stream(body.encode(), chunk_size=1 << 20)
+    assert [json.loads(line).get("id") for line in lines[:2]] == ["a", "b"]
+    error = json.loads(lines[2])
+    assert error["status"] == "error" and "field limit" in error["error"]
+    assert error["index"] == 2
+    assert len(lines) == 3
+
+
+def test_unterminated_quote_is_bounded():
+    body = 'id,transaction_amount\na,1\n"open' + "\nmore" * 40000
+    lines = _stream(body.encode(), chunk_size=8192)
+    assert json.loads(lines[0])["id"] == "a"
+    assert "field limit" in json.loads(lines[-1])["error"]
+
+
+def test_feed_holds_incomplete_csv_record():
+    batch = PaymentBatch()
+    assert batch.feed(["transaction_amount,id\n", '1,"a\n']) == ""
+    out = batch.feed(['b"\n'], final=True)
+    assert json.loads(out)["id"] == "a\nb"
+
+
+def test_batch_endpoint(client):
+    resp = client.post("/v1/tools/payment-intelligence/batch", content=CSV_BODY.encode())
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    lines = resp.text.splitlines()
+    assert len(lines) == 4
+    assert json.loads(lines[0])["id"] == "a"
+    assert json.loads(lines[2])["status"] == "error"
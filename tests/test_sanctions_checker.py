@@ -0,0 +1,198 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.tools import sanctions_checker
+from app.tools.cache import TTLCache
+from app.tools.http_client import HTTP_CLIENT
+from app.tools.name_matching import NameIndex
+
+SDN_CSV = (
+    "id,schema,name,aliases,sanctions\n"
+    "1,Person,Ivan Petrov,Ivan Petroff,SDN\n"
+    '2,Organization,"Acme Trading, Ltd",,SDN\n'
+).encode()
+
+
+class _Upstream(BaseHTTPRequestHandler):
+    """OpenSanctions stand-in: serves `body` with ETag `etag`, or `status` if set."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        server = self.server
+        server.requests.append(dict(self.headers))
+        if server.status != 200:
+            self.send_response(server.status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.headers.get("If-None-Match") == server.etag:
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", server.etag)
+        self.send_header("Content-Length", str(len(server.body)))
+        self.end_headers()
+        self.wfile.write(server.body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Upstream)
+    server.status = 200
+    server.body = SDN_CSV
+    server.etag = '"v1"'
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(sanctions_checker, "OFAC_URL", f"http://127.0.0.1:{server.server_port}/targets.simple.csv")
+    monkeypatch.setattr(sanctions_checker, "_SDN_CACHE", ([], NameIndex()))
+    for name, value in (("_CACHE_DATE", ""), ("_LIST_VERSION", ""), ("_ETAG", ""), ("_LAST_MODIFIED", ""),
+                        ("_LOADING", None), ("_FAILED_AT", float("-inf"))):
+        monkeypatch.setattr(sanctions_checker, name, value)
+    monkeypatch.setattr(sanctions_checker, "_RESULT_CACHE", TTLCache(maxsize=100, ttl=60))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _run(coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            await HTTP_CLIENT.close()
+    return asyncio.run(main())
+
+
+def _screen(name="Ivan Petrov"):
+    return _run(sanctions_checker.check_sanctions(name))
+
+
+def _roll_over_day():
+    sanctions_checker._CACHE_DATE = "2000-01-01"
+
+
+def test_downloads_list_and_screens(upstream):
+    result = _screen()
+    assert result["status"] == "success"
+    assert result["matches"][0]["matched_name"] == "Ivan Petrov"
+    assert len(upstream.requests) == 1
+
+
+def test_concurrent_screens_share_one_download(upstream):
+    async def screens():
+        return await asyncio.gather(*(sanctions_checker.check_sanctions("Acme Trading") for _ in range(8)))
+
+    results = _run(screens())
+    assert all(r["hit"] for r in results)
+    assert len(upstream.requests) == 1
+
+
+def test_unchanged_list_is_revalidated(upstream):
+    _screen()
+    version = sanctions_checker._LIST_VERSION
+    _roll_over_day()
+    assert _screen()["hit"]
+    assert upstream.requests[-1].get("If-None-Match") == '"v1"'
+    assert sanctions_checker._CACHE_DATE != "2000-01-01"
+    assert sanctions_checker._LIST_VERSION == version
+
+
+def test_rollover_keeps_list_on_server_error_and_throttles_retries(upstream):
+    _screen()
+    _roll_over_day()
+    upstream.status = 503
+    assert _screen()["hit"]
+    assert _screen()["hit"]
+    assert len(upstream.requests) == 2
+
+
+def test_rollover_keeps_list_when_upstream_unreachable(upstream):
+    _screen()
+    _roll_over_day()
+    upstream.shutdown()
+    upstream.server_close()
+    assert _screen()["hit"]
+
+
+def test_rollover_keeps_list_when_breaker_open(upstream):
+    _screen()
+    _roll_over_day()
+    HTTP_CLIENT.breaker(sanctions_checker.OFAC_URL)._open()
+    assert _screen()["hit"]
+    assert len(upstream.requests) == 1
+
+
+def _serve_malformed(upstream):
+    # A field over the csv module's field size limit makes csv.reader raise.
+    upstream.body = SDN_CSV + b'3,Person,"' + b"x" * 200000 + b'",,SDN\n'
+    upstream.etag = '"v2"'
+
+
+def test_rollover_keeps_list_on_malformed_body_and_throttles_retries(upstream):
+    _screen()
+    _roll_over_day()
+    _serve_malformed(upstream)
+    assert _screen()["hit"]
+    assert _screen()["hit"]
+    assert len(upstream.requests) == 2
+    assert sanctions_checker._ETAG == '"v1"'
+    assert sanctions_checker._LOADING is None
+
+
+def test_rollover_keeps_list_when_build_fails(upstream, monkeypatch):
+    _screen()
+    _roll_over_day()
+
+    def broken_build(rows):
+        raise RuntimeError("index build failed")
+
+    monkeypatch.setattr(sanctions_checker, "_build_list", broken_build)
+    upstream.etag = '"v2"'
+    assert _screen()["hit"]
+    assert sanctions_checker._ETAG == '"v1"'
+
+
+def test_first_load_malformed_body_reports_unavailable(upstream):
+    _serve_malformed(upstream)
+    result = _screen()
+    assert result["status"] == "error"
+    assert "unavailable" in result["error"]
+
+
+def test_first_load_failure_reports_unavailable(upstream):
+    upstream.status = 500
+    result = _screen()
+    assert result["status"] == "error"
+    assert "unavailable" in result["error"]
+
+
+def test_result_cache_is_cleared_when_list_changes(upstream):
+    assert _screen("Acme Trading")["hit"]
+    assert _screen("Acme Trading")["hit"]
+    assert sanctions_checker._RESULT_CACHE.hits == 1
+    version = sanctions_checker._LIST_VERSION
+
+    upstream.body = SDN_CSV.replace(b"Acme Trading, Ltd", b"Zenith Shipping")
+    upstream.etag = '"v2"'
+    _roll_over_day()
+    assert not _screen("Acme Trading")["hit"]
+    assert sanctions_checker._LIST_VERSION != version
+    assert sanctions_checker._RESULT_CACHE.stats()["size"] == 1
+
+
+def test_result_cache_survives_unchanged_list(upstream):
+    _screen()
+    _roll_over_day()
+    upstream.etag = '"v1-reissued"'
+    _screen()
+    assert len(upstream.requests) == 2
+    assert sanctions_checker._RESULT_CACHE.hits == 1
@@ -0,0 +1,79 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.tools.screening_pool import ScreeningBusy, ScreeningPool
+
+
+def _blocked(gate: threading.Event) -> str:
+    gate.wait(5)
+    return "done"
+
+
+def _fail() -> None:
+    raise ValueError("bad screen")
+
+
+async def _wait_until(predicate) -> None:
+    for _ in range(500):
+        if predicate():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not reached")
+
+
+def test_rejects_once_workers_and_queue_are_full():
+    pool = ScreeningPool("thread", workers=2, queue_depth=3)
+    gate = threading.Event()
+
+    async def main():
+        jobs = [asyncio.create_task(pool.run(_blocked, gate)) for _ in range(5)]
+        await asyncio.sleep(0)
+        with pytest.raises(ScreeningBusy):
+            await pool.run(_blocked, gate)
+        assert pool.stats()["in_flight"] == 5
+        gate.set()
+        assert await asyncio.gather(*jobs) == ["done"] * 5
+        assert await pool.run(str, 1) == "1"
+
+    asyncio.run(main())
+    assert (pool.completed, pool.failed, pool.rejected) == (6, 0, 1)
+    assert pool.stats()["in_flight"] == 0
+
+
+def test_cancelled_callers_hold_their_slot_until_the_job_ends():
+    pool = ScreeningPool("thread", workers=1, queue_depth=1)
+    gate = threading.Event()
+
+    async def main():
+        jobs = [asyncio.create_task(pool.run(_blocked, gate)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        # Clients disconnect; the running screen keeps its worker busy.
+        for job in jobs:
+            job.cancel()
+        await asyncio.gather(*jobs, return_exceptions=True)
+        assert pool.stats()["in_flight"] == 1
+        job = asyncio.create_task(pool.run(_blocked, gate))
+        await asyncio.sleep(0)
+        with pytest.raises(ScreeningBusy):
+            await pool.run(_blocked, gate)
+        gate.set()
+        assert await job == "done"
+        await _wait_until(lambda: pool.stats()["in_flight"] == 0)
+
+    asyncio.run(main())
+    # The queued screen was cancelled before it started.
+    assert (pool.completed, pool.failed, pool.rejected) == (2, 1, 1)
+
+
+def test_failures_are_not_counted_as_completed():
+    pool = ScreeningPool("thread", workers=1, queue_depth=0)
+
+    async def main():
+        with pytest.raises(ValueError):
+            await pool.run(_fail)
+
+    asyncio.run(main())
+    assert (pool.completed, pool.failed) == (0, 1)
+    assert pool.stats()["in_flight"] == 0
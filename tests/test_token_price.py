@@ -0,0 +1,94 @@
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from app.tools import token_price
+from app.tools.http_client import HTTP_CLIENT
+from app.tools.token_price import PriceService
+from benchmarks import mock_coingecko
+
+
+@pytest.fixture
+def coingecko(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), mock_coingecko._Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(token_price, "COINGECKO_BASE", f"http://127.0.0.1:{server.server_port}/api/v3")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _run(coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            await HTTP_CLIENT.close()
+    return asyncio.run(main())
+
+
+def _price(coin_id, currency="usd"):
+    return mock_coingecko._price(coin_id, currency)
+
+
+def test_concurrent_lookups_share_one_upstream_call(coingecko):
+    service = PriceService()
+
+    async def lookups():
+        return await asyncio.gather(*(
+            service.get_many([(coin_id, currency)])
+            for coin_id in ("bitcoin", "ethereum", "solana") for currency in ("usd", "eur")
+        ))
+
+    results = _run(lookups())
+    assert service.upstream_calls == 1
+    for found in results:
+        (coin_id, currency), value = next(iter(found.items()))
+        assert value[0] == _price(coin_id, currency)
+    assert not service._flushes
+
+
+def test_cached_prices_and_unknown_ids_skip_upstream(coingecko):
+    service = PriceService()
+    keys = [("bitcoin", "usd"), ("unknown-coin", "usd")]
+
+    async def twice():
+        first = await service.get_many(keys)
+        second = await service.get_many(keys)
+        return first, second
+
+    first, second = _run(twice())
+    assert first == second
+    assert first[("unknown-coin", "usd")] == ()
+    assert service.upstream_calls == 1
+
+
+def test_large_batches_are_split(coingecko, monkeypatch):
+    monkeypatch.setattr(token_price, "TOKEN_PRICE_MAX_IDS", 2)
+    service = PriceService()
+    keys = [(f"coin-{i}", "usd") for i in range(5)]
+    found = _run(service.get_many(keys))
+    assert service.upstream_calls == 3
+    assert all(found[key][0] == _price(key[0]) for key in keys)
+
+
+def test_last_known_price_served_stale_when_upstream_fails(coingecko):
+    service = PriceService()
+    key = ("bitcoin", "usd")
+
+    async def lookups():
+        await service.get_many([key])
+        service.cache.clear()
+        coingecko.shutdown()
+        coingecko.server_close()
+        # Drop the pooled keep-alive connection, which the mock would still answer.
+        await HTTP_CLIENT.close()
+        stale = set()
+        found = await service.get_many([key], stale)
+        return found, stale
+
+    found, stale = _run(lookups())
+    assert found[key][0] == _price("bitcoin")
+    assert stale == {key}